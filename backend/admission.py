@@ -0,0 +1,199 @@
+"""Admission control: per-tier concurrency limits that shrink when Mongo slows down.
+
+Every API route belongs to a priority tier, declared with ``@priority(...)``
+(``normal`` when undeclared):
+
+* ``critical``: what bot users and the public site wait on (public
+  catalog, clicks, new applications, login)
+* ``normal``: admin CRUD and lists
+* ``low``: heavy reports (analytics, funnel, exports, summaries)
+* ``exempt``: never limited (health, metrics, the long-lived event stream)
+
+Each tier has a concurrency limit between ``min`` and ``max``. Once per
+``ADMISSION_INTERVAL`` the controller takes the mean latency of the Mongo
+commands requests issued since the previous tick (querylog's
+``mongo.unit_command_ms``; background jobs and change streams would make
+an idle API look slow) and adjusts
+every tier AIMD-style. Above ``ADMISSION_TARGET_MS`` times a tier's
+``tolerance`` its limit is multiplied by ``backoff``. Otherwise it grows by
+``step``. Low-priority work has the lowest tolerance and the steepest
+backoff, so it is squeezed first, and critical traffic only gives way when
+latency is far off target.
+
+A request over its tier's limit waits up to ``wait`` seconds in a queue of
+at most ``queue`` requests, then gets ``503`` with ``Retry-After``.
+Decisions are counted in ``admission.<tier>.admitted``, ``.queued`` and
+``.shed``. Limits, in-flight work and the latency signal are gauges.
+
+``ADMISSION_TIERS`` (JSON keyed by tier) overrides the defaults, and
+``ADMISSION_ENABLED=0`` turns the controller off.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+from starlette.routing import Match
+
+from metrics import registry
+
+ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+TARGET_MS = float(os.environ.get('ADMISSION_TARGET_MS', 50))
+INTERVAL = float(os.environ.get('ADMISSION_INTERVAL', 1.0))
+RETRY_AFTER = float(os.environ.get('ADMISSION_RETRY_AFTER', 2))
+
+CRITICAL, NORMAL, LOW, EXEMPT = "critical", "normal", "low", "exempt"
+
+DEFAULT_TIERS = {
+    CRITICAL: {"max": 200, "min": 20, "step": 10, "backoff": 0.9, "tolerance": 4, "queue": 200, "wait": 2.0},
+    NORMAL: {"max": 100, "min": 4, "step": 5, "backoff": 0.7, "tolerance": 2, "queue": 50, "wait": 1.0},
+    LOW: {"max": 20, "min": 1, "step": 1, "backoff": 0.5, "tolerance": 1, "queue": 5, "wait": 0.2},
+}
+
+def load_tiers() -> dict:
+    tiers = {name: dict(tier) for name, tier in DEFAULT_TIERS.items()}
+    for name, override in json.loads(os.environ.get('ADMISSION_TIERS', '{}')).items():
+        tiers[name].update(override)
+    return tiers
+
+def priority(tier: str):
+    """Declare a route's admission tier; read by the API middleware"""
+    def decorate(endpoint):
+        endpoint.priority = tier
+        return endpoint
+    return decorate
+
+def route_tier(app, scope) -> str:
+    """Tier of the route a request will be dispatched to"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(getattr(route, "endpoint", None), "priority", NORMAL)
+    return NORMAL
+
+class Tier:
+    def __init__(self, name: str, settings: dict):
+        self.name = name
+        self.settings = settings
+        self.limit = float(settings["max"])
+        self.in_flight = 0
+        self.waiters = deque()
+
+    def publish(self):
+        registry.set(f"admission.{self.name}.limit", int(self.limit))
+        registry.set(f"admission.{self.name}.in_flight", self.in_flight)
+        registry.set(f"admission.{self.name}.queued_now", len(self.waiters))
+
+    def adjust(self, latency_ms):
+        settings = self.settings
+        if latency_ms is not None and latency_ms > TARGET_MS * settings["tolerance"]:
+            self.limit = max(settings["min"], self.limit * settings["backoff"])
+        else:
+            self.limit = min(settings["max"], self.limit + settings["step"])
+        # A raised limit frees slots for whoever is queued
+        while self.in_flight < int(self.limit) and self.hand_over():
+            pass
+
+    def hand_over(self) -> bool:
+        """Give a free slot to the oldest live waiter"""
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(True)
+                return True
+        return False
+
+class AdmissionController:
+    def __init__(self, tiers: dict = None, clock=time.monotonic):
+        self.tiers = {name: Tier(name, settings) for name, settings in (tiers or load_tiers()).items()}
+        self.clock = clock
+        self.last_tick = clock()
+        self.latency_ms = None
+        self._mongo_seen = (0, 0.0)
+
+    def _mongo_latency(self):
+        """Mean time of request Mongo commands since the previous tick, or None without any"""
+        histogram = registry.histograms.get("mongo.unit_command_ms")
+        if histogram is None:
+            return None
+        count, total = histogram.count, histogram.total
+        seen_count, seen_total = self._mongo_seen
+        self._mongo_seen = (count, total)
+        if count <= seen_count:
+            return None
+        return (total - seen_total) / (count - seen_count)
+
+    def tick(self, latency_ms=None):
+        """Adjust limits; runs on the first request after each interval"""
+        self.latency_ms = self._mongo_latency() if latency_ms is None else latency_ms
+        for tier in self.tiers.values():
+            tier.adjust(self.latency_ms)
+            tier.publish()
+        registry.set("admission.mongo_ms", round(self.latency_ms, 2) if self.latency_ms is not None else None)
+
+    def _maybe_tick(self):
+        now = self.clock()
+        if now - self.last_tick >= INTERVAL:
+            self.last_tick = now
+            self.tick()
+
+    async def acquire(self, name: str) -> bool:
+        """Take a slot in ``name``'s tier, waiting if allowed; False means shed"""
+        tier = self.tiers.get(name)
+        if tier is None or not ENABLED:
+            return True
+        self._maybe_tick()
+        if tier.in_flight < int(tier.limit) and not tier.waiters:
+            tier.in_flight += 1
+            registry.inc(f"admission.{name}.admitted")
+            return True
+        if len(tier.waiters) >= tier.settings["queue"] or tier.settings["wait"] <= 0:
+            registry.inc(f"admission.{name}.shed")
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        tier.waiters.append(waiter)
+        registry.inc(f"admission.{name}.queued")
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), tier.settings["wait"])
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # Handed a slot just as the wait ran out; keep it
+                pass
+            else:
+                waiter.cancel()
+                tier.waiters.remove(waiter)
+                registry.inc(f"admission.{name}.shed")
+                return False
+        except asyncio.CancelledError:
+            # Client went away while queued; give back a slot it may have been handed
+            if waiter.done() and not waiter.cancelled():
+                self.release(name)
+            else:
+                waiter.cancel()
+                if waiter in tier.waiters:
+                    tier.waiters.remove(waiter)
+            raise
+        registry.observe(f"admission.{name}.queue_ms", (time.perf_counter() - started) * 1000)
+        registry.inc(f"admission.{name}.admitted")
+        return True
+
+    def release(self, name: str):
+        tier = self.tiers.get(name)
+        if tier is None or not ENABLED:
+            return
+        tier.in_flight -= 1
+        if tier.in_flight < int(tier.limit):
+            tier.hand_over()
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": ENABLED,
+            "target_ms": TARGET_MS,
+            "mongo_ms": self.latency_ms,
+            "tiers": {name: {"limit": int(tier.limit), "in_flight": tier.in_flight, "queued": len(tier.waiters)}
+                      for name, tier in self.tiers.items()},
+        }
@@ -0,0 +1,86 @@
+"""Micro-benchmark: callback routing cost, regex handler chain vs. table router.
+
+The old registration was one ``CallbackQueryHandler`` per pattern, tried in
+order by python-telegram-bot until one matched, with the handler then
+re-parsing ``query.data``. This times that chain (``check_update`` on each
+handler plus the ``str.replace``) against ``CallbackRouter.resolve`` on a
+mix of payloads the bot actually sends. Handlers themselves are not run.
+
+Usage::
+
+    python bench_callback_dispatch.py [--iterations 200000]
+"""
+import argparse
+import time
+
+from telegram import CallbackQuery, Update, User
+from telegram.ext import CallbackQueryHandler
+
+from callbacks import CallbackRouter
+from catalog import encode_callback, CATALOG_PAGE, MFO_DETAIL, APPLY_PAGE, APPLY_MFO
+
+async def _noop(update, context, *args):
+    pass
+
+LEGACY_PATTERNS = ["^catalog$", "^mfo_", "^calculator$", "^apply$", "^apply_",
+                   "^compare$", "^about$", "^back_main$"]
+
+def legacy_chain():
+    return [CallbackQueryHandler(_noop, pattern=pattern) for pattern in LEGACY_PATTERNS]
+
+def table_router():
+    router = CallbackRouter()
+    for name in ["catalog", "calculator", "apply", "compare", "about", "back_main"]:
+        router.on(name, _noop)
+    for action in [CATALOG_PAGE, MFO_DETAIL, APPLY_PAGE, APPLY_MFO]:
+        router.on_action(action, _noop)
+    router.on_prefix("mfo", _noop)
+    router.on_prefix("apply", _noop)
+    return router
+
+def updates(payloads):
+    user = User(1, "bench", False)
+    return [
+        Update(i, callback_query=CallbackQuery(str(i), user, "bench", data=data))
+        for i, data in enumerate(payloads)
+    ]
+
+def time_chain(handlers, items, iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        update = items[i % len(items)]
+        for handler in handlers:
+            if handler.check_update(update):
+                data = update.callback_query.data
+                # What the old handlers did to recover their argument
+                data.replace("mfo_", "").replace("apply_", "")
+                break
+    return time.perf_counter() - started
+
+def time_router(router, items, iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        router.resolve(items[i % len(items)].callback_query.data)
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare callback dispatch overhead")
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    uuid = "2f1c1f8e-3c4b-4a61-9a51-0b8f5f7d9e21"
+    legacy = updates(["catalog", "back_main", "about", f"mfo_{uuid}", f"apply_{uuid}", "apply"])
+    compact = updates(["catalog", "back_main", "about",
+                       encode_callback(MFO_DETAIL, "1o16ceb", 12), encode_callback(APPLY_MFO, "1o16ceb", 12),
+                       encode_callback(CATALOG_PAGE, "1o16ceb", 2), encode_callback(APPLY_PAGE, "1o16ceb", 1)])
+
+    results = {
+        "regex chain, legacy payloads": time_chain(legacy_chain(), legacy, args.iterations),
+        "router, legacy payloads": time_router(table_router(), legacy, args.iterations),
+        "router, compact payloads": time_router(table_router(), compact, args.iterations),
+    }
+    for name, elapsed in results.items():
+        print(f"{name:32s} {elapsed / args.iterations * 1e6:7.2f} µs/callback")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Cold-start benchmark: process spawn to first successful API response.
+
+Starts ``uvicorn server:app`` repeatedly against the MongoDB configured in
+``.env`` and reports how long each run takes to answer ``GET /api/`` along
+with the per-phase startup timings from ``/api/health``.
+
+Usage::
+
+    python bench_startup.py [--runs 5] [--port 8765]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+
+def _get(url: str):
+    with urllib.request.urlopen(url, timeout=1) as response:
+        return json.loads(response.read())
+
+def measure(port: int, timeout: float = 30.0) -> dict:
+    """Spawn one server and time it until the root route answers"""
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR,
+        env=os.environ.copy(),
+    )
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError("server did not answer in time")
+            try:
+                _get(f"http://127.0.0.1:{port}/api/")
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        first_response_ms = (time.perf_counter() - started) * 1000
+        health = _get(f"http://127.0.0.1:{port}/api/health")
+        return {"first_response_ms": round(first_response_ms, 1), "startup": health.get("startup", {})}
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = [measure(args.port) for _ in range(args.runs)]
+    for i, result in enumerate(results, 1):
+        print(f"run {i}: {result['first_response_ms']} ms  {result['startup']}")
+    samples = [result["first_response_ms"] for result in results]
+    print(f"cold start to first response: median {statistics.median(samples):.1f} ms, "
+          f"min {min(samples):.1f} ms, max {max(samples):.1f} ms")
+
+if __name__ == "__main__":
+    main()
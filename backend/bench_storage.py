@@ -0,0 +1,144 @@
+"""Benchmark: the bot's hot paths on the MongoDB and SQLite storage backends.
+
+Each simulated user goes through what a typical session costs in storage
+calls: ``/start`` (save user, welcome content), opening the catalog (segment,
+active MFOs, ranking), opening an MFO card (MFO by id, click, view), then
+applying (apply started, submitted, application insert, segment update).
+Users run ``--concurrency`` at a time. The catalog is read uncached, as on a
+cold ``BOT_CATALOG_CACHE_TTL`` miss.
+
+MongoDB uses ``MONGO_URL`` (a scratch database that is dropped afterwards)
+and is skipped when unreachable; SQLite uses a temporary file.
+
+Usage::
+
+    python bench_storage.py [--users 500] [--concurrency 20] [--mfos 40] [--backend sqlite]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from metrics import Histogram
+from storage import MongoStore, SQLiteStore
+
+OPERATIONS = ["start", "catalog", "mfo_card", "apply"]
+
+def _mfos(count: int) -> list:
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [{
+        "id": f"mfo-{i}", "name": f"MFO {i}", "description": "Bench offer", "logo_url": "",
+        "website_url": "https://example.com", "min_amount": 1000, "max_amount": 30000 + i * 1000,
+        "min_term": 5, "max_term": 30, "interest_rate": 0.5 + i / 100, "approval_rate": 60 + i % 40,
+        "is_active": True, "created_at": created + timedelta(minutes=i),
+    } for i in range(count)]
+
+async def session(store, telegram_id: int, mfo_ids: list, timings: dict):
+    async def timed(name, coro):
+        started = time.perf_counter()
+        result = await coro
+        timings[name].observe((time.perf_counter() - started) * 1000)
+        return result
+
+    async def start():
+        await store.save_user(telegram_id, f"user{telegram_id}", "Bench")
+        await store.get_content("welcome_message")
+
+    async def catalog():
+        await store.user_segment(telegram_id)
+        await store.active_mfos()
+        await store.ranking_order("default")
+
+    mfo_id = mfo_ids[telegram_id % len(mfo_ids)]
+
+    async def mfo_card():
+        await store.get_mfo(mfo_id)
+        await store.record_click(mfo_id, telegram_id)
+        await store.record_view(mfo_id, telegram_id)
+
+    async def apply():
+        await store.record_apply_started(mfo_id, telegram_id)
+        await store.submit_application({
+            "id": str(uuid.uuid4()), "mfo_id": mfo_id, "mfo_name": "", "user_telegram_id": telegram_id,
+            "user_name": "Bench", "amount": 10000, "term": 14, "phone": "", "status": "pending",
+            "created_at": datetime.now(timezone.utc), "funnel_day": None,
+        })
+        await store.update_user_segment(telegram_id)
+
+    await timed("start", start())
+    await timed("catalog", catalog())
+    await timed("mfo_card", mfo_card())
+    await timed("apply", apply())
+
+async def run(store, users: int, concurrency: int, mfo_count: int) -> dict:
+    await store.ensure_indexes()
+    mfos = _mfos(mfo_count)
+    await store.upsert_mfos(mfos)
+    await store.set_ranking_order("default", [mfo["id"] for mfo in reversed(mfos)])
+    timings = {name: Histogram() for name in OPERATIONS}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(telegram_id):
+        async with semaphore:
+            await session(store, telegram_id, [mfo["id"] for mfo in mfos], timings)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(1000 + i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+    return {"sessions_per_second": round(users / elapsed, 1),
+            **{name: histogram.summary() for name, histogram in timings.items()}}
+
+async def bench_sqlite(args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteStore(os.path.join(directory, "bench.db"))
+        try:
+            return await run(store, args.users, args.concurrency, args.mfos)
+        finally:
+            store.close()
+
+async def bench_mongo(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo.errors import PyMongoError
+
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), tz_aware=True,
+                                serverSelectionTimeoutMS=1000)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError as e:
+        print(f"mongo: skipped ({e.__class__.__name__})")
+        return None
+    db = client[f"bench_storage_{uuid.uuid4().hex[:8]}"]
+    try:
+        return await run(MongoStore(db), args.users, args.concurrency, args.mfos)
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+def report(name: str, result: dict):
+    print(f"{name}: {result['sessions_per_second']} sessions/s")
+    for operation in OPERATIONS:
+        summary = result[operation]
+        print(f"  {operation:9s} p50 {summary['p50']:7.2f} ms  p95 {summary['p95']:7.2f} ms  max {summary['max']:7.2f} ms")
+
+async def _main(args):
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    if args.backend in ("all", "sqlite"):
+        report("sqlite", await bench_sqlite(args))
+    if args.backend in ("all", "mongo"):
+        result = await bench_mongo(args)
+        if result is not None:
+            report("mongo", result)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare bot storage backends")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mfos", type=int, default=40)
+    parser.add_argument("--backend", choices=["all", "sqlite", "mongo"], default="all")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,77 @@
+"""Benchmark: rendering bot texts with compiled templates.
+
+Compares, per message, the MFO card and the comparison list rendered
+through ``Templates`` (compiled, with Markdown escaping) against
+``str.format`` on the raw template plus escaping, and against the inline
+f-string the handlers used before (no escaping, Russian only).
+
+Usage::
+
+    python bench_templates.py [--iterations 100000]
+"""
+import argparse
+import asyncio
+import time
+
+from bot_messages import DEFAULT_MESSAGES
+from templates import Templates, escape_markdown
+
+MFO = {
+    "id": "mfo-1", "name": "Money_Fast", "description": "Займ за 15 минут, *без* отказов",
+    "min_amount": 1000, "max_amount": 30000, "min_term": 5, "max_term": 30,
+    "interest_rate": 0.8, "approval_rate": 92, "website_url": "https://example.com/money_fast",
+}
+
+class NoContent:
+    async def content_entries(self) -> list:
+        return []
+
+def f_string(mfo: dict) -> str:
+    return f"""🏦 *{mfo['name']}*
+
+📝 {mfo['description']}
+
+💰 *Сумма:* {mfo['min_amount']:,} - {mfo['max_amount']:,} ₽
+📅 *Срок:* {mfo['min_term']} - {mfo['max_term']} дней
+📈 *Ставка:* {mfo['interest_rate']}% в день
+✅ *Одобрение:* {mfo['approval_rate']}%
+
+🔗 {mfo['website_url']}"""
+
+def str_format(mfo: dict) -> str:
+    source = DEFAULT_MESSAGES["mfo_detail"]["text"]["ru"]
+    return source.format(**{key: escape_markdown(value) if isinstance(value, str) else value for key, value in mfo.items()})
+
+def timed(render, iterations: int) -> float:
+    """Microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        render()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+async def _main(args):
+    started = time.perf_counter()
+    templates = Templates(NoContent(), DEFAULT_MESSAGES)
+    compile_ms = (time.perf_counter() - started) * 1000
+    t = await templates.for_language("ru")
+    mfos = [{**MFO, "id": f"mfo-{i}"} for i in range(10)]
+
+    print(f"compile all {len(DEFAULT_MESSAGES)} keys: {compile_ms:.2f} ms")
+    print(f"mfo_detail  compiled   {timed(lambda: t('mfo_detail', **MFO), args.iterations):6.2f} µs")
+    print(f"mfo_detail  str.format {timed(lambda: str_format(MFO), args.iterations):6.2f} µs")
+    print(f"mfo_detail  f-string   {timed(lambda: f_string(MFO), args.iterations):6.2f} µs  (unescaped)")
+    compare = lambda: t("compare_title") + "".join(t("compare_item", position=i, **mfo) for i, mfo in enumerate(mfos, 1))
+    print(f"compare x10 compiled   {timed(compare, args.iterations // 10):6.2f} µs")
+    lookup = await timed_lookup(templates, args.iterations)
+    print(f"for_language (cached)  {lookup:6.2f} µs")
+
+async def timed_lookup(templates: Templates, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await templates.for_language("en-US")
+    return (time.perf_counter() - started) / iterations * 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure bot text render cost")
+    parser.add_argument("--iterations", type=int, default=100000)
+    asyncio.run(_main(parser.parse_args()))
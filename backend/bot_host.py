@@ -0,0 +1,161 @@
+"""Run several white-label bots in one process.
+
+Every bot in the tenants file gets its own ``Application`` (token, handlers,
+``user_data``), but all of them run in one event loop and share the Motor
+client of ``telegram_bot.py``, so one connection pool serves every bot. The
+MFO catalog and its ranking are shared too. Each tenant's users,
+applications, clicks, funnel counters and content live in the tenant's own
+database on that client (``<DB_NAME>_<name>`` unless ``db`` says otherwise),
+and the handlers find it through ``context.bot_data["tenant"]``. Tenants
+always store on MongoDB, whatever ``BOT_STORAGE`` says for the shared catalog.
+
+Tenants file (``BOT_TENANTS_CONFIG``, default ``tenants.json``)::
+
+    {
+      "api_url": "http://127.0.0.1:8081",
+      "tenants": [
+        {"name": "main", "token_env": "TELEGRAM_TOKEN", "db": "microloans"},
+        {"name": "brand2", "token": "123:abc"}
+      ]
+    }
+
+``api_url`` is optional and points every bot at another Bot API server,
+such as a local stand-in for tests. Per-tenant throughput and latency are
+recorded as ``bot.tenant.<name>.updates``, ``.ms``, ``.errors`` and
+``.updates_per_second``, and logged every ``METRICS_LOG_INTERVAL`` seconds.
+
+Usage::
+
+    python bot_host.py run [--config tenants.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import signal
+import time
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.environ.get('BOT_TENANTS_CONFIG', 'tenants.json')
+TENANT_NAME = re.compile(r"^[a-z0-9_-]+$")
+
+def load_config(path: str = CONFIG_PATH) -> dict:
+    with open(path) as f:
+        config = json.load(f)
+    names = set()
+    for tenant in config.get("tenants", []):
+        name = tenant.get("name", "")
+        if not TENANT_NAME.match(name):
+            raise ValueError(f"Invalid tenant name: {name!r}")
+        if name in names:
+            raise ValueError(f"Duplicate tenant: {name}")
+        names.add(name)
+        if not (tenant.get("token") or os.environ.get(tenant.get("token_env", ""))):
+            raise ValueError(f"No token for tenant {name}")
+    if not names:
+        raise ValueError("No tenants configured")
+    return config
+
+def build_application(tenant_config: dict, api_url: str = None):
+    """Application for one tenant, with its ``Tenant`` in ``bot_data``"""
+    from telegram.ext import Application
+    import telegram_bot
+    from storage import mongo_store
+
+    name = tenant_config["name"]
+    token = tenant_config.get("token") or os.environ[tenant_config["token_env"]]
+    db_name = tenant_config.get("db") or f"{os.environ['DB_NAME']}_{name}"
+    builder = Application.builder().token(token).application_class(telegram_bot.BotApplication)
+    if api_url:
+        builder = builder.base_url(f"{api_url.rstrip('/')}/bot").base_file_url(f"{api_url.rstrip('/')}/file/bot")
+    application = builder.build()
+    application.bot_data["tenant"] = telegram_bot.Tenant(name, mongo_store(telegram_bot.client[db_name]))
+    telegram_bot.register_handlers(application)
+    application.add_error_handler(count_error)
+    return application
+
+async def count_error(update, context):
+    import telegram_bot
+
+    # telegram_bot.handle_error logs the exception; this only counts it per tenant
+    registry.inc(f"bot.tenant.{telegram_bot.tenant_of(context).name}.errors")
+
+async def report_tenants(names: list, interval: float):
+    """Log per-tenant metrics and derive updates per second between reports"""
+    previous = {name: 0 for name in names}
+    last = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        counters = registry.snapshot("bot.tenant.")["counters"]
+        for name in names:
+            updates = counters.get(f"bot.tenant.{name}.updates", 0)
+            registry.set(f"bot.tenant.{name}.updates_per_second", round((updates - previous[name]) / (now - last), 3))
+            previous[name] = updates
+        last = now
+        logger.info(f"Tenants: {registry.snapshot('bot.tenant.')}")
+
+async def run(config: dict, stop: asyncio.Event = None, drop_pending_updates: bool = True):
+    """Poll every tenant's bot until ``stop`` is set"""
+    import telegram_bot
+    from storage import MongoStore
+
+    stop = stop or asyncio.Event()
+    applications = [build_application(tenant, config.get("api_url")) for tenant in config["tenants"]]
+    names = [application.bot_data["tenant"].name for application in applications]
+    await telegram_bot.ensure_tenant_indexes(telegram_bot.default_tenant)
+    for application in applications:
+        await telegram_bot.ensure_tenant_indexes(application.bot_data["tenant"])
+
+    started = []
+    tasks = []
+    try:
+        for application in applications:
+            await application.initialize()
+            # Shut down below even if starting or polling fails
+            started.append(application)
+            await application.start()
+            await application.updater.start_polling(drop_pending_updates=drop_pending_updates)
+        # Shared jobs run once for the whole process
+        if isinstance(telegram_bot.store, MongoStore):
+            tasks.append(asyncio.create_task(telegram_bot.maintenance_scheduler().run()))
+        tasks.append(asyncio.create_task(report_tenants(names, telegram_bot.METRICS_LOG_INTERVAL)))
+        logger.info(f"Bot host started: {', '.join(names)}")
+        await stop.wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for application in reversed(started):
+            if application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+        if started:
+            await telegram_bot.post_shutdown(started[0])
+
+async def _main(args):
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await run(load_config(args.config), stop)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Host several bots in one process")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="Poll every configured bot")
+    run_parser.add_argument("--config", default=CONFIG_PATH)
+    args = parser.parse_args()
+    asyncio.run(_main(args))
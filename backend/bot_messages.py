@@ -0,0 +1,130 @@
+"""Built-in texts of the bot, per language.
+
+A ``content`` entry with the same key (admin panel) overrides a text and may
+only use the placeholders of its built-in Russian version. ``markdown``
+texts are sent with ``parse_mode="Markdown"``, so their placeholder values
+are escaped (see templates.py).
+"""
+
+def _text(ru: str, en: str, markdown: bool = False) -> dict:
+    return {"markdown": markdown, "text": {"ru": ru, "en": en}}
+
+DEFAULT_MESSAGES = {
+    # Main menu
+    "welcome_message": _text(
+        "👋 Привет, {first_name}!\n\nЯ помогу вам найти лучшие предложения по микрозаймам.\n\nВыберите действие:",
+        "👋 Hi, {first_name}!\n\nI will help you find the best microloan offers.\n\nChoose an action:",
+    ),
+    "menu_prompt": _text("👋 {first_name}, выберите действие:", "👋 {first_name}, choose an action:"),
+    "menu_hint": _text("Используйте кнопки для навигации или команду /start", "Use the buttons or the /start command"),
+    "about_message": _text(
+        "ℹ️ *О сервисе*\n\nМы помогаем найти лучшие предложения по микрозаймам.\n\n"
+        "✅ Актуальная информация о МФО\n✅ Удобный калькулятор\n✅ Быстрое оформление заявки\n✅ Сравнение условий\n\n"
+        "Сервис бесплатный для пользователей.",
+        "ℹ️ *About*\n\nWe help you find the best microloan offers.\n\n"
+        "✅ Up-to-date lender information\n✅ Handy calculator\n✅ Quick applications\n✅ Side-by-side comparison\n\n"
+        "The service is free for users.",
+        markdown=True,
+    ),
+
+    # Buttons
+    "button_catalog": _text("📋 Каталог МФО", "📋 Lenders"),
+    "button_calculator": _text("🔢 Калькулятор займа", "🔢 Loan calculator"),
+    "button_apply": _text("📝 Подать заявку", "📝 Apply"),
+    "button_compare": _text("📊 Сравнить предложения", "📊 Compare offers"),
+    "button_about": _text("ℹ️ О сервисе", "ℹ️ About"),
+    "button_back": _text("🔙 Назад", "🔙 Back"),
+    "button_back_to_catalog": _text("🔙 К каталогу", "🔙 To the catalog"),
+    "button_main_menu": _text("🔙 Главное меню", "🔙 Main menu"),
+    "button_cancel": _text("❌ Отмена", "❌ Cancel"),
+    "button_previous_page": _text("◀️ Назад", "◀️ Previous"),
+    "button_next_page": _text("Вперёд ▶️", "Next ▶️"),
+    "button_new_calculation": _text("🔄 Новый расчет", "🔄 New calculation"),
+    "button_catalog_details": _text("📋 Подробнее в каталоге", "📋 Details in the catalog"),
+    "catalog_button": _text("🏦 {name} ({interest_rate}%)", "🏦 {name} ({interest_rate}%)"),
+    "apply_button": _text("🏦 {name}", "🏦 {name}"),
+
+    # Catalog and MFO card
+    "catalog_empty": _text("😔 В данный момент нет доступных МФО.\n\nПопробуйте позже.",
+                           "😔 No lenders are available right now.\n\nPlease try again later."),
+    "catalog_title": _text("📋 *Каталог МФО*\n\nВыберите организацию для подробной информации:\n",
+                           "📋 *Lenders*\n\nChoose a lender to see the details:\n", markdown=True),
+    "page_footer": _text("\nСтраница {page} из {pages}", "\nPage {page} of {pages}", markdown=True),
+    "catalog_updated": _text("Каталог обновился, выберите МФО ещё раз", "The catalog has changed, please choose again"),
+    "mfo_not_found": _text("МФО не найдено", "Lender not found"),
+    "mfo_detail": _text(
+        "🏦 *{name}*\n\n📝 {description}\n\n"
+        "💰 *Сумма:* {min_amount:,} - {max_amount:,} ₽\n📅 *Срок:* {min_term} - {max_term} дней\n"
+        "📈 *Ставка:* {interest_rate}% в день\n✅ *Одобрение:* {approval_rate}%\n\n🔗 {website_url}",
+        "🏦 *{name}*\n\n📝 {description}\n\n"
+        "💰 *Amount:* {min_amount:,} - {max_amount:,} ₽\n📅 *Term:* {min_term} - {max_term} days\n"
+        "📈 *Rate:* {interest_rate}% per day\n✅ *Approval:* {approval_rate}%\n\n🔗 {website_url}",
+        markdown=True,
+    ),
+
+    # Comparison
+    "compare_empty": _text("😔 Нет МФО для сравнения.", "😔 No lenders to compare."),
+    "compare_title": _text("📊 *Сравнение предложений*\n\nЛучшие предложения для вас:\n\n",
+                           "📊 *Compare offers*\n\nThe best offers for you:\n\n", markdown=True),
+    "compare_item": _text(
+        "*{position}. {name}*\n   💰 {min_amount:,}-{max_amount:,} ₽\n   📈 {interest_rate}% | ✅ {approval_rate}%\n\n",
+        "*{position}. {name}*\n   💰 {min_amount:,}-{max_amount:,} ₽\n   📈 {interest_rate}% | ✅ {approval_rate}%\n\n",
+        markdown=True,
+    ),
+
+    # Calculator
+    "calculator_prompt": _text("🔢 *Калькулятор займа*\n\nВведите сумму займа (от 1000 до 100000 ₽):",
+                               "🔢 *Loan calculator*\n\nEnter the loan amount (1000 to 100000 ₽):", markdown=True),
+    "calc_amount_range": _text("❌ Введите сумму от 1000 до 100000 ₽", "❌ Enter an amount from 1000 to 100000 ₽"),
+    "calc_amount_invalid": _text("❌ Введите корректную сумму числом", "❌ Enter the amount as a number"),
+    "calc_term_prompt": _text("💰 Сумма: {amount:,} ₽\n\nТеперь введите срок займа (от 1 до 30 дней):",
+                              "💰 Amount: {amount:,} ₽\n\nNow enter the loan term (1 to 30 days):"),
+    "calc_term_range": _text("❌ Введите срок от 1 до 30 дней", "❌ Enter a term from 1 to 30 days"),
+    "calc_term_invalid": _text("❌ Введите корректный срок числом", "❌ Enter the term as a number"),
+    "calc_result": _text("📊 *Результаты расчета*\n\n💰 Сумма: {amount:,} ₽\n📅 Срок: {term} дней\n\n",
+                         "📊 *Calculation*\n\n💰 Amount: {amount:,} ₽\n📅 Term: {term} days\n\n", markdown=True),
+    "calc_offers_title": _text("*Предложения МФО:*\n\n", "*Offers:*\n\n", markdown=True),
+    "calc_offer": _text("🏦 *{name}*\n   Переплата: {interest:,.0f} ₽\n   Вернуть: {total:,.0f} ₽\n\n",
+                        "🏦 *{name}*\n   Interest: {interest:,.0f} ₽\n   To repay: {total:,.0f} ₽\n\n", markdown=True),
+
+    # Application
+    "apply_empty": _text("😔 В данный момент нет доступных МФО для подачи заявки.",
+                         "😔 No lenders accept applications right now."),
+    "apply_title": _text("📝 *Подать заявку*\n\nВыберите МФО для подачи заявки:",
+                         "📝 *Apply*\n\nChoose a lender to apply to:", markdown=True),
+    "apply_amount_prompt": _text(
+        "📝 *Заявка в {name}*\n\nВведите желаемую сумму займа ({min_amount:,} - {max_amount:,} ₽):",
+        "📝 *Application to {name}*\n\nEnter the amount you need ({min_amount:,} - {max_amount:,} ₽):",
+        markdown=True,
+    ),
+    "apply_amount_invalid": _text("❌ Введите корректную сумму", "❌ Enter a valid amount"),
+    "apply_term_prompt": _text("💰 Сумма: {amount:,} ₽\n\nВведите желаемый срок займа (дней):",
+                               "💰 Amount: {amount:,} ₽\n\nEnter the loan term (days):"),
+    "apply_term_invalid": _text("❌ Введите корректный срок", "❌ Enter a valid term"),
+    "apply_phone_prompt": _text("📱 Введите ваш номер телефона для связи:", "📱 Enter your phone number:"),
+    "apply_success": _text(
+        "✅ *Заявка успешно отправлена!*\n\n🏦 МФО: {mfo_name}\n💰 Сумма: {amount:,} ₽\n📅 Срок: {term} дней\n"
+        "📱 Телефон: {phone}\n\nС вами свяжутся в ближайшее время.",
+        "✅ *Application sent!*\n\n🏦 Lender: {mfo_name}\n💰 Amount: {amount:,} ₽\n📅 Term: {term} days\n"
+        "📱 Phone: {phone}\n\nWe will contact you shortly.",
+        markdown=True,
+    ),
+
+    # Status notifications (sent by the API's outbox worker, plain text)
+    "status_approved": _text(
+        "✅ Ваша заявка в {mfo_name} на {amount:,} ₽ одобрена!\n\nС вами свяжутся в ближайшее время.",
+        "✅ Your application to {mfo_name} for {amount:,} ₽ has been approved!\n\nWe will contact you shortly.",
+    ),
+    "status_rejected": _text(
+        "❌ К сожалению, ваша заявка в {mfo_name} на {amount:,} ₽ отклонена.\n\n"
+        "Попробуйте подать заявку в другую МФО: /start",
+        "❌ Unfortunately, your application to {mfo_name} for {amount:,} ₽ has been declined.\n\n"
+        "Try applying to another lender: /start",
+    ),
+
+    "slow_down": _text("⏳ Слишком много сообщений. Подождите немного и попробуйте снова.",
+                       "⏳ Too many messages. Please wait a moment and try again."),
+
+    "store_unavailable": _text("⚠️ Сервис временно недоступен. Попробуйте через минуту.",
+                               "⚠️ The service is temporarily unavailable. Please try again in a minute."),
+}
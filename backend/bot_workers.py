@@ -0,0 +1,318 @@
+"""Multi-worker bot mode: one elected poller, N queue workers.
+
+``telegram_bot.py`` runs a single ``run_polling`` loop, and a second copy
+would fight it for ``getUpdates``. In this mode every process may run a
+poller and any number of workers:
+
+* The poller only fetches updates while it holds the ``poller`` lease in
+  ``bot_leases``. The lease is renewed on every poll, and the update offset
+  lives in the lease document, so a standby poller takes over where the
+  previous one stopped once the lease expires. Updates are inserted into
+  ``bot_updates`` keyed by ``update_id``, which makes re-polling idempotent.
+* The queue is split into ``BOT_QUEUE_PARTITIONS`` partitions by chat id.
+  Workers heartbeat in ``bot_workers``, lease a fair share of partitions and
+  process each partition's updates in ``update_id`` order, deleting an update
+  only after its handlers ran (at-least-once). Leases are renewed between
+  updates, and a worker that lost one stops draining that partition. A dead
+  worker's partitions are picked up by the others when its leases expire.
+
+Conversation state in ``context.user_data`` stays in the worker's memory;
+partition leases keep a chat on one worker, so it is only lost on failover.
+
+Usage::
+
+    python bot_workers.py run [--workers 4] [--no-poller]
+    python bot_workers.py lag
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS = int(os.environ.get('BOT_QUEUE_PARTITIONS', 16))
+LEASE_TTL = float(os.environ.get('BOT_LEASE_TTL', 30))
+POLL_TIMEOUT = int(os.environ.get('BOT_POLL_TIMEOUT', 10))
+BATCH_SIZE = int(os.environ.get('BOT_QUEUE_BATCH', 50))
+MAX_ATTEMPTS = int(os.environ.get('BOT_QUEUE_MAX_ATTEMPTS', 5))
+IDLE_SLEEP = 0.2
+LAG_REPORT_INTERVAL = 30
+
+# ==================== LEASES ====================
+
+async def acquire_lease(db, name: str, owner: str, ttl: float = LEASE_TTL):
+    """Take or renew a lease; returns the lease document or None if held elsewhere"""
+    now = datetime.now(timezone.utc)
+    try:
+        return await db.bot_leases.find_one_and_update(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # The lease exists and belongs to someone else
+        return None
+
+async def release_lease(db, name: str, owner: str):
+    await db.bot_leases.update_one(
+        {"_id": name, "owner": owner},
+        {"$set": {"expires_at": datetime.now(timezone.utc)}}
+    )
+
+async def ensure_queue_indexes(db):
+    await db.bot_updates.create_index([("partition", 1), ("_id", 1)])
+    await db.bot_workers.create_index("seen_at", expireAfterSeconds=int(LEASE_TTL * 4))
+
+# ==================== POLLER ====================
+
+def partition_for(update) -> int:
+    chat = update.effective_chat or update.effective_user
+    return (chat.id if chat else 0) % PARTITIONS
+
+async def enqueue_updates(db, updates) -> int:
+    """Insert polled updates into the work queue, ignoring ones already queued"""
+    if not updates:
+        return 0
+    now = datetime.now(timezone.utc)
+    docs = [{
+        "_id": update.update_id,
+        "partition": partition_for(update),
+        "payload": update.to_dict(),
+        "attempts": 0,
+        "created_at": now
+    } for update in updates]
+    try:
+        result = await db.bot_updates.insert_many(docs, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        return e.details.get("nInserted", 0)
+
+async def run_poller(db, bot, owner: str, stop: asyncio.Event):
+    """Fetch updates into the queue while holding the poller lease"""
+    while not stop.is_set():
+        lease = await acquire_lease(db, "poller", owner)
+        if not lease:
+            await asyncio.sleep(LEASE_TTL / 3)
+            continue
+        try:
+            updates = await bot.get_updates(
+                offset=lease.get("offset"),
+                timeout=POLL_TIMEOUT,
+                read_timeout=POLL_TIMEOUT + 5,
+                allowed_updates=["message", "callback_query"]
+            )
+        except Exception as e:
+            logger.warning(f"getUpdates failed: {e}")
+            await asyncio.sleep(1)
+            continue
+        if updates:
+            queued = await enqueue_updates(db, updates)
+            # Only move the offset while we still own the lease
+            await db.bot_leases.update_one(
+                {"_id": "poller", "owner": owner},
+                {"$set": {"offset": updates[-1].update_id + 1}}
+            )
+            logger.debug(f"Queued {queued}/{len(updates)} updates")
+    await release_lease(db, "poller", owner)
+
+# ==================== WORKERS ====================
+
+class QueueWorker:
+    """Owns a fair share of partitions and feeds their updates to an Application"""
+
+    def __init__(self, db, application, worker_id: str = None):
+        self.db = db
+        self.application = application
+        self.worker_id = worker_id or f"{os.uname().nodename}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.partitions = set()
+        # Partition -> monotonic time its lease was last renewed
+        self.renewed = {}
+        self.processed = 0
+
+    async def _heartbeat(self) -> int:
+        now = datetime.now(timezone.utc)
+        await self.db.bot_workers.update_one(
+            {"_id": self.worker_id}, {"$set": {"seen_at": now}}, upsert=True
+        )
+        alive = await self.db.bot_workers.count_documents(
+            {"seen_at": {"$gte": now - timedelta(seconds=LEASE_TTL)}}
+        )
+        return max(alive, 1)
+
+    async def rebalance(self):
+        """Renew owned partitions, pick up free ones up to the fair share, shed extras"""
+        share = math.ceil(PARTITIONS / await self._heartbeat())
+        owned = set()
+        for partition in sorted(self.partitions):
+            if len(owned) < share and await acquire_lease(self.db, f"partition:{partition}", self.worker_id):
+                owned.add(partition)
+                self.renewed[partition] = time.monotonic()
+        for partition in set(self.partitions) - owned:
+            await release_lease(self.db, f"partition:{partition}", self.worker_id)
+        # Start at a worker-specific offset so new workers do not all race for partition 0
+        start = hash(self.worker_id) % PARTITIONS
+        for step in range(PARTITIONS):
+            if len(owned) >= share:
+                break
+            partition = (start + step) % PARTITIONS
+            if partition not in owned and await acquire_lease(self.db, f"partition:{partition}", self.worker_id):
+                owned.add(partition)
+                self.renewed[partition] = time.monotonic()
+        if owned != self.partitions:
+            logger.info(f"Worker {self.worker_id} owns partitions {sorted(owned)}")
+        self.partitions = owned
+        self.renewed = {partition: self.renewed[partition] for partition in owned}
+
+    async def _hold(self, partition: int) -> bool:
+        """Renew the partition's lease when a third of it has passed; False once it is lost.
+
+        A drain can outlast the lease (``BATCH_SIZE`` slow handlers), so it is
+        renewed between items rather than only when the worker rebalances.
+        """
+        if time.monotonic() - self.renewed.get(partition, 0.0) < LEASE_TTL / 3:
+            return True
+        if await acquire_lease(self.db, f"partition:{partition}", self.worker_id):
+            self.renewed[partition] = time.monotonic()
+            return True
+        logger.warning(f"Worker {self.worker_id} lost the lease on partition {partition}")
+        self.partitions.discard(partition)
+        self.renewed.pop(partition, None)
+        return False
+
+    async def _process(self, item) -> bool:
+        from telegram import Update
+
+        try:
+            update = Update.de_json(item["payload"], self.application.bot)
+            # Plain process_update swallows handler errors, which would delete a failed update
+            await self.application.process_update_or_raise(update)
+        except Exception as e:
+            logger.exception(f"Update {item['_id']} failed: {e}")
+            attempts = item.get("attempts", 0) + 1
+            if attempts >= MAX_ATTEMPTS:
+                await self.db.bot_updates_dead.insert_one({**item, "attempts": attempts, "error": str(e)})
+                await self.db.bot_updates.delete_one({"_id": item["_id"]})
+            else:
+                await self.db.bot_updates.update_one({"_id": item["_id"]}, {"$set": {"attempts": attempts}})
+            return False
+        await self.db.bot_updates.delete_one({"_id": item["_id"]})
+        self.processed += 1
+        return True
+
+    async def _drain_partition(self, partition: int) -> int:
+        items = await self.db.bot_updates.find({"partition": partition}) \
+            .sort("_id", 1).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+        done = 0
+        for item in items:
+            # Another worker owns the partition now and will process the rest
+            if not await self._hold(partition):
+                break
+            # Stop at the first failure so later updates of the same chat wait
+            if not await self._process(item):
+                break
+            done += 1
+        return done
+
+    async def run(self, stop: asyncio.Event):
+        last_rebalance = 0.0
+        while not stop.is_set():
+            if time.monotonic() - last_rebalance > LEASE_TTL / 3:
+                await self.rebalance()
+                last_rebalance = time.monotonic()
+            done = await asyncio.gather(*(self._drain_partition(p) for p in self.partitions))
+            if not any(done):
+                await asyncio.sleep(IDLE_SLEEP)
+        for partition in self.partitions:
+            await release_lease(self.db, f"partition:{partition}", self.worker_id)
+        await self.db.bot_workers.delete_one({"_id": self.worker_id})
+
+# ==================== LAG ====================
+
+async def queue_lag(db) -> dict:
+    """Queue depth and age of the oldest queued update, overall and per partition"""
+    now = datetime.now(timezone.utc)
+    rows = await db.bot_updates.aggregate([
+        {"$group": {"_id": "$partition", "depth": {"$sum": 1}, "oldest": {"$min": "$created_at"}}}
+    ]).to_list(None)
+    partitions = {
+        row["_id"]: {"depth": row["depth"], "lag_seconds": round((now - row["oldest"]).total_seconds(), 1)}
+        for row in rows
+    }
+    return {
+        "depth": sum(item["depth"] for item in partitions.values()),
+        "lag_seconds": max((item["lag_seconds"] for item in partitions.values()), default=0.0),
+        "partitions": partitions
+    }
+
+async def report_lag(db, stop: asyncio.Event, workers: list):
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=LAG_REPORT_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        lag = await queue_lag(db)
+        processed = sum(worker.processed for worker in workers)
+        logger.info(f"Queue depth {lag['depth']}, lag {lag['lag_seconds']}s, processed {processed}")
+
+# ==================== ENTRY POINT ====================
+
+async def run(worker_count: int, with_poller: bool):
+    from telegram.ext import Application
+    import telegram_bot
+
+    if not telegram_bot.TELEGRAM_TOKEN:
+        logger.error("TELEGRAM_TOKEN not set")
+        return
+
+    db = telegram_bot.db
+    application = Application.builder().token(telegram_bot.TELEGRAM_TOKEN) \
+        .application_class(telegram_bot.BotApplication).updater(None).build()
+    telegram_bot.register_handlers(application)
+    await ensure_queue_indexes(db)
+
+    stop = asyncio.Event()
+    async with application:
+        await telegram_bot.post_init(application)
+        workers = [QueueWorker(db, application) for _ in range(worker_count)]
+        tasks = [asyncio.create_task(worker.run(stop)) for worker in workers]
+        tasks.append(asyncio.create_task(report_lag(db, stop, workers)))
+        if with_poller:
+            poller_id = f"poller-{os.uname().nodename}-{os.getpid()}"
+            tasks.append(asyncio.create_task(run_poller(db, application.bot, poller_id, stop)))
+        logger.info(f"Bot workers started: {worker_count} workers, poller={'on' if with_poller else 'off'}")
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            stop.set()
+            await telegram_bot.post_shutdown(application)
+
+async def _lag():
+    import telegram_bot
+
+    print(await queue_lag(telegram_bot.db))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Multi-worker bot runner")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="Run the poller and queue workers")
+    run_parser.add_argument("--workers", type=int, default=2)
+    run_parser.add_argument("--no-poller", action="store_true", help="Only consume the queue")
+    sub.add_parser("lag", help="Print queue depth and lag")
+    args = parser.parse_args()
+    try:
+        if args.command == "run":
+            asyncio.run(run(args.workers, not args.no_poller))
+        else:
+            asyncio.run(_lag())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,236 @@
+"""Circuit breaker and durable write spool for the bot's MongoDB access.
+
+A stalled MongoDB used to freeze every bot handler until the driver gave up.
+``CircuitBreaker`` bounds each call with ``BOT_STORE_TIMEOUT`` and, after
+``BOT_BREAKER_FAILURES`` consecutive timeouts or connection errors, opens:
+calls fail at once with ``StoreUnavailable`` instead of waiting. After
+``BOT_BREAKER_RESET`` seconds one probe call is let through (half-open);
+its success closes the breaker, its failure opens it for another period.
+
+``Spool`` is an append-only JSON-lines file where writes that could not
+reach MongoDB wait to be replayed. Every append is fsynced, so a spooled
+click or application survives a restart. Several processes may share a
+spool: appends lock the file, and one drainer at a time renames it aside
+before replaying, so nothing appended meanwhile is lost. The drainer
+records how many entries of that file it has applied, so a crash
+mid-replay repeats at most the entry in flight. Replay is still
+at-least-once (a write that timed out may have landed anyway), which is
+why inserts are upserts by id.
+
+``storage.GuardedMongoStore`` puts both around ``MongoStore``. State is
+exported as ``breaker.<name>.state`` (``closed``, ``open`` or
+``half_open``) with counters ``.opened``, ``.timeouts``, ``.failures`` and
+``.rejected``; the spool adds ``.spooled``, ``.replayed`` and ``.dropped``.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from pymongo.errors import ConnectionFailure
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = float(os.environ.get('BOT_STORE_TIMEOUT', 1.0))
+FAILURES = int(os.environ.get('BOT_BREAKER_FAILURES', 5))
+RESET = float(os.environ.get('BOT_BREAKER_RESET', 15))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class StoreUnavailable(Exception):
+    """The breaker is open, or the call timed out or lost its connection"""
+
+class CircuitBreaker:
+    def __init__(self, name: str, timeout: float = None, failures: int = None, reset: float = None,
+                 clock=time.monotonic):
+        self.name = name
+        self.timeout = TIMEOUT if timeout is None else timeout
+        self.threshold = FAILURES if failures is None else failures
+        self.reset = RESET if reset is None else reset
+        self.clock = clock
+        self.state = CLOSED
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.probing = False
+        registry.set(f"breaker.{name}.state", CLOSED)
+
+    def _set_state(self, state: str):
+        if state == OPEN and self.state != OPEN:
+            registry.inc(f"breaker.{self.name}.opened")
+        self.state = state
+        registry.set(f"breaker.{self.name}.state", state)
+
+    def allow(self) -> bool:
+        """Whether a call may go to MongoDB now; claims the probe when half-open"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and self.clock() - self.opened_at >= self.reset:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def succeeded(self):
+        self.consecutive = 0
+        self.probing = False
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def failed(self):
+        self.consecutive += 1
+        self.probing = False
+        if self.state == HALF_OPEN or self.consecutive >= self.threshold:
+            self.opened_at = self.clock()
+            self._set_state(OPEN)
+
+    async def call(self, factory):
+        """Await ``factory()`` within the timeout; raises ``StoreUnavailable`` instead of hanging"""
+        if not self.allow():
+            registry.inc(f"breaker.{self.name}.rejected")
+            raise StoreUnavailable(f"{self.name}: circuit open")
+        try:
+            result = await asyncio.wait_for(factory(), self.timeout)
+        except asyncio.TimeoutError as e:
+            registry.inc(f"breaker.{self.name}.timeouts")
+            self.failed()
+            raise StoreUnavailable(f"{self.name}: timed out after {self.timeout}s") from e
+        except ConnectionFailure as e:
+            registry.inc(f"breaker.{self.name}.failures")
+            self.failed()
+            raise StoreUnavailable(f"{self.name}: {e}") from e
+        except asyncio.CancelledError:
+            # The caller went away; a probe it held must not block the next one
+            self.probing = False
+            raise
+        except Exception:
+            # MongoDB answered, just not with what the caller wanted
+            self.succeeded()
+            raise
+        self.succeeded()
+        return result
+
+# ==================== SPOOL ====================
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Cannot spool {type(value).__name__}")
+
+def _decode(obj: dict):
+    if len(obj) == 1 and "$date" in obj:
+        return datetime.fromisoformat(obj["$date"])
+    return obj
+
+class Spool:
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.draining_path = path + ".replay"
+        self.progress_path = path + ".replay.applied"
+        self.lock_path = path + ".lock"
+        # Left over from an earlier run, or by another process
+        self.pending = os.path.exists(path) or os.path.exists(self.draining_path)
+
+    def append(self, entry: dict):
+        line = (json.dumps(entry, default=_encode, ensure_ascii=False) + "\n").encode()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        while True:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    current = os.stat(self.path).st_ino
+                except FileNotFoundError:
+                    current = None
+                # A drainer renamed the file while we waited for the lock
+                if current != os.fstat(fd).st_ino:
+                    continue
+                os.write(fd, line)
+                os.fsync(fd)
+                self.pending = True
+                registry.inc(f"breaker.{self.name}.spooled")
+                return
+            finally:
+                os.close(fd)
+
+    def _take(self) -> bool:
+        """Move the spool aside for draining; False when there is nothing to drain"""
+        if os.path.exists(self.draining_path):
+            return True
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Left by a drain that finished its file but not the cleanup
+            self._forget_progress()
+            os.replace(self.path, self.draining_path)
+        finally:
+            os.close(fd)
+        return True
+
+    def _progress(self) -> int:
+        """How many entries of the file being drained are already applied"""
+        try:
+            with open(self.progress_path, encoding="utf-8") as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _save_progress(self, applied: int):
+        partial = self.progress_path + ".tmp"
+        with open(partial, "w", encoding="utf-8") as f:
+            f.write(str(applied))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, self.progress_path)
+
+    def _forget_progress(self):
+        try:
+            os.remove(self.progress_path)
+        except FileNotFoundError:
+            pass
+
+    async def drain(self, apply) -> int:
+        """Replay entries oldest first through ``apply(entry)``; returns how many were applied.
+
+        Stops at the first ``StoreUnavailable`` and keeps the rest for next
+        time. Any other error drops that one entry, so a bad entry cannot
+        block the spool forever. Progress is saved after every entry.
+        """
+        lock = os.open(self.lock_path, os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process is draining
+                return 0
+            applied = 0
+            while self._take():
+                with open(self.draining_path, encoding="utf-8") as f:
+                    lines = f.readlines()
+                for i in range(self._progress(), len(lines)):
+                    try:
+                        await apply(json.loads(lines[i], object_hook=_decode))
+                    except StoreUnavailable:
+                        return applied
+                    except Exception:
+                        logger.exception(f"Dropping spooled write: {lines[i].strip()}")
+                        registry.inc(f"breaker.{self.name}.dropped")
+                    else:
+                        applied += 1
+                        registry.inc(f"breaker.{self.name}.replayed")
+                    self._save_progress(i + 1)
+                os.remove(self.draining_path)
+                self._forget_progress()
+            self.pending = False
+            return applied
+        finally:
+            os.close(lock)
@@ -0,0 +1,55 @@
+"""Small in-process async caches for hot read paths."""
+import asyncio
+import time
+
+class TTLCache:
+    """Keyed async cache with a fixed time-to-live.
+
+    Concurrent misses for the same key share one loader call, so a cold or
+    just-invalidated entry costs a single round of queries no matter how many
+    requests arrive at once.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._values = {}
+        self._loading = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key, loader):
+        """Return the cached value for ``key``, calling ``loader()`` when stale"""
+        entry = self._values.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        task = self._loading.get(key)
+        if task is None:
+            generation = self._generation
+            task = asyncio.ensure_future(loader())
+            self._loading[key] = task
+            try:
+                value = await asyncio.shield(task)
+            finally:
+                self._loading.pop(key, None)
+            # Skip storing a value that was loaded before an invalidation
+            if generation == self._generation:
+                self._values[key] = (time.monotonic() + self.ttl, value)
+            return value
+        return await asyncio.shield(task)
+
+    def peek(self, key, default=None):
+        """Return the cached value without loading, even if expired"""
+        entry = self._values.get(key)
+        return entry[1] if entry else default
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when no key is given"""
+        self._generation += 1
+        if key is None:
+            self._values.clear()
+        else:
+            self._values.pop(key, None)
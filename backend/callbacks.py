@@ -0,0 +1,76 @@
+"""Table-driven dispatch of bot callback queries.
+
+A single ``CallbackQueryHandler`` hands every callback to
+``CallbackRouter.dispatch``, which parses ``callback_data`` once and finds the
+handler with a dict lookup, instead of trying a chain of regex patterns and
+re-parsing the payload inside each handler. Payload shapes:
+
+* exact names (``catalog``, ``back_main``, ...): ``handler(update, context)``
+* compact catalog payloads (see ``catalog.py``): routed by action as
+  ``handler(update, context, version, value)``
+* legacy ``<prefix>_<argument>`` buttons (``mfo_<uuid>``):
+  ``handler(update, context, argument)``
+
+Every route records latency in ``bot.callback.<handler name>.ms`` and
+failures in ``bot.callback.<handler name>.errors``, and names the query log
+unit ``bot:callback:<handler name>``.
+"""
+import logging
+import time
+
+from catalog import decode_callback
+from metrics import registry
+from querylog import name_unit
+
+logger = logging.getLogger(__name__)
+
+class CallbackRouter:
+    def __init__(self):
+        self.exact = {}
+        self.actions = {}
+        self.prefixes = {}
+
+    def on(self, name: str, handler):
+        self.exact[name] = handler
+
+    def on_action(self, action: str, handler):
+        self.actions[action] = handler
+
+    def on_prefix(self, prefix: str, handler):
+        self.prefixes[prefix] = handler
+
+    def resolve(self, data: str):
+        """Return ``(route, handler, args)`` for a payload, or None if nothing matches"""
+        handler = self.exact.get(data)
+        if handler is not None:
+            return handler.__name__, handler, ()
+        decoded = decode_callback(data)
+        if decoded is not None:
+            action, version, value = decoded
+            handler = self.actions.get(action)
+            if handler is not None:
+                return handler.__name__, handler, (version, value)
+        prefix, sep, argument = (data or "").partition("_")
+        handler = self.prefixes.get(prefix)
+        if sep and handler is not None:
+            return handler.__name__, handler, (argument,)
+        return None
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        resolved = self.resolve(query.data)
+        if resolved is None:
+            registry.inc("bot.callback.unknown")
+            logger.warning(f"Unrouted callback data: {query.data!r}")
+            await query.answer()
+            return
+        route, handler, args = resolved
+        name_unit(f"bot:callback:{route}")
+        started = time.perf_counter()
+        try:
+            await handler(update, context, *args)
+        except Exception:
+            registry.inc(f"bot.callback.{route}.errors")
+            raise
+        finally:
+            registry.observe(f"bot.callback.{route}.ms", (time.perf_counter() - started) * 1000)
@@ -0,0 +1,122 @@
+"""Paged bot catalog and the compact callback_data codec.
+
+Telegram limits ``callback_data`` to 64 bytes, and ``mfo_<uuid>`` already
+takes 40 of them. Catalog buttons therefore carry short payloads instead::
+
+    <codec><action>:<catalog version>:<value>      e.g. "1m:k3x9q:12"
+
+``value`` is a page number or an MFO's position in the catalog index. The
+index is the ordered list of active MFOs, built once per
+``BOT_CATALOG_CACHE_TTL`` for each ranking segment (see ``ranking.py``) and
+shared by every chat in that segment. Its version is a hash of
+the ordered ids, so every bot process derives the same version for the same
+catalog. A button made from an older index still resolves while that index
+is among the ``RECENT_VERSIONS`` kept in memory; after that it decodes as
+stale and the handler shows the current catalog instead of a wrong MFO.
+"""
+import os
+import zlib
+from collections import OrderedDict
+
+from cache import TTLCache
+
+CODEC_VERSION = "1"
+PAGE_SIZE = int(os.environ.get('BOT_CATALOG_PAGE_SIZE', 8))
+RECENT_VERSIONS = 8
+
+# Callback actions
+CATALOG_PAGE = "c"
+MFO_DETAIL = "m"
+APPLY_PAGE = "a"
+APPLY_MFO = "s"
+ACTIONS = CATALOG_PAGE + MFO_DETAIL + APPLY_PAGE + APPLY_MFO
+
+MFO_FIELDS = {"_id": 0, "id": 1, "name": 1, "description": 1, "interest_rate": 1, "min_amount": 1,
+              "max_amount": 1, "min_term": 1, "max_term": 1, "approval_rate": 1, "website_url": 1}
+
+def _base36(number: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        number, rest = divmod(number, 36)
+        out = digits[rest] + out
+        if not number:
+            return out
+
+class CatalogIndex:
+    """Immutable snapshot of the active catalog with page and position lookups"""
+
+    def __init__(self, mfos: list, page_size: int = PAGE_SIZE):
+        self.mfos = mfos
+        self.page_size = page_size
+        self.positions = {mfo["id"]: position for position, mfo in enumerate(mfos)}
+        self.version = _base36(zlib.crc32("|".join(mfo["id"] for mfo in mfos).encode()))
+
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-len(self.mfos) // self.page_size))
+
+    def page(self, number: int):
+        """Return ``(page_number, items)`` with ``number`` clamped into range"""
+        number = min(max(number, 0), self.page_count - 1)
+        start = number * self.page_size
+        return number, list(enumerate(self.mfos[start:start + self.page_size], start))
+
+    def page_of(self, mfo_id: str) -> int:
+        return self.positions.get(mfo_id, 0) // self.page_size
+
+    def at(self, position: int):
+        if 0 <= position < len(self.mfos):
+            return self.mfos[position]
+        return None
+
+def encode_callback(action: str, version: str, value: int) -> str:
+    return f"{CODEC_VERSION}{action}:{version}:{value}"
+
+def decode_callback(data: str):
+    """Return ``(action, version, value)``, or None for foreign or malformed data"""
+    if not data or data[0] != CODEC_VERSION:
+        return None
+    try:
+        head, version, value = data[1:].split(":")
+        value = int(value)
+    except ValueError:
+        return None
+    if len(head) != 1 or head not in ACTIONS:
+        return None
+    return head, version, value
+
+class Catalog:
+    """Cached catalog indexes, one per ranking segment, plus recent versions for stale buttons"""
+
+    def __init__(self, store, ranking=None, ttl: float = float(os.environ.get('BOT_CATALOG_CACHE_TTL', 60))):
+        self.store = store
+        self.ranking = ranking
+        self.cache = TTLCache(ttl)
+        self._recent = OrderedDict()
+
+    async def _load(self, segment: str) -> CatalogIndex:
+        mfos = await self.cache.get(("mfos",), self.store.active_mfos)
+        if self.ranking is not None:
+            rank = {mfo_id: i for i, mfo_id in enumerate(await self.ranking.order(segment))}
+            # Unranked (new) MFOs keep their catalog order after the ranked ones
+            mfos = sorted(mfos, key=lambda mfo: rank.get(mfo["id"], len(rank)))
+        index = CatalogIndex(mfos)
+        self._recent[index.version] = index
+        self._recent.move_to_end(index.version)
+        while len(self._recent) > RECENT_VERSIONS:
+            self._recent.popitem(last=False)
+        return index
+
+    async def current(self, segment: str = "default") -> CatalogIndex:
+        return await self.cache.get(segment, lambda: self._load(segment))
+
+    async def resolve(self, version: str, segment: str = "default"):
+        """Index a button was rendered from, or None if it is no longer known"""
+        index = await self.current(segment)
+        if version == index.version:
+            return index
+        return self._recent.get(version)
+
+    def invalidate(self):
+        self.cache.invalidate()
@@ -0,0 +1,147 @@
+"""Time-bucketed click storage.
+
+Clicks are kept in ``click_buckets``: one document per MFO per hour holding a
+running ``count`` and a compact ``events`` array of ``{"s": <second within the
+hour>, "u": <telegram_id>}`` entries. A bucket is capped at
+``BUCKET_MAX_EVENTS`` events; once it is full the next click for that hour
+opens a new bucket document, so documents stay small on hot MFOs.
+
+Run ``python clicks.py migrate`` to fold the legacy per-click ``clicks``
+collection into buckets.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+BUCKET_MAX_EVENTS = 1000
+
+logger = logging.getLogger(__name__)
+
+# ==================== HELPERS ====================
+
+def bucket_hour(moment: datetime) -> datetime:
+    """Truncate a timestamp to the start of its UTC hour"""
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+def _event(moment: datetime, telegram_id):
+    moment = moment.astimezone(timezone.utc)
+    return {"s": moment.minute * 60 + moment.second, "u": telegram_id}
+
+async def ensure_click_indexes(db):
+    """Create indexes used by click writers and analytics readers"""
+    await db.click_buckets.create_index([("mfo_id", 1), ("hour", 1), ("count", 1)])
+    await db.click_buckets.create_index([("hour", 1)])
+
+# ==================== WRITERS ====================
+
+async def record_click(db, mfo_id: str, telegram_id=None, moment: datetime = None):
+    """Append a click to the MFO's bucket for the current hour"""
+    moment = moment or datetime.now(timezone.utc)
+    await db.click_buckets.update_one(
+        {"mfo_id": mfo_id, "hour": bucket_hour(moment), "count": {"$lt": BUCKET_MAX_EVENTS}},
+        {"$inc": {"count": 1}, "$push": {"events": _event(moment, telegram_id)}},
+        upsert=True
+    )
+
+# ==================== READERS ====================
+
+def _with_rollups(group: dict) -> list:
+    # Buckets past retention are folded into daily ``click_rollups`` counters
+    # (see retention.py), so totals read both collections
+    return [
+        {"$project": {"mfo_id": 1, "count": 1}},
+        {"$unionWith": {"coll": "click_rollups", "pipeline": [{"$project": {"mfo_id": 1, "count": 1}}]}},
+        {"$group": group}
+    ]
+
+async def count_clicks(db) -> int:
+    """Total number of clicks across all buckets and rollups"""
+    result = await db.click_buckets.aggregate(
+        _with_rollups({"_id": None, "total": {"$sum": "$count"}})
+    ).to_list(1)
+    return result[0]["total"] if result else 0
+
+async def top_mfos_by_clicks(db, limit: int = 10) -> list:
+    """Return ``[{"_id": mfo_id, "clicks": n}]`` sorted by clicks descending"""
+    pipeline = _with_rollups({"_id": "$mfo_id", "clicks": {"$sum": "$count"}}) + [
+        {"$sort": {"clicks": -1}},
+        {"$limit": limit}
+    ]
+    return await db.click_buckets.aggregate(pipeline, allowDiskUse=True).to_list(limit)
+
+# ==================== MIGRATION ====================
+
+def _parse_created_at(value) -> datetime:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return datetime.fromisoformat(value)
+
+async def migrate_raw_clicks(db, batch_size: int = 5000, drop: bool = False) -> int:
+    """Convert legacy one-document-per-click ``clicks`` into hourly buckets.
+
+    Raw clicks are read in ``_id`` order and deleted batch by batch once their
+    buckets are written, so an interrupted run can simply be restarted.
+    """
+    migrated = 0
+    while True:
+        raw = await db.clicks.find({}, {"mfo_id": 1, "telegram_id": 1, "created_at": 1}) \
+            .sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not raw:
+            break
+
+        # Buckets written for a batch are tagged with its last raw ``_id`` so a
+        # run interrupted between insert and delete does not count it twice
+        batch_tag = raw[-1]["_id"]
+        if not await db.click_buckets.find_one({"migrated_from": batch_tag}, {"_id": 1}):
+            grouped = {}
+            for click in raw:
+                moment = _parse_created_at(click["created_at"])
+                key = (click["mfo_id"], bucket_hour(moment))
+                grouped.setdefault(key, []).append(_event(moment, click.get("telegram_id")))
+
+            buckets = []
+            for (mfo_id, hour), events in grouped.items():
+                for start in range(0, len(events), BUCKET_MAX_EVENTS):
+                    chunk = events[start:start + BUCKET_MAX_EVENTS]
+                    buckets.append({
+                        "mfo_id": mfo_id,
+                        "hour": hour,
+                        "count": len(chunk),
+                        "events": chunk,
+                        "migrated_from": batch_tag
+                    })
+            await db.click_buckets.insert_many(buckets)
+
+        await db.clicks.delete_many({"_id": {"$in": [click["_id"] for click in raw]}})
+        migrated += len(raw)
+        logger.info(f"Migrated {migrated} raw clicks into buckets")
+
+    if drop:
+        await db.clicks.drop()
+    return migrated
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        await ensure_click_indexes(db)
+        migrated = await migrate_raw_clicks(db, batch_size=args.batch_size, drop=args.drop)
+        logger.info(f"Done, {migrated} raw clicks migrated")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Click bucket maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Convert raw clicks into hourly buckets")
+    migrate.add_argument("--batch-size", type=int, default=5000)
+    migrate.add_argument("--drop", action="store_true", help="Drop the raw clicks collection when done")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,165 @@
+"""In-process event bus feeding the admin dashboard's Server-Sent Events stream.
+
+There is one feed per API process, shared by every connected admin:
+
+* When MongoDB runs as a replica set, a single database change stream over
+  ``WATCHED_COLLECTIONS`` is the source, so writes from the bot process show
+  up too.
+* Otherwise the API routes publish their own writes directly, and stats are
+  re-read every ``idle_refresh`` seconds while anyone is watching.
+
+Stats are never recomputed per viewer. Relevant changes only mark the
+``StatsPublisher`` dirty; at most once per interval it reloads the stats and
+broadcasts the changed fields to all subscribers. The work done therefore
+grows with the event rate, not with the number of open dashboards.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = ["applications", "bot_users", "click_buckets", "mfos"]
+# $changeStream only on replica sets (40573), IllegalOperation on older standalone servers (20)
+CHANGE_STREAMS_UNSUPPORTED = {40573, 20}
+APPLICATION_FIELDS = ["id", "mfo_id", "mfo_name", "user_name", "amount", "term", "status", "created_at"]
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def format_sse(event: dict) -> str:
+    """Encode an event as an SSE frame"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=_default, ensure_ascii=False)}\n\n"
+
+def application_event(doc: dict) -> dict:
+    return {"type": "application_created", "application": {k: doc.get(k) for k in APPLICATION_FIELDS}}
+
+class EventBus:
+    """Fan-out of events to bounded per-subscriber queues"""
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        # True while a change stream is feeding the bus
+        self.external_feed = False
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        registry.set("events.subscribers", len(self._subscribers))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        registry.set("events.subscribers", len(self._subscribers))
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: dict):
+        registry.inc("events.published")
+        for queue in self._subscribers:
+            if queue.full():
+                # A slow viewer loses its oldest events instead of growing memory
+                queue.get_nowait()
+                registry.inc("events.dropped")
+            queue.put_nowait(event)
+
+class StatsPublisher:
+    """Recompute stats at most once per interval and broadcast what changed"""
+
+    def __init__(self, bus: EventBus, load_stats, invalidate, interval: float = 2.0, idle_refresh: float = 15.0):
+        self.bus = bus
+        self.load_stats = load_stats
+        self.invalidate = invalidate
+        self.interval = interval
+        # Without a change stream, writes from other processes are only seen by polling
+        self.idle_refresh = idle_refresh
+        self.snapshot = None
+        self._dirty = asyncio.Event()
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    async def refresh(self) -> dict:
+        self.invalidate()
+        stats = await self.load_stats()
+        current = stats.model_dump() if hasattr(stats, "model_dump") else dict(stats)
+        previous = self.snapshot or {}
+        delta = {key: value for key, value in current.items() if previous.get(key) != value}
+        self.snapshot = current
+        if delta:
+            self.bus.publish({"type": "stats", "stats": current, "delta": delta})
+        return current
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._dirty.wait(), timeout=self.idle_refresh)
+            except asyncio.TimeoutError:
+                if self.bus.external_feed or not self.bus.subscriber_count:
+                    continue
+            self._dirty.clear()
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Stats refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+async def watch_changes(db, bus: EventBus, stats: StatsPublisher):
+    """Feed the bus from a change stream; returns if the deployment has none.
+
+    Only application inserts carry their document. Click and user writes
+    are just a dirty mark, so no post-image is looked up for updates; a
+    status change reads the application's ``id`` by ``_id`` instead.
+    """
+    pipeline = [
+        {"$match": {
+            "ns.coll": {"$in": WATCHED_COLLECTIONS},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }},
+        {"$project": {
+            "ns": 1, "operationType": 1, "documentKey": 1,
+            "fullDocument": {"$cond": [{"$eq": ["$ns.coll", "applications"]}, "$fullDocument", "$$REMOVE"]},
+            "updateDescription.updatedFields.status": 1,
+        }},
+    ]
+    resume_token = None
+    while True:
+        try:
+            async with db.watch(pipeline, resume_after=resume_token) as stream:
+                bus.external_feed = True
+                logger.info("Dashboard events fed by change stream")
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    stats.mark_dirty()
+                    if change["ns"]["coll"] != "applications":
+                        continue
+                    if change["operationType"] == "insert":
+                        bus.publish(application_event(change.get("fullDocument") or {}))
+                        continue
+                    status = change.get("updateDescription", {}).get("updatedFields", {}).get("status")
+                    if status is not None:
+                        doc = await db.applications.find_one(change["documentKey"], {"_id": 0, "id": 1}) or {}
+                        bus.publish({"type": "application_status", "id": doc.get("id"), "status": status})
+        except OperationFailure as e:
+            bus.external_feed = False
+            if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                logger.info(f"Change streams unavailable ({e.code}), routes publish events directly")
+                return
+            # E.g. the resume point fell off the oplog: start over from now
+            resume_token = None
+            logger.warning(f"Change stream failed ({e.code}): {e}; restarting")
+            await asyncio.sleep(5)
+        except PyMongoError as e:
+            bus.external_feed = False
+            logger.warning(f"Change stream interrupted: {e}; retrying")
+            await asyncio.sleep(5)
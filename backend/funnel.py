@@ -0,0 +1,151 @@
+"""Incremental per-MFO conversion funnel.
+
+Stages are ``views`` (MFO card opened / click tracked), ``started`` (apply
+flow started for the MFO), ``submitted`` (application created) and
+``approved``. Counters live in ``funnel_daily``, one document per MFO per UTC
+day, and are updated as events arrive so reads never join raw collections.
+
+Attribution: a view opens a touch in ``funnel_touches`` for the
+(telegram_id, mfo_id) pair that lasts ``FUNNEL_ATTRIBUTION_DAYS``. Later
+stages inside that window are credited to the day of the view, so each
+day's row reads as a cohort (of the views that day, how many went on to
+apply, submit, get approved). Stages with no open touch, and approvals of
+applications submitted without one, are counted under ``unattributed`` on
+the day they happen; reports list them next to the cohort counts.
+"""
+import os
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument, UpdateOne
+
+ATTRIBUTION_DAYS = int(os.environ.get('FUNNEL_ATTRIBUTION_DAYS', 7))
+STAGES = ["views", "started", "submitted", "approved"]
+# Stages that can happen without a view to credit them to
+UNATTRIBUTED_STAGES = STAGES[1:]
+
+def _day(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def ensure_funnel_indexes(db):
+    await db.funnel_daily.create_index([("mfo_id", 1), ("day", 1)], unique=True)
+    await db.funnel_daily.create_index([("day", 1)])
+    await db.funnel_touches.create_index("expires_at", expireAfterSeconds=0)
+
+async def _bump(db, mfo_id: str, day: datetime, field: str, amount: int = 1):
+    await db.funnel_daily.update_one(
+        {"mfo_id": mfo_id, "day": day},
+        {"$inc": {field: amount}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+# ==================== EVENTS ====================
+
+async def record_view(db, mfo_id: str, telegram_id=None, at: datetime = None):
+    """Count a view and (re)open the attribution window for the user; ``at`` defaults to now"""
+    now = at or datetime.now(timezone.utc)
+    day = _day(now)
+    await _bump(db, mfo_id, day, "views")
+    if telegram_id is None:
+        return
+    await db.funnel_touches.update_one(
+        {"_id": f"{telegram_id}:{mfo_id}"},
+        {"$set": {"day": day, "viewed_at": now, "expires_at": now + timedelta(days=ATTRIBUTION_DAYS)},
+         "$unset": {"started": "", "submitted": ""}},
+        upsert=True
+    )
+
+async def _advance(db, mfo_id: str, telegram_id, stage: str, at: datetime = None):
+    """Credit a stage to the touch's view day; returns that day or None"""
+    now = at or datetime.now(timezone.utc)
+    touch = None
+    if telegram_id is not None:
+        # Each stage is credited at most once per touch
+        touch = await db.funnel_touches.find_one_and_update(
+            {"_id": f"{telegram_id}:{mfo_id}", "expires_at": {"$gt": now}, stage: {"$ne": True}},
+            {"$set": {stage: True}},
+            return_document=ReturnDocument.AFTER
+        )
+    if touch:
+        await _bump(db, mfo_id, touch["day"], stage)
+        return touch["day"]
+    await _bump(db, mfo_id, _day(now), f"unattributed.{stage}")
+    return None
+
+async def record_apply_started(db, mfo_id: str, telegram_id, at: datetime = None):
+    await _advance(db, mfo_id, telegram_id, "started", at)
+
+async def record_submitted(db, mfo_id: str, telegram_id, at: datetime = None):
+    """Count a submitted application; returns the cohort day to store on it"""
+    return await _advance(db, mfo_id, telegram_id, "submitted", at)
+
+async def record_status_changes(db, changes: list):
+    """Keep ``approved`` in step with application status transitions.
+
+    ``changes`` is a list of ``(application, old_status, new_status)``; all
+    counter deltas are applied in one bulk write. Applications without a
+    ``funnel_day`` count under ``unattributed.approved`` today.
+    """
+    today = _day(datetime.now(timezone.utc))
+    deltas = {}
+    for app, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        if new_status == "approved":
+            delta = 1
+        elif old_status == "approved":
+            delta = -1
+        else:
+            continue
+        day = app.get("funnel_day")
+        key = (app["mfo_id"], day, "approved") if day else (app["mfo_id"], today, "unattributed.approved")
+        deltas[key] = deltas.get(key, 0) + delta
+    requests = [
+        UpdateOne({"mfo_id": mfo_id, "day": day}, {"$inc": {field: delta}}, upsert=True)
+        for (mfo_id, day, field), delta in deltas.items() if delta
+    ]
+    if requests:
+        await db.funnel_daily.bulk_write(requests, ordered=False)
+
+# ==================== READERS ====================
+
+def _rates(row: dict) -> dict:
+    views = row.get("views", 0)
+    started = row.get("started", 0)
+    submitted = row.get("submitted", 0)
+    return {
+        "view_to_start": round(started / views * 100, 2) if views else 0.0,
+        "start_to_submit": round(submitted / started * 100, 2) if started else 0.0,
+        "view_to_submit": round(submitted / views * 100, 2) if views else 0.0,
+        "submit_to_approve": round(row.get("approved", 0) / submitted * 100, 2) if submitted else 0.0,
+    }
+
+async def funnel_report(db, days: int = 30, mfo_id: str = None) -> dict:
+    """Per-MFO totals and a per-day series from the precomputed counters"""
+    since = _day(datetime.now(timezone.utc)) - timedelta(days=days - 1)
+    match = {"day": {"$gte": since}}
+    if mfo_id:
+        match["mfo_id"] = mfo_id
+    totals = {stage: {"$sum": {"$ifNull": [f"${stage}", 0]}} for stage in STAGES}
+    totals.update({f"unattributed_{stage}": {"$sum": {"$ifNull": [f"$unattributed.{stage}", 0]}}
+                   for stage in UNATTRIBUTED_STAGES})
+
+    by_mfo = await db.funnel_daily.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$mfo_id", **totals}},
+        {"$sort": {"views": -1}}
+    ], allowDiskUse=True).to_list(None)
+    by_day = await db.funnel_daily.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$day", **totals}},
+        {"$sort": {"_id": 1}}
+    ], allowDiskUse=True).to_list(None)
+
+    def counts(row):
+        return {**{s: row[s] for s in STAGES},
+                "unattributed": {s: row[f"unattributed_{s}"] for s in UNATTRIBUTED_STAGES}}
+
+    return {
+        "days": days,
+        "by_mfo": [{"mfo_id": row["_id"], **counts(row), "rates": _rates(row)} for row in by_mfo],
+        "by_day": [{"date": row["_id"].date().isoformat(), **counts(row)} for row in by_day],
+    }
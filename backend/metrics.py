@@ -0,0 +1,63 @@
+"""Process-local counters and latency summaries.
+
+Modules record into the shared ``registry``; the API exposes a snapshot via
+``GET /api/metrics`` and the bot logs one periodically.
+"""
+import threading
+from collections import defaultdict, deque
+
+class Histogram:
+    """Bounded reservoir of recent samples with percentile summaries"""
+
+    def __init__(self, size: int = 2048):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.samples.append(value)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        def pct(p):
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "p99": pct(0.99),
+            "max": round(ordered[-1], 3) if ordered else 0.0,
+        }
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self.histograms = defaultdict(Histogram)
+
+    def inc(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def set(self, name: str, value):
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self.histograms[name].observe(value)
+
+    def snapshot(self, prefix: str = "") -> dict:
+        with self._lock:
+            return {
+                "counters": {k: v for k, v in sorted(self.counters.items()) if k.startswith(prefix)},
+                "gauges": {k: v for k, v in sorted(self.gauges.items()) if k.startswith(prefix)},
+                "histograms": {k: h.summary() for k, h in sorted(self.histograms.items()) if k.startswith(prefix)},
+            }
+
+registry = Registry()
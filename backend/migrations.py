@@ -0,0 +1,180 @@
+"""Versioned, resumable schema migrations.
+
+Each migration is registered with ``@migration(version, description)`` and
+walks its collections in ``_id`` order in small batches. Progress is
+checkpointed in ``schema_migrations`` after every batch, so a migration can be
+stopped at any time and picks up where it left off on the next run. Batches
+are written with unordered ``bulk_write`` calls and an optional pause in
+between, which keeps the load on the primary low while the API and the bot
+keep serving traffic.
+
+Usage::
+
+    python migrations.py status
+    python migrations.py run [--batch-size 500] [--pause 0.05] [--target 1]
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = {}
+
+class BatchMigration:
+    """Rewrite matching documents of one or more collections batch by batch"""
+
+    version = 0
+    description = ""
+    # {collection_name: base filter selecting documents that still need work}
+    collections = {}
+
+    def transform(self, collection: str, doc: dict):
+        """Return an update document for ``doc`` or None to leave it as is"""
+        raise NotImplementedError
+
+def migration(version: int, description: str):
+    """Register a migration class under a schema version"""
+    def register(cls):
+        if version in MIGRATIONS:
+            raise ValueError(f"Duplicate migration version {version}")
+        cls.version = version
+        cls.description = description
+        MIGRATIONS[version] = cls
+        return cls
+    return register
+
+# ==================== MIGRATIONS ====================
+
+TIMESTAMP_FIELDS = {
+    "admins": ["created_at"],
+    "mfos": ["created_at"],
+    "applications": ["created_at"],
+    "bot_users": ["created_at", "last_activity"],
+    "content": ["updated_at"],
+    "clicks": ["created_at"],
+}
+
+@migration(1, "Store timestamps as native BSON dates instead of ISO strings")
+class TimestampsToDates(BatchMigration):
+    collections = {
+        name: {"$or": [{field: {"$type": "string"}} for field in fields]}
+        for name, fields in TIMESTAMP_FIELDS.items()
+    }
+
+    def transform(self, collection, doc):
+        update = {}
+        for field in TIMESTAMP_FIELDS[collection]:
+            value = doc.get(field)
+            if isinstance(value, str):
+                parsed = datetime.fromisoformat(value)
+                if parsed.tzinfo is None:
+                    parsed = parsed.replace(tzinfo=timezone.utc)
+                update[field] = parsed
+        return {"$set": update} if update else None
+
+# ==================== RUNNER ====================
+
+async def applied_versions(db) -> set:
+    """Versions that have completed"""
+    done = await db.schema_migrations.find({"status": "done"}, {"_id": 1}).to_list(None)
+    return {item["_id"] for item in done}
+
+async def _run_collection(db, instance, name, base_filter, state, batch_size, pause):
+    checkpoint = state.get("checkpoints", {}).get(name)
+    processed = 0
+    while True:
+        query = dict(base_filter)
+        if checkpoint is not None:
+            query = {"$and": [base_filter, {"_id": {"$gt": checkpoint}}]}
+        docs = await db[name].find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return processed
+
+        requests = []
+        for doc in docs:
+            update = instance.transform(name, doc)
+            if update:
+                requests.append(UpdateOne({"_id": doc["_id"]}, update))
+        if requests:
+            await db[name].bulk_write(requests, ordered=False)
+
+        checkpoint = docs[-1]["_id"]
+        processed += len(docs)
+        await db.schema_migrations.update_one(
+            {"_id": instance.version},
+            {"$set": {f"checkpoints.{name}": checkpoint, "updated_at": datetime.now(timezone.utc)},
+             "$inc": {"processed": len(docs)}}
+        )
+        logger.info(f"Migration {instance.version}: {name} +{len(docs)} (total {processed})")
+        if pause:
+            await asyncio.sleep(pause)
+
+async def run_migration(db, version: int, batch_size: int = 500, pause: float = 0.0):
+    """Run (or resume) a single migration"""
+    instance = MIGRATIONS[version]()
+    now = datetime.now(timezone.utc)
+    state = await db.schema_migrations.find_one_and_update(
+        {"_id": version},
+        {"$setOnInsert": {"description": instance.description, "started_at": now, "processed": 0},
+         "$set": {"status": "running", "updated_at": now}},
+        upsert=True,
+        return_document=True
+    )
+    for name, base_filter in instance.collections.items():
+        await _run_collection(db, instance, name, base_filter, state, batch_size, pause)
+
+    await db.schema_migrations.update_one(
+        {"_id": version},
+        {"$set": {"status": "done", "finished_at": datetime.now(timezone.utc)}}
+    )
+    logger.info(f"Migration {version} done: {instance.description}")
+
+async def run_pending(db, target: int = None, batch_size: int = 500, pause: float = 0.0) -> list:
+    """Run every registered migration that has not completed yet, in order"""
+    done = await applied_versions(db)
+    ran = []
+    for version in sorted(MIGRATIONS):
+        if target is not None and version > target:
+            break
+        if version in done:
+            continue
+        await run_migration(db, version, batch_size=batch_size, pause=pause)
+        ran.append(version)
+    return ran
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        if args.command == "status":
+            states = {item["_id"]: item for item in await db.schema_migrations.find().to_list(None)}
+            for version in sorted(MIGRATIONS):
+                state = states.get(version, {})
+                print(f"{version:>4}  {state.get('status', 'pending'):<8} "
+                      f"{state.get('processed', 0):>10}  {MIGRATIONS[version].description}")
+        else:
+            ran = await run_pending(db, target=args.target, batch_size=args.batch_size, pause=args.pause)
+            logger.info(f"Applied migrations: {ran or 'none'}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Schema migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="Show migration state")
+    run = sub.add_parser("run", help="Apply pending migrations")
+    run.add_argument("--batch-size", type=int, default=500)
+    run.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    run.add_argument("--target", type=int, default=None, help="Stop after this version")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,189 @@
+"""Durable applicant notifications through a Mongo outbox.
+
+Status changes insert messages into ``notification_outbox`` in the same
+request that changes the status; nothing on the request path talks to
+Telegram. The texts are the bot's ``status_*`` templates (``bot_messages.py``,
+editable as content) in the language the user's Telegram client reported.
+``NotificationWorker`` drains the outbox in batches:
+
+* A message is claimed atomically (``pending`` -> ``sending`` with a lease),
+  so several API processes can run workers side by side, and a message whose
+  worker died is picked up again when its lease runs out.
+* Sends go through one token bucket per worker (``NOTIFY_RATE`` messages per
+  second) to stay under Telegram's broadcast limits.
+* Flood control (``RetryAfter``) and network errors are retried with
+  exponential backoff up to ``NOTIFY_MAX_ATTEMPTS``; blocked bots and unknown
+  chats fail at once.
+
+The worker sleeps until woken (the API wakes it from a background task after
+enqueueing) or until ``NOTIFY_POLL_INTERVAL`` passes.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+
+from metrics import registry
+from ratelimit import Limit, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get('NOTIFY_BATCH_SIZE', 50))
+RATE = float(os.environ.get('NOTIFY_RATE', 25))
+MAX_ATTEMPTS = int(os.environ.get('NOTIFY_MAX_ATTEMPTS', 6))
+BACKOFF_BASE = float(os.environ.get('NOTIFY_BACKOFF_BASE', 5))
+BACKOFF_MAX = 3600
+LEASE_SECONDS = 60
+POLL_INTERVAL = float(os.environ.get('NOTIFY_POLL_INTERVAL', 10))
+
+async def ensure_notification_indexes(db):
+    await db.notification_outbox.create_index([("status", 1), ("next_attempt_at", 1)])
+    await db.notification_outbox.create_index([("status", 1), ("lease_until", 1)])
+    # Recipients' languages are looked up per batch
+    await db.bot_users.create_index("telegram_id")
+
+async def enqueue_status_notifications(db, changes: list, templates) -> int:
+    """Queue a message for each ``(application, old_status, new_status)`` worth telling.
+
+    The text is the ``status_<new_status>`` template of ``templates``
+    (a ``templates.Templates``) in the recipient's saved language.
+    """
+    wanted = [
+        (app, f"status_{new_status}") for app, old_status, new_status in changes
+        if f"status_{new_status}" in templates.defaults and old_status != new_status and app.get("user_telegram_id")
+    ]
+    if not wanted:
+        return 0
+    users = await db.bot_users.find(
+        {"telegram_id": {"$in": list({app["user_telegram_id"] for app, _ in wanted})}},
+        {"_id": 0, "telegram_id": 1, "language_code": 1}
+    ).to_list(None)
+    languages = {user["telegram_id"]: user.get("language_code") for user in users}
+    now = datetime.now(timezone.utc)
+    docs = []
+    for app, kind in wanted:
+        messages = await templates.for_language(languages.get(app["user_telegram_id"]))
+        docs.append({
+            "_id": str(uuid.uuid4()),
+            "telegram_id": app["user_telegram_id"],
+            "application_id": app["id"],
+            "kind": kind,
+            "text": messages(kind, mfo_name=app.get("mfo_name", ""), amount=app.get("amount", 0)),
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+        })
+    await db.notification_outbox.insert_many(docs, ordered=False)
+    registry.inc("notifications.enqueued", len(docs))
+    return len(docs)
+
+def backoff(attempts: int) -> float:
+    """Seconds until the next attempt, doubling per attempt with jitter"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+class NotificationWorker:
+    def __init__(self, db, get_bot, rate: float = RATE, batch_size: int = BATCH_SIZE):
+        self.db = db
+        self.get_bot = get_bot
+        self.batch_size = batch_size
+        self.limit = Limit(capacity=max(1.0, rate), rate=rate)
+        self.bucket = TokenBucket(self.limit.capacity, time.monotonic())
+        self._wake = asyncio.Event()
+        self._bot_ready = False
+
+    def wake(self):
+        self._wake.set()
+
+    async def _claim(self, now: datetime):
+        return await self.db.notification_outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "lease_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": "sending", "lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _throttle(self):
+        while True:
+            allowed, retry_after = self.bucket.take(self.limit, time.monotonic())
+            if allowed:
+                return
+            await asyncio.sleep(retry_after)
+
+    async def _send(self, bot, item: dict) -> dict:
+        """Send one message; returns the ``$set`` describing the outcome"""
+        from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+        now = datetime.now(timezone.utc)
+        attempts = item.get("attempts", 0) + 1
+        await self._throttle()
+        try:
+            message = await bot.send_message(chat_id=item["telegram_id"], text=item["text"])
+        except (Forbidden, BadRequest) as e:
+            registry.inc("notifications.failed")
+            return {"status": "failed", "attempts": attempts, "error": str(e), "failed_at": now}
+        except TelegramError as e:
+            if attempts >= MAX_ATTEMPTS:
+                registry.inc("notifications.failed")
+                return {"status": "failed", "attempts": attempts, "error": str(e), "failed_at": now}
+            delay = backoff(attempts)
+            if isinstance(e, RetryAfter):
+                retry_after = e.retry_after
+                delay = max(delay, retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after)
+            registry.inc("notifications.retried")
+            return {"status": "pending", "attempts": attempts, "error": str(e),
+                    "next_attempt_at": now + timedelta(seconds=delay)}
+        registry.inc("notifications.sent")
+        registry.observe("notifications.delivery_seconds", (now - item["created_at"]).total_seconds())
+        return {"status": "sent", "attempts": attempts, "sent_at": now, "message_id": message.message_id}
+
+    async def drain_once(self) -> int:
+        """Claim and send up to one batch; returns how many messages were handled"""
+        bot = self.get_bot()
+        if bot is None:
+            return 0
+        if not self._bot_ready:
+            await bot.initialize()
+            self._bot_ready = True
+        now = datetime.now(timezone.utc)
+        items = []
+        for _ in range(self.batch_size):
+            item = await self._claim(now)
+            if item is None:
+                break
+            items.append(item)
+        if not items:
+            return 0
+        for item in items:
+            outcome = await self._send(bot, item)
+            # Written per message: a worker dying mid-batch, or a batch
+            # outliving its lease, must not resend what already went out
+            await self.db.notification_outbox.update_one(
+                {"_id": item["_id"], "status": "sending"},
+                {"$set": outcome, "$unset": {"lease_until": ""}}
+            )
+        return len(items)
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            try:
+                handled = await self.drain_once()
+            except Exception as e:
+                logger.warning(f"Notification batch failed: {e}")
+                handled = 0
+            if handled:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,218 @@
+"""Per-unit Mongo command accounting and the slow-query log.
+
+A unit of work is one API request or one bot update. ``unit_of_work`` puts
+it in a context variable, and ``QueryMonitor``, a pymongo command listener,
+charges each command to the current unit. Motor runs commands on executor
+threads with a copy of the caller's context, so the variable is visible
+there. Commands issued outside any unit (background jobs) are only counted
+in ``mongo.untagged``. Every command's time goes to ``mongo.command_ms``;
+those charged to a unit also go to ``mongo.unit_command_ms``, which leaves
+out change-stream getMores that wait on an idle collection and other
+background traffic.
+
+When a unit finishes, it is checked against its budget: a number of
+commands and a wall time. The default is ``QUERY_BUDGET_OPS`` and
+``QUERY_BUDGET_MS``. ``QUERY_BUDGETS`` (JSON keyed by unit name) overrides
+it, and routes declare their own with ``@query_budget(ops=..., ms=...)``.
+Units over budget get a structured ``querylog`` warning with the shape of
+every command (field names kept, values replaced by ``?``). With
+``QUERY_LOG_EXPLAIN=1`` the entry also gets the query plan of the slowest
+command. The most recent entries are kept for ``GET /api/slow-queries``.
+
+With ``QUERY_BUDGET_STRICT=1`` (for tests) an exceeded budget raises
+``QueryBudgetExceeded`` at the end of the unit instead of only logging.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+from metrics import registry
+
+logger = logging.getLogger("querylog")
+
+DEFAULT_BUDGET = {
+    "ops": int(os.environ.get('QUERY_BUDGET_OPS', 20)),
+    "ms": float(os.environ.get('QUERY_BUDGET_MS', 500)),
+}
+BUDGETS = json.loads(os.environ.get('QUERY_BUDGETS', '{}'))
+STRICT = os.environ.get('QUERY_BUDGET_STRICT', '0') == '1'
+EXPLAIN = os.environ.get('QUERY_LOG_EXPLAIN', '0') == '1'
+MAX_COMMANDS = 50
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Fields the driver adds that explain does not accept
+DRIVER_FIELDS = {"$db", "lsid", "$clusterTime", "$readPreference", "txnNumber", "maxTimeMS", "cursor"}
+
+current_unit = ContextVar("query_unit", default=None)
+recent_slow = deque(maxlen=100)
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+def query_budget(ops: int = None, ms: float = None):
+    """Declare a route's Mongo budget; read by the API middleware"""
+    def decorate(endpoint):
+        endpoint.query_budget = {k: v for k, v in {"ops": ops, "ms": ms}.items() if v is not None}
+        return endpoint
+    return decorate
+
+def budget_for(name: str, declared: dict = None) -> dict:
+    return {**DEFAULT_BUDGET, **(declared or {}), **BUDGETS.get(name, {})}
+
+def shape(value, depth: int = 0):
+    """Structure of a filter or pipeline without its values"""
+    if depth > 6:
+        return "…"
+    if isinstance(value, dict):
+        return {key: shape(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Operators like $in only need one example element
+        return [shape(value[0], depth + 1)] if value else []
+    return "?"
+
+def command_shape(command_name: str, command: dict) -> dict:
+    out = {"cmd": command_name, "coll": command.get(command_name)}
+    for field in ("filter", "query", "pipeline", "sort", "q", "update"):
+        if field in command:
+            out[field] = shape(command[field])
+    for field in ("updates", "deletes"):
+        if command.get(field):
+            out[field] = shape({k: v for k, v in command[field][0].items() if k in ("q", "u")})
+    return out
+
+class Unit:
+    __slots__ = ("name", "budget", "started", "ops", "mongo_ms", "commands", "pending", "finished", "_lock")
+
+    def __init__(self, name: str, budget: dict = None):
+        self.name = name
+        self.budget = budget or budget_for(name)
+        self.started = time.perf_counter()
+        self.ops = 0
+        self.mongo_ms = 0.0
+        self.commands = []
+        self.pending = {}
+        self.finished = False
+        self._lock = threading.Lock()
+
+    @property
+    def wall_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+class QueryMonitor(monitoring.CommandListener):
+    def started(self, event):
+        unit = current_unit.get()
+        if unit is None or unit.finished:
+            registry.inc("mongo.untagged")
+            return
+        raw = dict(event.command) if EXPLAIN and event.command_name in EXPLAINABLE else None
+        with unit._lock:
+            unit.ops += 1
+            unit.pending[event.request_id] = (command_shape(event.command_name, event.command), raw, event.database_name)
+
+    def _finish(self, event, failed: bool):
+        ms = event.duration_micros / 1000
+        registry.observe("mongo.command_ms", ms)
+        unit = current_unit.get()
+        if unit is None:
+            return
+        with unit._lock:
+            pending = unit.pending.pop(event.request_id, None)
+            if pending is None:
+                return
+            unit.mongo_ms += ms
+            registry.observe("mongo.unit_command_ms", ms)
+            if len(unit.commands) < MAX_COMMANDS:
+                unit.commands.append({**pending[0], "ms": round(ms, 2), "failed": failed,
+                                      "_raw": pending[1], "_db": pending[2]})
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        registry.inc("mongo.failed")
+        self._finish(event, failed=True)
+
+_monitor = None
+explain_client = None
+
+def install(client=None):
+    """Register the listener process-wide; call before creating Mongo clients.
+
+    ``client`` is used to run ``explain`` for slow units when enabled.
+    """
+    global _monitor, explain_client
+    if _monitor is None:
+        _monitor = QueryMonitor()
+        monitoring.register(_monitor)
+    if client is not None:
+        explain_client = client
+
+async def _explain(entry: dict, command: dict):
+    if explain_client is None:
+        return
+    db_name = command.pop("_db")
+    raw = {k: v for k, v in command.pop("_raw").items() if k not in DRIVER_FIELDS}
+    try:
+        plan = await explain_client[db_name].command("explain", raw, verbosity="queryPlanner")
+        entry["explain"] = plan.get("queryPlanner", {}).get("winningPlan", plan)
+    except Exception as e:
+        entry["explain"] = {"error": str(e)}
+    logger.warning(json.dumps({"slow_unit_explain": entry["unit"], "explain": entry["explain"]}, default=str))
+
+def _report(unit: Unit):
+    wall_ms = unit.wall_ms
+    registry.observe("mongo.unit_ops", unit.ops)
+    over_ops = unit.ops > unit.budget["ops"]
+    over_ms = wall_ms > unit.budget["ms"]
+    if not (over_ops or over_ms):
+        return
+    registry.inc("querylog.slow")
+    entry = {
+        "unit": unit.name,
+        "ops": unit.ops,
+        "wall_ms": round(wall_ms, 1),
+        "mongo_ms": round(unit.mongo_ms, 1),
+        "budget": unit.budget,
+        "exceeded": [k for k, over in (("ops", over_ops), ("ms", over_ms)) if over],
+        "commands": [{k: v for k, v in c.items() if not k.startswith("_")} for c in unit.commands],
+    }
+    recent_slow.append(entry)
+    logger.warning(json.dumps(entry, default=str, ensure_ascii=False))
+    if EXPLAIN:
+        candidates = [c for c in unit.commands if c.get("_raw")]
+        if candidates:
+            slowest = max(candidates, key=lambda c: c["ms"])
+            asyncio.get_running_loop().create_task(_explain(entry, dict(slowest)))
+    if STRICT:
+        raise QueryBudgetExceeded(f"{unit.name}: {unit.ops} ops / {wall_ms:.0f} ms over budget {unit.budget}")
+
+@contextmanager
+def unit_of_work(name: str, budget: dict = None):
+    unit = Unit(name, budget)
+    token = current_unit.set(unit)
+    failed = False
+    try:
+        yield unit
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        unit.finished = True
+        current_unit.reset(token)
+        # An error already propagating is more useful than a budget report
+        if not (failed and STRICT):
+            _report(unit)
+
+def name_unit(name: str, declared: dict = None):
+    """Rename the current unit once the handler is known and pick up its budget"""
+    unit = current_unit.get()
+    if unit is not None:
+        unit.name = name
+        unit.budget = budget_for(name, declared)
@@ -0,0 +1,254 @@
+"""Precomputed MFO ranking with per-segment orderings.
+
+A score combines the offer itself (``interest_rate``, ``approval_rate``) with
+what users did with it over the last ``RANKING_WINDOW_DAYS`` (click-through:
+apply flows started per view, conversion: applications submitted per view,
+both from ``funnel_daily``) and how well its amount and term ranges fit the
+user's segment.
+
+Segments bucket the amount and term a user asked for in recent applications
+(``"m-w"`` is 5-15k for up to a week); users without history are in
+``default``. The segment is stored on ``bot_users`` when they apply.
+
+``refresh_rankings`` is the background job (``ranking_refresh`` in scheduler.py). Per-MFO components live in
+``mfo_scores`` and are only recomputed for MFOs whose funnel counters or
+offer fields changed since the previous run. The orderings for every segment
+are then rebuilt from the stored components into ``ranking_orders``, one
+document per segment, which is all a reader needs.
+
+Usage::
+
+    python ranking.py refresh [--full]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT = "default"
+WINDOW_DAYS = int(os.environ.get('RANKING_WINDOW_DAYS', 30))
+REFRESH_INTERVAL = float(os.environ.get('RANKING_REFRESH_INTERVAL', 300))
+HISTORY_SIZE = 5
+# Views worth of prior pulling sparse MFOs towards the global rates
+SMOOTHING = 50
+
+DEFAULT_WEIGHTS = {"rate": 0.35, "approval": 0.25, "ctr": 0.15, "conversion": 0.25, "fit": 0.3}
+WEIGHTS = {**DEFAULT_WEIGHTS, **json.loads(os.environ.get('RANKING_WEIGHTS', '{}'))}
+
+# (upper bound, key, representative value); the last bucket is open-ended
+AMOUNT_BUCKETS = [(5000, "s", 3000), (15000, "m", 10000), (30000, "l", 22500), (None, "xl", 50000)]
+TERM_BUCKETS = [(7, "w", 7), (30, "m", 21), (None, "y", 60)]
+
+OFFER_FIELDS = ["interest_rate", "approval_rate", "min_amount", "max_amount", "min_term", "max_term"]
+
+def _bucket(buckets, value):
+    for upper, key, _ in buckets:
+        if upper is None or value <= upper:
+            return key
+
+def segment_for(amount, term) -> str:
+    if not amount or not term:
+        return DEFAULT_SEGMENT
+    return f"{_bucket(AMOUNT_BUCKETS, amount)}-{_bucket(TERM_BUCKETS, term)}"
+
+def all_segments() -> list:
+    return [DEFAULT_SEGMENT] + [f"{a}-{t}" for _, a, _ in AMOUNT_BUCKETS for _, t, _ in TERM_BUCKETS]
+
+def _representative(segment: str):
+    amount_key, term_key = segment.split("-")
+    amount = next(value for _, key, value in AMOUNT_BUCKETS if key == amount_key)
+    term = next(value for _, key, value in TERM_BUCKETS if key == term_key)
+    return amount, term
+
+def _offer_hash(mfo: dict) -> str:
+    return hashlib.sha1(json.dumps([mfo.get(f) for f in OFFER_FIELDS], default=str).encode()).hexdigest()
+
+# ==================== USER SEGMENTS ====================
+
+def segment_of_history(apps: list) -> str:
+    """Segment of the median amount and term of ``apps`` (newest first)"""
+    amounts = sorted(app["amount"] for app in apps)
+    terms = sorted(app["term"] for app in apps)
+    return segment_for(amounts[len(amounts) // 2], terms[len(terms) // 2])
+
+async def update_user_segment(db, telegram_id: int) -> str:
+    """Recompute a user's segment from the median of their recent applications"""
+    apps = await db.applications.find(
+        {"user_telegram_id": telegram_id}, {"_id": 0, "amount": 1, "term": 1}
+    ).sort("created_at", -1).limit(HISTORY_SIZE).to_list(HISTORY_SIZE)
+    if not apps:
+        return DEFAULT_SEGMENT
+    segment = segment_of_history(apps)
+    await db.bot_users.update_one({"telegram_id": telegram_id}, {"$set": {"segment": segment}})
+    return segment
+
+async def ensure_ranking_indexes(db):
+    await db.applications.create_index([("user_telegram_id", 1), ("created_at", -1)])
+    await db.funnel_daily.create_index([("updated_at", 1)])
+
+# ==================== REFRESH JOB ====================
+
+async def _funnel_totals(db, since: datetime, mfo_ids=None) -> dict:
+    match = {"day": {"$gte": since}}
+    if mfo_ids is not None:
+        match["mfo_id"] = {"$in": list(mfo_ids)}
+    rows = await db.funnel_daily.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$mfo_id",
+                    "views": {"$sum": {"$ifNull": ["$views", 0]}},
+                    "started": {"$sum": {"$ifNull": ["$started", 0]}},
+                    "submitted": {"$sum": {"$ifNull": ["$submitted", 0]}}}}
+    ]).to_list(None)
+    return {row["_id"]: row for row in rows}
+
+async def _refresh_components(db, full: bool, now: datetime) -> int:
+    """Recompute ``mfo_scores`` for MFOs that changed; returns how many were updated"""
+    state = await db.ranking_state.find_one({"_id": "scores"}) or {}
+    # Days sliding out of the window change every MFO, so recompute all once a day
+    full = full or state.get("full_at") is None or state["full_at"] < now - timedelta(days=1)
+    checkpoint = None if full else state.get("checkpoint")
+    since = now - timedelta(days=WINDOW_DAYS)
+
+    mfos = await db.mfos.find({"is_active": True}, {"_id": 0, "id": 1, **{f: 1 for f in OFFER_FIELDS}}).to_list(None)
+    stored = {doc["_id"]: doc for doc in await db.mfo_scores.find({}, {"offer_hash": 1}).to_list(None)}
+
+    dirty = set()
+    for mfo in mfos:
+        if mfo["id"] not in stored or stored[mfo["id"]].get("offer_hash") != _offer_hash(mfo):
+            dirty.add(mfo["id"])
+    if checkpoint is None:
+        dirty = {mfo["id"] for mfo in mfos}
+    else:
+        dirty |= set(await db.funnel_daily.distinct("mfo_id", {"updated_at": {"$gt": checkpoint}}))
+
+    active = {mfo["id"] for mfo in mfos}
+    removed = set(stored) - active
+    if removed:
+        await db.mfo_scores.delete_many({"_id": {"$in": list(removed)}})
+
+    dirty &= active
+    if dirty:
+        totals = await _funnel_totals(db, since, dirty)
+        requests = []
+        for mfo in mfos:
+            if mfo["id"] not in dirty:
+                continue
+            row = totals.get(mfo["id"], {})
+            requests.append(UpdateOne({"_id": mfo["id"]}, {"$set": {
+                **{f: mfo.get(f) for f in OFFER_FIELDS},
+                "views": row.get("views", 0),
+                "started": row.get("started", 0),
+                "submitted": row.get("submitted", 0),
+                "offer_hash": _offer_hash(mfo),
+                "updated_at": now,
+            }}, upsert=True))
+        await db.mfo_scores.bulk_write(requests, ordered=False)
+
+    marks = {"checkpoint": now, **({"full_at": now} if full else {})}
+    await db.ranking_state.update_one({"_id": "scores"}, {"$set": marks}, upsert=True)
+    return len(dirty) + len(removed)
+
+def score_components(rows: list) -> dict:
+    """Base score per MFO in [0, 1] from stored components"""
+    if not rows:
+        return {}
+    views = sum(row["views"] for row in rows)
+    prior_ctr = sum(row["started"] for row in rows) / views if views else 0.0
+    prior_conversion = sum(row["submitted"] for row in rows) / views if views else 0.0
+
+    rates = [row["interest_rate"] or 0 for row in rows]
+    low, high = min(rates), max(rates)
+    ctr = {row["_id"]: (row["started"] + SMOOTHING * prior_ctr) / (row["views"] + SMOOTHING) for row in rows}
+    conversion = {row["_id"]: (row["submitted"] + SMOOTHING * prior_conversion) / (row["views"] + SMOOTHING)
+                  for row in rows}
+    top_ctr = max(ctr.values()) or 1.0
+    top_conversion = max(conversion.values()) or 1.0
+
+    scores = {}
+    for row in rows:
+        rate = 1.0 if high == low else 1 - ((row["interest_rate"] or 0) - low) / (high - low)
+        scores[row["_id"]] = (
+            WEIGHTS["rate"] * rate
+            + WEIGHTS["approval"] * (row["approval_rate"] or 0) / 100
+            + WEIGHTS["ctr"] * ctr[row["_id"]] / top_ctr
+            + WEIGHTS["conversion"] * conversion[row["_id"]] / top_conversion
+        )
+    return scores
+
+def _fit(row: dict, amount: int, term: int) -> float:
+    amount_fit = (row["min_amount"] or 0) <= amount <= (row["max_amount"] or 0)
+    term_fit = (row["min_term"] or 0) <= term <= (row["max_term"] or 0)
+    return (amount_fit + term_fit) / 2
+
+def segment_orderings(rows: list) -> dict:
+    """Ordered MFO ids for every segment"""
+    base = score_components(rows)
+    orders = {DEFAULT_SEGMENT: sorted(base, key=lambda mfo_id: -base[mfo_id])}
+    for segment in all_segments()[1:]:
+        amount, term = _representative(segment)
+        scored = {row["_id"]: base[row["_id"]] + WEIGHTS["fit"] * _fit(row, amount, term) for row in rows}
+        orders[segment] = sorted(scored, key=lambda mfo_id: -scored[mfo_id])
+    return orders
+
+async def refresh_rankings(db, full: bool = False) -> dict:
+    """Refresh changed components, then rebuild the per-segment orderings"""
+    now = datetime.now(timezone.utc)
+    changed = await _refresh_components(db, full, now)
+    if not changed and not full and await db.ranking_orders.estimated_document_count():
+        return {"changed": 0, "segments": 0}
+    rows = await db.mfo_scores.find({}).to_list(None)
+    orders = segment_orderings(rows)
+    await db.ranking_orders.bulk_write([
+        UpdateOne({"_id": segment}, {"$set": {"mfo_ids": mfo_ids, "computed_at": now}}, upsert=True)
+        for segment, mfo_ids in orders.items()
+    ], ordered=False)
+    logger.info(f"Rankings refreshed: {changed} MFOs changed, {len(orders)} segments")
+    return {"changed": changed, "segments": len(orders)}
+
+# ==================== READERS ====================
+
+class Ranking:
+    """Cached per-segment orderings from ``ranking_orders``, read through a ``storage.BotStore``"""
+
+    def __init__(self, store, ttl: float = float(os.environ.get('RANKING_CACHE_TTL', 60))):
+        self.store = store
+        self.cache = TTLCache(ttl)
+
+    async def order(self, segment: str = DEFAULT_SEGMENT) -> list:
+        async def load():
+            mfo_ids = await self.store.ranking_order(segment)
+            if mfo_ids is None and segment != DEFAULT_SEGMENT:
+                mfo_ids = await self.store.ranking_order(DEFAULT_SEGMENT)
+            return mfo_ids or []
+        return await self.cache.get(segment, load)
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        await ensure_ranking_indexes(db)
+        print(json.dumps(await refresh_rankings(db, full=args.full)))
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="MFO ranking maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    refresh = sub.add_parser("refresh", help="Recompute scores and segment orderings")
+    refresh.add_argument("--full", action="store_true", help="Recompute every MFO")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,131 @@
+"""Token-bucket rate limiting for public endpoints and bot handlers.
+
+Every limit is a bucket of ``capacity`` tokens refilled at ``rate`` tokens
+per second, keyed per client (IP address or telegram id). Buckets live in
+process memory, which is the fast path: a request rejected locally never
+touches Mongo. With ``RATE_LIMIT_SHARED=1`` a request that passes locally is
+also charged against a bucket document in ``rate_limits`` that all API and
+bot processes share, so the limit holds across a multi-process deployment.
+
+Limits are configured per route or handler in ``DEFAULT_LIMITS`` and can be
+overridden with ``RATE_LIMITS`` (JSON, e.g. ``{"applications_create":
+{"capacity": 3, "rate": 0.05}}``).
+"""
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+
+from metrics import registry
+
+DEFAULT_LIMITS = {
+    "public_mfos": {"capacity": 30, "rate": 5.0},
+    "mfo_click": {"capacity": 20, "rate": 1.0},
+    "applications_create": {"capacity": 5, "rate": 0.05},
+    "bot_message": {"capacity": 10, "rate": 1.0},
+}
+
+SHARED = os.environ.get('RATE_LIMIT_SHARED', '0') == '1'
+MAX_LOCAL_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+
+@dataclass
+class Limit:
+    capacity: float
+    rate: float
+
+def load_limits() -> dict:
+    """Default limits merged with RATE_LIMITS overrides"""
+    limits = {name: dict(value) for name, value in DEFAULT_LIMITS.items()}
+    for name, override in json.loads(os.environ.get('RATE_LIMITS', '{}')).items():
+        limits.setdefault(name, {}).update(override)
+    return {name: Limit(**value) for name, value in limits.items()}
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, limit: Limit, now: float):
+        """Consume one token; returns ``(allowed, retry_after_seconds)``"""
+        self.tokens = min(limit.capacity, self.tokens + (now - self.updated) * limit.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / limit.rate
+
+class MongoBucketStore:
+    """Shared buckets in ``rate_limits``, updated atomically with a pipeline update"""
+
+    def __init__(self, db):
+        self.collection = db.rate_limits
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def take(self, name: str, key, limit: Limit, now: float):
+        # Idle buckets are refilled by then, so they can expire
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=limit.capacity / limit.rate + 60)
+        refilled = {"$min": [limit.capacity, {"$add": [
+            {"$ifNull": ["$tokens", limit.capacity]},
+            {"$multiply": [{"$max": [0, {"$subtract": [now, {"$ifNull": ["$ts", now]}]}]}, limit.rate]}
+        ]}]}
+        doc = await self.collection.find_one_and_update(
+            {"_id": f"{name}:{key}"},
+            [
+                {"$set": {"tokens": refilled, "ts": now, "expires_at": expires_at}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if doc["allowed"]:
+            return True, 0.0
+        return False, (1 - doc["tokens"]) / limit.rate
+
+class RateLimiter:
+    """Per-key token buckets for one named limit"""
+
+    def __init__(self, name: str, limit: Limit, store: MongoBucketStore = None):
+        self.name = name
+        self.limit = limit
+        self.store = store
+        self._buckets = OrderedDict()
+
+    async def hit(self, key):
+        """Charge one request to ``key``; returns ``(allowed, retry_after_seconds)``"""
+        now = time.time()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.limit.capacity, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > MAX_LOCAL_KEYS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        allowed, retry_after = bucket.take(self.limit, now)
+        if allowed and self.store is not None:
+            allowed, retry_after = await self.store.take(self.name, key, self.limit, now)
+
+        if allowed:
+            registry.inc(f"ratelimit.{self.name}.allowed")
+        else:
+            registry.inc(f"ratelimit.{self.name}.rejected")
+        return allowed, retry_after
+
+def build_limiters(db=None) -> dict:
+    """One limiter per configured limit, sharing Mongo state when enabled"""
+    store = MongoBucketStore(db) if SHARED and db is not None else None
+    return {name: RateLimiter(name, limit, store) for name, limit in load_limits().items()}
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
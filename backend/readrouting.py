@@ -0,0 +1,83 @@
+"""Routing of analytics, export and reporting reads away from the primary.
+
+``ReadRouter`` owns a second Motor client with its own (smaller) connection
+pool. Its database handle carries the configured read preference, so the
+dashboard's counts and ``$group`` pipelines go to secondaries and do not
+queue behind the bot's writes on the primary. Configuration:
+
+* ``ANALYTICS_MONGO_URL``: connection string, defaults to ``MONGO_URL``
+* ``ANALYTICS_READ_PREFERENCE``: ``primary``, ``primaryPreferred``,
+  ``secondary``, ``secondaryPreferred`` (default) or ``nearest``
+* ``ANALYTICS_MAX_STALENESS``: seconds a secondary may lag before it is
+  skipped (MongoDB requires at least 90; ``-1`` disables the check)
+* ``ANALYTICS_POOL_SIZE``: connection pool size for this client
+* ``ANALYTICS_BUDGETS``: JSON overrides of ``DEFAULT_BUDGETS`` (milliseconds)
+
+Each workload runs inside ``budget(name)``, a pymongo client-side timeout
+from which the driver derives ``maxTimeMS`` for every command it sends, so a
+runaway report is killed on the server instead of holding a connection.
+Aggregations routed here should pass ``allowDiskUse=True``.
+
+Against a standalone server the read preference is ignored and everything
+reads from that server. To check routing locally, start a single-host
+replica set (``mongod --replSet rs0`` then ``rs.initiate()``) and use
+``mongodb://localhost:27017/?replicaSet=rs0``; ``tests/test_read_routing.py``
+checks the commands this module sends.
+"""
+import json
+import os
+
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+
+DEFAULT_BUDGETS = {
+    "stats": 5000,
+    "analytics": 10000,
+    "report": 15000,
+    "export": 60000,
+}
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def make_read_preference(mode: str, max_staleness: int = -1):
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {mode}")
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+class ReadRouter:
+    """Separate client and read-routed database for heavy reads"""
+
+    def __init__(self, url: str, db_name: str, mode: str = "secondaryPreferred", max_staleness: int = 90,
+                 pool_size: int = 10, budgets: dict = None, **client_options):
+        self.client = AsyncIOMotorClient(url, tz_aware=True, maxPoolSize=pool_size, appname="analytics",
+                                         **client_options)
+        self.read_preference = make_read_preference(mode, max_staleness)
+        self.db = self.client.get_database(db_name, read_preference=self.read_preference)
+        self.budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+
+    def budget(self, name: str):
+        """Context manager bounding every command inside it by the named budget"""
+        return pymongo.timeout(self.budgets[name] / 1000)
+
+    def close(self):
+        self.client.close()
+
+def router_from_env(**client_options) -> ReadRouter:
+    return ReadRouter(
+        os.environ.get('ANALYTICS_MONGO_URL') or os.environ['MONGO_URL'],
+        os.environ['DB_NAME'],
+        mode=os.environ.get('ANALYTICS_READ_PREFERENCE', 'secondaryPreferred'),
+        max_staleness=int(os.environ.get('ANALYTICS_MAX_STALENESS', 90)),
+        pool_size=int(os.environ.get('ANALYTICS_POOL_SIZE', 10)),
+        budgets=json.loads(os.environ.get('ANALYTICS_BUDGETS', '{}')),
+        **client_options
+    )
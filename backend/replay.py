@@ -0,0 +1,305 @@
+"""Record live bot updates and replay them against the real handlers.
+
+Recording: with ``BOT_RECORD_PATH`` set, ``telegram_bot.register_handlers``
+adds a ``TypeHandler`` that appends every incoming update to that file. The
+file is gzip-compressed JSON lines, one ``{"t": epoch seconds, "update":
+{...}}`` per update, written in appended gzip members so it stays valid
+across restarts. ``BOT_RECORD_ANONYMIZE=1`` replaces user and chat ids with
+keyed hashes (stable within a recording, so conversations still line up),
+drops names and usernames and zeroes shared contacts and phone numbers in
+message texts and captions, formatted ones included.
+
+Replay feeds a recording through the same handler set with a fake ``Bot``
+whose requests never leave the process, against the MongoDB in ``.env`` (or
+``--db``; use a scratch database, handlers write to it). Updates run one at a
+time at the recorded pace, N times faster, or back to back, and the report
+has throughput, latency percentiles per handler and MongoDB commands per
+update.
+
+Usage::
+
+    python replay.py run recording.jsonl.gz [--speed 1|10|max] [--db replay] [--no-rate-limits]
+"""
+import argparse
+import asyncio
+import contextvars
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+FLUSH_EVERY = 100
+FLUSH_INTERVAL = 5.0
+IDENTITY_KEYS = ("from", "chat", "user", "sender_chat", "contact")
+NAME_FIELDS = ("first_name", "last_name", "username", "title")
+TEXT_FIELDS = ("text", "caption")
+# Seven or more digits, allowing the separators people type into phone numbers
+PHONE = re.compile(r"\+?\d(?:[\s().-]{0,2}\d){6,}")
+
+# ==================== RECORDING ====================
+
+def _zero_digits(value: str) -> str:
+    return re.sub(r"\d", "0", value)
+
+class Anonymizer:
+    def __init__(self, salt: str):
+        self.key = salt.encode()
+
+    def pseudonym(self, value: int) -> int:
+        digest = hmac.new(self.key, str(value).encode(), hashlib.sha256).digest()
+        # Six bytes keep ids positive and within what Telegram (and JSON) allow
+        return int.from_bytes(digest[:6], "big")
+
+    def scrub(self, payload):
+        if isinstance(payload, list):
+            return [self.scrub(item) for item in payload]
+        if not isinstance(payload, dict):
+            return payload
+        out = {}
+        for key, value in payload.items():
+            if key in IDENTITY_KEYS and isinstance(value, dict):
+                value = dict(value)
+                for field in ("id", "user_id"):
+                    if field in value:
+                        value[field] = self.pseudonym(value[field])
+                for name in NAME_FIELDS:
+                    if name in value:
+                        value[name] = "user"
+                out[key] = self.scrub(value)
+            elif key == "phone_number" and isinstance(value, str):
+                out[key] = _zero_digits(value)
+            elif key in TEXT_FIELDS and isinstance(value, str):
+                # Same length, so entity offsets still line up
+                out[key] = PHONE.sub(lambda m: _zero_digits(m.group()), value)
+            else:
+                out[key] = self.scrub(value)
+        return out
+
+class UpdateRecorder:
+    """Append incoming updates to a gzip JSON-lines recording"""
+
+    def __init__(self, path, anonymize: bool = False, salt: str = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.anonymizer = Anonymizer(salt or os.urandom(16).hex()) if anonymize else None
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        # Keeps background appends in the order they were taken
+        self._writing = asyncio.Lock()
+        self.recorded = 0
+
+    async def handle(self, update, context):
+        payload = update.to_dict()
+        if self.anonymizer is not None:
+            payload = self.anonymizer.scrub(payload)
+        self._buffer.append(json.dumps({"t": round(time.time(), 3), "update": payload},
+                                       separators=(",", ":"), ensure_ascii=False))
+        self.recorded += 1
+        if len(self._buffer) >= FLUSH_EVERY or time.monotonic() - self._last_flush > FLUSH_INTERVAL:
+            lines = self._take()
+            # Compression and the file append would otherwise stall the event loop
+            async with self._writing:
+                await asyncio.to_thread(self._append, lines)
+
+    def flush(self):
+        """Write out the buffer in the calling thread, e.g. at shutdown"""
+        self._append(self._take())
+
+    def _take(self) -> list:
+        lines, self._buffer = self._buffer, []
+        self._last_flush = time.monotonic()
+        return lines
+
+    def _append(self, lines: list):
+        if lines:
+            with open(self.path, "ab") as f:
+                f.write(gzip.compress(("\n".join(lines) + "\n").encode()))
+
+def recorder_from_env():
+    path = os.environ.get('BOT_RECORD_PATH')
+    if not path:
+        return None
+    return UpdateRecorder(path, anonymize=os.environ.get('BOT_RECORD_ANONYMIZE', '0') == '1',
+                          salt=os.environ.get('BOT_RECORD_SALT'))
+
+def read_recording(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+# ==================== FAKE TELEGRAM ====================
+
+def _fake_request_class():
+    from telegram.request import BaseRequest
+
+    class FakeRequest(BaseRequest):
+        """Answers Bot API calls locally with minimal valid results"""
+
+        def __init__(self):
+            self.calls = Counter()
+            self._message_id = 0
+
+        @property
+        def read_timeout(self):
+            return None
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None,
+                             write_timeout=None, connect_timeout=None, pool_timeout=None):
+            name = url.rsplit("/", 1)[-1]
+            self.calls[name] += 1
+            params = request_data.parameters if request_data else {}
+            if name == "getMe":
+                result = {"id": 1, "is_bot": True, "first_name": "Replay", "username": "replay_bot"}
+            elif name in ("sendMessage", "editMessageText"):
+                self._message_id += 1
+                result = {"message_id": params.get("message_id", self._message_id), "date": int(time.time()),
+                          "chat": {"id": params.get("chat_id", 0), "type": "private"},
+                          "text": params.get("text", "")}
+            else:
+                result = True
+            return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    return FakeRequest
+
+# ==================== REPLAY ====================
+
+current_update = contextvars.ContextVar("current_update", default=None)
+
+def _command_counter():
+    from pymongo import monitoring
+
+    class CommandCounter(monitoring.CommandListener):
+        """Counts commands issued while an update is being replayed"""
+
+        def __init__(self):
+            self.by_command = Counter()
+
+        def started(self, event):
+            counts = current_update.get()
+            if counts is not None:
+                counts[event.command_name] += 1
+                self.by_command[event.command_name] += 1
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    return CommandCounter()
+
+def route_of(router, update) -> str:
+    if update.callback_query is not None:
+        resolved = router.resolve(update.callback_query.data)
+        return resolved[0] if resolved else "unrouted"
+    if update.message is not None and (update.message.text or "").startswith("/start"):
+        return "start_command"
+    if update.message is not None:
+        return "handle_message"
+    return "other"
+
+async def replay(path, speed: float = None):
+    """Replay a recording; ``speed`` None runs updates back to back"""
+    from pymongo import monitoring
+
+    counter = _command_counter()
+    # Registered before telegram_bot creates its client
+    monitoring.register(counter)
+
+    from telegram import Update
+    from telegram.ext import Application
+    from metrics import Histogram
+    import telegram_bot
+
+    request = _fake_request_class()()
+    application = Application.builder().token(telegram_bot.TELEGRAM_TOKEN) \
+        .application_class(telegram_bot.BotApplication).request(request) \
+        .get_updates_request(_fake_request_class()()).updater(None).build()
+    telegram_bot.register_handlers(application)
+    router = telegram_bot.build_router()
+
+    errors = Counter()
+
+    async def count_error(update, context):
+        errors[type(context.error).__name__] += 1
+
+    application.add_error_handler(count_error)
+
+    latencies = {}
+    mongo_ops = []
+    updates = 0
+    async with application:
+        started = time.perf_counter()
+        first_t = None
+        for record in read_recording(path):
+            if speed is not None:
+                first_t = record["t"] if first_t is None else first_t
+                delay = (record["t"] - first_t) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = Update.de_json(record["update"], application.bot)
+            counts = Counter()
+            token = current_update.set(counts)
+            update_started = time.perf_counter()
+            try:
+                await application.process_update(update)
+            finally:
+                current_update.reset(token)
+            latencies.setdefault(route_of(router, update), Histogram()).observe(
+                (time.perf_counter() - update_started) * 1000)
+            mongo_ops.append(sum(counts.values()))
+            updates += 1
+        elapsed = time.perf_counter() - started
+
+    return {
+        "updates": updates,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(updates / elapsed, 1) if elapsed else 0.0,
+        "handlers_ms": {route: histogram.summary() for route, histogram in sorted(latencies.items())},
+        "mongo_ops_per_update": {
+            "mean": round(sum(mongo_ops) / len(mongo_ops), 2) if mongo_ops else 0.0,
+            "max": max(mongo_ops, default=0),
+            "by_command": dict(counter.by_command.most_common()),
+        },
+        "bot_api_calls": dict(request.calls.most_common()),
+        "errors": dict(errors),
+    }
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Replay recorded bot updates")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="Replay a recording against local MongoDB")
+    run_parser.add_argument("path")
+    run_parser.add_argument("--speed", default="max", help="1 for recorded pace, N for N times faster, max")
+    run_parser.add_argument("--db", help="Database name to use instead of DB_NAME")
+    run_parser.add_argument("--no-rate-limits", action="store_true", help="Disable the bot_message limit")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    # Configure telegram_bot before it is imported
+    os.environ.pop('BOT_RECORD_PATH', None)
+    os.environ['TELEGRAM_TOKEN'] = "0:replay"
+    if args.db:
+        os.environ['DB_NAME'] = args.db
+    if args.no_rate_limits:
+        os.environ['RATE_LIMITS'] = json.dumps({"bot_message": {"capacity": 1e9, "rate": 1e9}})
+    speed = None if args.speed == "max" else float(args.speed)
+    print(json.dumps(asyncio.run(replay(args.path, speed)), indent=2, ensure_ascii=False))
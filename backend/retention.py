@@ -0,0 +1,202 @@
+"""Retention and archival for collections that only ever grow.
+
+Each policy selects documents older than ``max_age_days`` on ``age_field``.
+Matching documents are streamed in chunks, optionally folded into aggregate
+counters (click buckets become per-MFO daily ``click_rollups``), appended to a
+gzip-compressed JSON-lines archive on local disk and then deleted in bounded
+batches with a pause in between so the primary is never hammered.
+
+Policies can be overridden with the ``RETENTION_POLICIES`` environment variable
+(a JSON object keyed by policy name, merged over ``DEFAULT_POLICIES``).
+
+Usage::
+
+    python retention.py [--dry-run] [--policy clicks] [--policy applications]
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+from bson import json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+ROOT_DIR = Path(__file__).parent
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICIES = {
+    "clicks": {
+        "collection": "click_buckets",
+        "age_field": "hour",
+        "max_age_days": 90,
+        "rollup": "clicks",
+        "archive": True,
+    },
+    "applications": {
+        "collection": "applications",
+        "age_field": "created_at",
+        "max_age_days": 365,
+        "filter": {"status": {"$ne": "pending"}},
+        "archive": True,
+    },
+}
+
+DUPLICATE_KEY = 11000
+ARCHIVE_DIR = Path(os.environ.get('ARCHIVE_DIR', ROOT_DIR / 'archive'))
+CHUNK_SIZE = int(os.environ.get('RETENTION_CHUNK_SIZE', 1000))
+DELETE_BATCH_SIZE = int(os.environ.get('RETENTION_DELETE_BATCH', 500))
+DELETE_PAUSE = float(os.environ.get('RETENTION_DELETE_PAUSE', 0.2))
+
+def load_policies() -> dict:
+    """Default policies merged with RETENTION_POLICIES overrides"""
+    policies = {name: dict(policy) for name, policy in DEFAULT_POLICIES.items()}
+    for name, override in json.loads(os.environ.get('RETENTION_POLICIES', '{}')).items():
+        policies.setdefault(name, {}).update(override)
+    return policies
+
+def _policy_filter(policy: dict, now: datetime) -> dict:
+    cutoff = now - timedelta(days=policy["max_age_days"])
+    return {**policy.get("filter", {}), policy["age_field"]: {"$lt": cutoff}}
+
+async def ensure_retention_indexes(db, policies: dict = None):
+    """Index the age field of every policy and the rollup key"""
+    for policy in (policies or load_policies()).values():
+        await db[policy["collection"]].create_index([(policy["age_field"], 1)])
+    await db.click_rollups.create_index([("mfo_id", 1), ("day", 1)], unique=True)
+
+# ==================== ROLLUPS ====================
+
+async def _rollup_clicks(db, docs: list):
+    """Fold click buckets into per-MFO daily counters.
+
+    Each rollup keeps the ids of the buckets folded into it and a bucket
+    is added only if its id is not there yet, so a run interrupted before
+    the buckets were deleted does not fold them twice.
+    """
+    # Buckets marked by earlier versions were folded already
+    pending = [doc for doc in docs if not doc.get("rolled_up")]
+    if not pending:
+        return
+    requests = [
+        UpdateOne({"mfo_id": doc["mfo_id"], "day": doc["hour"].replace(hour=0), "buckets": {"$ne": doc["_id"]}},
+                  {"$inc": {"count": doc["count"]}, "$push": {"buckets": doc["_id"]}}, upsert=True)
+        for doc in pending
+    ]
+    # The upsert of an already folded bucket hits the unique (mfo_id, day)
+    # index. So does one that raced another upsert creating the day, which
+    # the retry applies now that the document exists.
+    for _ in range(2):
+        try:
+            await db.click_rollups.bulk_write(requests, ordered=False)
+            return
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            requests = [requests[error["index"]] for error in errors]
+
+ROLLUPS = {
+    "clicks": _rollup_clicks,
+}
+
+# ==================== ARCHIVE ====================
+
+class ArchiveWriter:
+    """Append-only gzip JSON-lines archive, one file per collection per day"""
+
+    def __init__(self, collection: str, now: datetime):
+        directory = ARCHIVE_DIR / collection
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"{collection}-{now.strftime('%Y%m%d')}.jsonl.gz"
+
+    def write(self, docs: list):
+        # Every call appends a complete gzip member, which keeps earlier
+        # chunks readable even if a later one is cut short
+        lines = "".join(json_util.dumps(doc) + "\n" for doc in docs)
+        with open(self.path, "ab") as fh:
+            fh.write(gzip.compress(lines.encode()))
+            fh.flush()
+            os.fsync(fh.fileno())
+
+# ==================== RUNNER ====================
+
+async def _delete_in_batches(collection, ids: list):
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        await collection.delete_many({"_id": {"$in": ids[start:start + DELETE_BATCH_SIZE]}})
+        if DELETE_PAUSE:
+            await asyncio.sleep(DELETE_PAUSE)
+
+async def apply_policy(db, name: str, policy: dict, dry_run: bool = False, now: datetime = None) -> dict:
+    """Roll up, archive and delete expired documents for one policy"""
+    now = now or datetime.now(timezone.utc)
+    collection = db[policy["collection"]]
+    query = _policy_filter(policy, now)
+    total = await collection.count_documents(query)
+    report = {"policy": name, "collection": policy["collection"], "matched": total, "processed": 0, "dry_run": dry_run}
+    if dry_run or total == 0:
+        logger.info(f"[{name}] {total} documents older than {policy['max_age_days']} days"
+                    f"{' (dry run)' if dry_run else ''}")
+        return report
+
+    rollup = ROLLUPS.get(policy.get("rollup"))
+    archive = ArchiveWriter(policy["collection"], now) if policy.get("archive") else None
+    started = time.monotonic()
+    while True:
+        # Always re-read from the start: processed chunks are deleted
+        docs = await collection.find(query).sort("_id", 1).limit(CHUNK_SIZE).to_list(CHUNK_SIZE)
+        if not docs:
+            break
+        if rollup:
+            await rollup(db, docs)
+        if archive:
+            # Compression and fsync would otherwise stall the event loop
+            await asyncio.to_thread(archive.write, docs)
+        await _delete_in_batches(collection, [doc["_id"] for doc in docs])
+
+        report["processed"] += len(docs)
+        elapsed = time.monotonic() - started
+        logger.info(f"[{name}] {report['processed']}/{total} "
+                    f"({report['processed'] / max(elapsed, 1e-6):.0f} docs/s)")
+
+    if archive:
+        report["archive"] = str(archive.path)
+    return report
+
+async def run_retention(db, names: list = None, dry_run: bool = False) -> list:
+    """Apply the selected (default: all) retention policies"""
+    policies = load_policies()
+    reports = []
+    for name, policy in policies.items():
+        if names and name not in names:
+            continue
+        reports.append(await apply_policy(db, name, policy, dry_run=dry_run))
+    return reports
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(ROOT_DIR / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        if not args.dry_run:
+            await ensure_retention_indexes(db)
+        for report in await run_retention(db, names=args.policy, dry_run=args.dry_run):
+            print(json.dumps(report))
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Apply retention policies")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be processed")
+    parser.add_argument("--policy", action="append", help="Policy name to run (repeatable)")
+    asyncio.run(_main(parser.parse_args()))
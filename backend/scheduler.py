@@ -0,0 +1,272 @@
+"""Periodic background jobs, each run by exactly one process.
+
+The API and every bot process start a ``Scheduler`` with the same jobs. A
+job runs only while its process holds the job's lease in
+``scheduler_leases``. The lease document also holds ``next_run_at``, so the
+interval is kept across the whole deployment rather than per process. A
+process claims a due job, renews the lease while the job runs, and then
+releases it with the next run time: the interval plus or minus ``jitter``
+(a fraction of it). If the process dies mid-run, another one takes the job
+over once the lease expires.
+
+Every run is recorded in ``scheduler_runs`` (kept for
+``SCHEDULER_HISTORY_DAYS``) with its owner, duration, status and result or
+error, and counted in the ``scheduler.<job>.*`` metrics. ``GET
+/api/scheduler`` shows the leases and recent runs.
+
+Jobs declared with ``exclusive=False`` (local cache refreshes) skip the
+lease and run in every process. The retention job writes archives to local
+disk, so it is declared only where ``RETENTION_JOB=1`` says the archive
+volume is mounted.
+
+Usage::
+
+    scheduler = Scheduler(db)
+    add_maintenance_jobs(scheduler, db)
+    task = asyncio.create_task(scheduler.run())
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('SCHEDULER_ENABLED', '1') == '1'
+DISABLED_JOBS = {name for name in os.environ.get('SCHEDULER_DISABLED_JOBS', '').split(',') if name}
+LEASE_TTL = float(os.environ.get('SCHEDULER_LEASE_TTL', 60))
+POLL_INTERVAL = float(os.environ.get('SCHEDULER_POLL_INTERVAL', 15))
+HISTORY_DAYS = int(os.environ.get('SCHEDULER_HISTORY_DAYS', 14))
+RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', 24 * 3600))
+# Only processes that mount the archive volume (ARCHIVE_DIR) declare retention
+RETENTION_JOB = os.environ.get('RETENTION_JOB', '0') == '1'
+
+class Job:
+    def __init__(self, name: str, fn, interval: float, jitter: float = 0.1, timeout: float = None,
+                 exclusive: bool = True):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.exclusive = exclusive
+
+    def next_delay(self) -> float:
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def describe(self) -> dict:
+        return {"name": self.name, "interval": self.interval, "jitter": self.jitter,
+                "timeout": self.timeout, "exclusive": self.exclusive}
+
+async def ensure_scheduler_indexes(db):
+    await db.scheduler_runs.create_index("started_at", expireAfterSeconds=HISTORY_DAYS * 86400)
+    await db.scheduler_runs.create_index([("job", 1), ("started_at", -1)])
+
+class Scheduler:
+    def __init__(self, db, owner: str = None):
+        self.db = db
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.jobs = {}
+
+    def add(self, name: str, fn, interval: float, **options) -> Job:
+        """Declare ``fn()`` (a coroutine function) to run every ``interval`` seconds"""
+        job = Job(name, fn, interval, **options)
+        self.jobs[name] = job
+        return job
+
+    def every(self, interval: float, name: str = None, **options):
+        """Decorator form of ``add``"""
+        def decorate(fn):
+            self.add(name or fn.__name__, fn, interval, **options)
+            return fn
+        return decorate
+
+    # ==================== LEASES ====================
+
+    async def _claim(self, job: Job):
+        """Lease ``job`` if it is due and free; returns the lease or None"""
+        now = datetime.now(timezone.utc)
+        try:
+            return await self.db.scheduler_leases.find_one_and_update(
+                {
+                    "_id": job.name,
+                    "$and": [
+                        {"$or": [{"next_run_at": {"$lte": now}}, {"next_run_at": None}]},
+                        {"$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                    ]
+                },
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=LEASE_TTL), "started_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Not due yet, or running elsewhere
+            return None
+
+    async def _renew(self, job: Job):
+        """Keep the lease while a long run is in progress"""
+        while True:
+            await asyncio.sleep(LEASE_TTL / 3)
+            try:
+                result = await self.db.scheduler_leases.update_one(
+                    {"_id": job.name, "owner": self.owner},
+                    {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=LEASE_TTL)}}
+                )
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of {job.name}: {e}")
+                continue
+            if result.matched_count == 0:
+                logger.warning(f"Job {job.name} lost its lease while running")
+                return
+
+    async def _release(self, job: Job, next_run_at: datetime, record: dict):
+        await self.db.scheduler_leases.update_one(
+            {"_id": job.name, "owner": self.owner},
+            {"$set": {
+                "expires_at": datetime.now(timezone.utc),
+                "next_run_at": next_run_at,
+                "last_status": record["status"],
+                "last_duration_ms": record["duration_ms"],
+                "last_finished_at": record["finished_at"],
+                "last_error": record.get("error"),
+            }}
+        )
+
+    # ==================== RUNS ====================
+
+    async def _execute(self, job: Job) -> dict:
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        record = {"job": job.name, "owner": self.owner, "started_at": started_at}
+        try:
+            result = job.fn()
+            if job.timeout:
+                result = asyncio.wait_for(result, job.timeout)
+            result = await result
+            record["status"] = "ok"
+            if isinstance(result, (dict, list, int, float, str)):
+                record["result"] = result
+        except asyncio.TimeoutError:
+            record["status"] = "timeout"
+            record["error"] = f"Timed out after {job.timeout}s"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{e.__class__.__name__}: {e}"
+            logger.exception(f"Job {job.name} failed")
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        record["finished_at"] = datetime.now(timezone.utc)
+        record["duration_ms"] = duration_ms
+
+        registry.inc(f"scheduler.{job.name}.runs")
+        registry.observe(f"scheduler.{job.name}.ms", duration_ms)
+        if record["status"] != "ok":
+            registry.inc(f"scheduler.{job.name}.failures")
+        try:
+            await self.db.scheduler_runs.insert_one(dict(record))
+        except Exception as e:
+            logger.warning(f"Could not record run of {job.name}: {e}")
+        return record
+
+    async def _run_exclusive(self, job: Job):
+        while True:
+            try:
+                lease = await self._claim(job)
+            except Exception as e:
+                logger.warning(f"Could not claim {job.name}: {e}")
+                lease = None
+            if lease is None:
+                await asyncio.sleep(min(POLL_INTERVAL, job.interval) * random.uniform(0.8, 1.2))
+                continue
+            renewal = asyncio.create_task(self._renew(job))
+            try:
+                record = await self._execute(job)
+            finally:
+                renewal.cancel()
+            delay = job.next_delay()
+            try:
+                await self._release(job, record["finished_at"] + timedelta(seconds=delay), record)
+            except Exception as e:
+                # The lease expires on its own; the job just runs again sooner
+                logger.warning(f"Could not release {job.name}: {e}")
+            # next_run_at gates the next claim; polling keeps ``trigger`` prompt
+            await asyncio.sleep(min(delay, POLL_INTERVAL))
+
+    async def _run_local(self, job: Job):
+        while True:
+            await self._execute(job)
+            await asyncio.sleep(job.next_delay())
+
+    async def run(self):
+        """Run every declared job until cancelled"""
+        jobs = [job for name, job in self.jobs.items() if name not in DISABLED_JOBS]
+        if not ENABLED or not jobs:
+            return
+        await ensure_scheduler_indexes(self.db)
+        logger.info(f"Scheduler {self.owner}: {', '.join(job.name for job in jobs)}")
+        tasks = [asyncio.create_task(self._run_exclusive(job) if job.exclusive else self._run_local(job))
+                 for job in jobs]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Let another process pick up a job interrupted by shutdown right away
+            try:
+                await self.db.scheduler_leases.update_many(
+                    {"owner": self.owner}, {"$set": {"expires_at": datetime.now(timezone.utc)}}
+                )
+            except Exception as e:
+                logger.warning(f"Could not release leases: {e}")
+
+    # ==================== STATUS ====================
+
+    async def status(self, job: str = None, limit: int = 20) -> dict:
+        """Leases of all jobs and the most recent runs, newest first"""
+        leases = await self.db.scheduler_leases.find({}).sort("_id", 1).to_list(None)
+        query = {"job": job} if job else {}
+        runs = await self.db.scheduler_runs.find(query, {"_id": 0}).sort("started_at", -1).limit(limit).to_list(limit)
+        now = datetime.now(timezone.utc)
+        return {
+            "owner": self.owner,
+            "enabled": ENABLED,
+            "jobs": [{**job.describe(), "disabled": job.name in DISABLED_JOBS} for job in self.jobs.values()],
+            "leases": [{
+                "job": lease.pop("_id"),
+                "running": lease.get("expires_at") is not None and lease["expires_at"] > now,
+                **lease,
+            } for lease in leases],
+            "runs": runs,
+        }
+
+    async def trigger(self, job: str) -> bool:
+        """Make ``job`` due now; False if it has never been scheduled"""
+        result = await self.db.scheduler_leases.update_one(
+            {"_id": job}, {"$set": {"next_run_at": datetime.now(timezone.utc)}}
+        )
+        return result.matched_count > 0
+
+# ==================== JOBS ====================
+
+def add_maintenance_jobs(scheduler: Scheduler, db):
+    """Jobs every process declares; the leases decide who runs them"""
+    from ranking import REFRESH_INTERVAL, refresh_rankings
+    from retention import ensure_retention_indexes, run_retention
+
+    async def retention():
+        # The bot processes never created these
+        await ensure_retention_indexes(db)
+        return await run_retention(db)
+
+    scheduler.add("ranking_refresh", lambda: refresh_rankings(db), REFRESH_INTERVAL)
+    if RETENTION_JOB and RETENTION_INTERVAL > 0:
+        scheduler.add("retention", retention, RETENTION_INTERVAL, jitter=0.05)
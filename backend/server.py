@@ -1,41 +1,165 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, BackgroundTasks, Query, Request, Response, UploadFile, File
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
 from typing import List, Optional
+import csv
+import hashlib
+import io
+import json
+import re
 import uuid
 from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
 import jwt
 import bcrypt
-from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.results import BulkWriteResult
 import asyncio
-import threading
+import time
+from contextlib import asynccontextmanager
+from cache import TTLCache
+from metrics import registry
+from ratelimit import build_limiters, retry_after_header, MongoBucketStore, SHARED as RATE_LIMIT_SHARED
+from clicks import record_click, count_clicks, top_mfos_by_clicks, ensure_click_indexes
+from retention import ensure_retention_indexes
+from funnel import ensure_funnel_indexes, record_view, record_submitted, record_status_changes, funnel_report
+from ranking import update_user_segment, ensure_ranking_indexes
+from notifications import NotificationWorker, enqueue_status_notifications, ensure_notification_indexes
+from readrouting import router_from_env
+from events import EventBus, StatsPublisher, watch_changes, format_sse, application_event
+import querylog
+from querylog import query_budget, unit_of_work, name_unit
+from templates import TemplateError, Templates, validate_content
+from scheduler import Scheduler, add_maintenance_jobs
+from admission import AdmissionController, priority, route_tier, CRITICAL, LOW, EXEMPT, RETRY_AFTER
+from bot_messages import DEFAULT_MESSAGES
+from storage import MongoStore
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Command monitoring has to be registered before the clients are created
+querylog.install()
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
+querylog.install(client)
+# Analytics, export and reporting reads: own pool, routed to secondaries
+reports = router_from_env()
 
 # JWT Settings
 JWT_SECRET = os.environ.get('JWT_SECRET', 'default_secret')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Day boundaries used by analytics grouping
+ANALYTICS_TIMEZONE = os.environ.get('ANALYTICS_TIMEZONE', 'UTC')
+
 # Telegram Bot
 TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN')
-bot = Bot(token=TELEGRAM_TOKEN) if TELEGRAM_TOKEN else None
+# Point at a fake Bot API in tests, e.g. http://127.0.0.1:8081
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL')
+_bot = None
+
+def get_bot():
+    """Create the Telegram Bot client on first use; python-telegram-bot is imported lazily"""
+    global _bot
+    if _bot is None and TELEGRAM_TOKEN:
+        from telegram import Bot
+        if TELEGRAM_API_URL:
+            _bot = Bot(token=TELEGRAM_TOKEN, base_url=f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+        else:
+            _bot = Bot(token=TELEGRAM_TOKEN)
+    return _bot
+
+# Applicant notifications, sent from the outbox in the background
+notifier = NotificationWorker(db, get_bot)
+# Their texts: the bot's templates with the admin's content edits
+notification_texts = Templates(MongoStore(db), DEFAULT_MESSAGES)
+
+# Periodic maintenance, leased per job so only one process (API or bot) runs each
+scheduler = Scheduler(db)
+add_maintenance_jobs(scheduler, db)
+
+# Per-tier concurrency limits that back off when Mongo slows down
+admission = AdmissionController()
+
+# Rate limits for unauthenticated routes
+limiters = build_limiters(db)
+# Proxies in front of the API that append to X-Forwarded-For; 0 uses the peer address.
+# Entries left of the last PROXY_HOPS are written by the client and cannot be trusted.
+PROXY_HOPS = int(os.environ.get('RATE_LIMIT_PROXY_HOPS', 0))
+
+# Caches
+catalog_cache = TTLCache(ttl=float(os.environ.get('CATALOG_CACHE_TTL', 60)))
+content_cache = TTLCache(ttl=float(os.environ.get('CONTENT_CACHE_TTL', 300)))
+stats_cache = TTLCache(ttl=float(os.environ.get('STATS_CACHE_TTL', 15)))
+analytics_cache = TTLCache(ttl=float(os.environ.get('DASHBOARD_ANALYTICS_TTL', 60)))
+recent_applications_cache = TTLCache(ttl=float(os.environ.get('DASHBOARD_RECENT_TTL', 5)))
+DASHBOARD_RECENT_APPLICATIONS = 5
+
+# Live dashboard feed
+EVENTS_KEEPALIVE = float(os.environ.get('EVENTS_KEEPALIVE', 15))
+events = EventBus()
+stats_publisher = StatsPublisher(
+    events, lambda: load_stats(), stats_cache.invalidate,
+    interval=float(os.environ.get('EVENTS_STATS_INTERVAL', 2)),
+    idle_refresh=stats_cache.ttl
+)
+
+def publish_change(event: dict = None):
+    """Mark live stats stale and publish ``event`` unless a change stream already does"""
+    stats_publisher.mark_dirty()
+    if event is not None and not events.external_feed:
+        events.publish(event)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect, prepare indexes and warm caches before serving, then clean up"""
+    timings = {}
+    started = time.perf_counter()
+
+    async def phase(name, coro):
+        phase_started = time.perf_counter()
+        result = await coro
+        timings[name] = round((time.perf_counter() - phase_started) * 1000, 1)
+        return result
+
+    await phase("mongo_ping", client.admin.command("ping"))
+    await phase("indexes", ensure_indexes())
+    await asyncio.gather(
+        phase("warm_catalog", load_public_mfos()),
+        phase("warm_content", load_content()),
+        phase("warm_stats", load_stats()),
+    )
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    app.state.startup_timings = timings
+    logger.info(f"Startup complete: {timings}")
+    feeders = [
+        asyncio.create_task(stats_publisher.run()),
+        asyncio.create_task(watch_changes(db, events, stats_publisher)),
+        asyncio.create_task(notifier.run()),
+        asyncio.create_task(scheduler.run()),
+    ]
+    yield
+    for task in feeders:
+        task.cancel()
+    await asyncio.gather(*feeders, return_exceptions=True)
+    reports.close()
+    client.close()
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
@@ -59,7 +183,7 @@ class AdminResponse(BaseModel):
     id: str
     email: str
     name: str
-    created_at: str
+    created_at: datetime
 
 class TokenResponse(BaseModel):
     token: str
@@ -106,7 +230,7 @@ class MFOResponse(BaseModel):
     approval_rate: int
     is_active: bool
     clicks: int
-    created_at: str
+    created_at: datetime
 
 class LoanApplicationCreate(BaseModel):
     mfo_id: str
@@ -127,7 +251,7 @@ class LoanApplicationResponse(BaseModel):
     term: int
     phone: str
     status: str
-    created_at: str
+    created_at: datetime
 
 class BotUserResponse(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -136,13 +260,51 @@ class BotUserResponse(BaseModel):
     username: str
     first_name: str
     last_name: str
-    created_at: str
-    last_activity: str
+    created_at: datetime
+    last_activity: datetime
+
+class ApplicationSummaryResponse(BaseModel):
+    total: int
+    by_status: dict
+
+class UserSummaryResponse(BaseModel):
+    total: int
+    with_username: int
+    today: int
+    active_24h: int
+
+class ApplicationFilter(BaseModel):
+    status: Optional[str] = None
+    mfo_id: Optional[str] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    phone: Optional[str] = None
+
+class BulkStatusUpdate(BaseModel):
+    status: str
+    ids: Optional[List[str]] = None
+    filter: Optional[ApplicationFilter] = None
+
+class MFOImportItem(MFOCreate):
+    id: Optional[str] = None
+
+class BulkItemResult(BaseModel):
+    id: Optional[str] = None
+    index: int
+    result: str
+    error: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    matched: int
+    modified: int
+    upserted: int = 0
+    results: List[BulkItemResult]
 
 class ContentCreate(BaseModel):
     key: str
     value: str
     description: str
+    translations: dict = {}
 
 class ContentResponse(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -150,7 +312,9 @@ class ContentResponse(BaseModel):
     key: str
     value: str
     description: str
-    updated_at: str
+    translations: dict = {}
+    version: int = 0
+    updated_at: datetime
 
 class AnalyticsResponse(BaseModel):
     total_users: int
@@ -184,9 +348,9 @@ def create_token(admin_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def admin_from_token(token: str) -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         admin_id = payload.get("admin_id")
         admin = await db.admins.find_one({"id": admin_id}, {"_id": 0})
         if not admin:
@@ -197,6 +361,194 @@ async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await admin_from_token(credentials.credentials)
+
+# ==================== RATE LIMIT HELPERS ====================
+
+def client_ip(request: Request) -> str:
+    """Client address: the X-Forwarded-For entry added by the outermost of ``PROXY_HOPS`` proxies"""
+    if PROXY_HOPS:
+        forwarded = [entry.strip() for entry in request.headers.get("x-forwarded-for", "").split(",") if entry.strip()]
+        if len(forwarded) >= PROXY_HOPS:
+            return forwarded[-PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+def rate_limit(name: str):
+    """Dependency charging the caller's IP against the named limit"""
+    async def check(request: Request):
+        allowed, retry_after = await limiters[name].hit(client_ip(request))
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": retry_after_header(retry_after)}
+            )
+    return Depends(check)
+
+# ==================== ANALYTICS HELPERS ====================
+
+def local_day(moment: datetime) -> str:
+    """Format a $dateTrunc day boundary as a date in ANALYTICS_TIMEZONE"""
+    return moment.astimezone(ZoneInfo(ANALYTICS_TIMEZONE)).date().isoformat()
+
+# ==================== SEARCH HELPERS ====================
+
+PAGE_SIZE_MAX = 200
+
+def _date_range(start: Optional[datetime], end: Optional[datetime]) -> dict:
+    """``$gte start``, ``$lt end``; an ``end`` at midnight is a date and includes that whole day"""
+    bounds = {}
+    if start:
+        bounds["$gte"] = start
+    if end:
+        if end.time() == datetime.min.time():
+            end += timedelta(days=1)
+        bounds["$lt"] = end
+    return bounds
+
+def build_application_query(status: Optional[str] = None, mfo_id: Optional[str] = None,
+                            date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                            phone: Optional[str] = None) -> dict:
+    """Mongo filter for the applications list; every field is index-backed"""
+    query = {}
+    if status:
+        query["status"] = status
+    if mfo_id:
+        query["mfo_id"] = mfo_id
+    created = _date_range(date_from, date_to)
+    if created:
+        query["created_at"] = created
+    if phone:
+        # Anchored, case-sensitive regex so the phone index bounds the scan
+        query["phone"] = {"$regex": "^" + re.escape(phone)}
+    return query
+
+def build_user_query(search: Optional[str] = None, active_from: Optional[datetime] = None,
+                     active_to: Optional[datetime] = None) -> dict:
+    """Mongo filter for the users list; every field is index-backed"""
+    query = {}
+    if search:
+        prefix = {"$regex": "^" + re.escape(search.lstrip("@"))}
+        query["$or"] = [{"username": prefix}, {"first_name": prefix}, {"last_name": prefix}]
+    activity = _date_range(active_from, active_to)
+    if activity:
+        query["last_activity"] = activity
+    return query
+
+async def ensure_indexes():
+    """Create every index the API relies on"""
+    await ensure_click_indexes(db)
+    await ensure_retention_indexes(db)
+    await ensure_search_indexes(db)
+    await ensure_funnel_indexes(db)
+    await ensure_ranking_indexes(db)
+    await ensure_notification_indexes(db)
+    if RATE_LIMIT_SHARED:
+        await MongoBucketStore(db).ensure_indexes()
+
+async def ensure_search_indexes(db):
+    """Indexes backing the filtered admin lists"""
+    await db.applications.create_index([("status", 1), ("created_at", -1)])
+    await db.applications.create_index([("mfo_id", 1), ("created_at", -1)])
+    await db.applications.create_index([("phone", 1), ("created_at", -1)])
+    await db.bot_users.create_index([("username", 1)])
+    await db.bot_users.create_index([("first_name", 1)])
+    await db.bot_users.create_index([("last_name", 1)])
+    await db.bot_users.create_index([("last_activity", -1)])
+    await db.bot_users.create_index([("created_at", -1)])
+    await db.bot_users.create_index(
+        [("username", "text"), ("first_name", "text"), ("last_name", "text")],
+        name="bot_users_text"
+    )
+
+# ==================== BULK HELPERS ====================
+
+BULK_MAX_ITEMS = 5000
+BULK_STATUS_PROJECTION = {"_id": 0, "id": 1, "status": 1, "mfo_id": 1, "funnel_day": 1,
+                          "user_telegram_id": 1, "mfo_name": 1, "amount": 1}
+APPLICATION_STATUSES = ["pending", "approved", "rejected"]
+MFO_EXPORT_FIELDS = ["id", *MFOCreate.model_fields.keys(), "clicks", "created_at"]
+
+def _write_errors(error: BulkWriteError) -> dict:
+    return {item["index"]: item.get("errmsg", "write error") for item in error.details.get("writeErrors", [])}
+
+async def run_bulk(collection, requests: list, ordered: bool = False):
+    """Execute one bulk_write and return ``(result_or_None, {index: error})``.
+
+    After a partial failure the result still covers the writes that went through.
+    """
+    if not requests:
+        return None, {}
+    try:
+        return await collection.bulk_write(requests, ordered=ordered), {}
+    except BulkWriteError as e:
+        return BulkWriteResult(e.details, True), _write_errors(e)
+
+def parse_mfo_upload(filename: str, payload: bytes) -> list:
+    """Read MFO rows from an uploaded JSON array or CSV file"""
+    text = payload.decode("utf-8-sig")
+    if filename.lower().endswith(".csv"):
+        rows = []
+        for row in csv.DictReader(io.StringIO(text)):
+            rows.append({key: value for key, value in row.items() if value not in (None, "")})
+        return rows
+    rows = json.loads(text)
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON array of MFOs")
+    return rows
+
+async def upsert_mfos(rows: list) -> BulkResponse:
+    """Validate rows and upsert them by ``id`` (or ``name`` when no id) in one bulk_write"""
+    if len(rows) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} items per batch")
+
+    results = []
+    requests = []
+    positions = []
+    now = datetime.now(timezone.utc)
+    for index, row in enumerate(rows):
+        try:
+            item = MFOImportItem.model_validate(row)
+        except ValidationError as e:
+            results.append(BulkItemResult(id=row.get("id") if isinstance(row, dict) else None, index=index,
+                                          result="invalid", error=str(e.errors()[0]["msg"])))
+            continue
+        fields = item.model_dump(exclude={"id"})
+        key = {"id": item.id} if item.id else {"name": item.name}
+        requests.append(UpdateOne(
+            key,
+            {"$set": fields, "$setOnInsert": {"id": item.id or str(uuid.uuid4()), "clicks": 0, "created_at": now}},
+            upsert=True
+        ))
+        positions.append((index, item.id or item.name))
+        results.append(None)
+
+    result, errors = await run_bulk(db.mfos, requests, ordered=False)
+    # One invalidation per batch, not per item
+    catalog_cache.invalidate()
+    stats_cache.invalidate()
+    publish_change()
+    upserted = result.upserted_ids if result else {}
+    request_index = 0
+    for slot, value in enumerate(results):
+        if value is not None:
+            continue
+        index, ident = positions[request_index]
+        if request_index in errors:
+            results[slot] = BulkItemResult(id=ident, index=index, result="error", error=errors[request_index])
+        else:
+            results[slot] = BulkItemResult(id=ident, index=index,
+                                           result="inserted" if request_index in upserted else "updated")
+        request_index += 1
+
+    return BulkResponse(
+        matched=result.matched_count if result else 0,
+        modified=result.modified_count if result else 0,
+        upserted=result.upserted_count if result else 0,
+        results=results
+    )
+
 # ==================== AUTH ROUTES ====================
 
 @api_router.post("/auth/register", response_model=TokenResponse)
@@ -211,7 +563,7 @@ async def register_admin(data: AdminCreate):
         "email": data.email,
         "password": hash_password(data.password),
         "name": data.name,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     await db.admins.insert_one(admin_doc)
     
@@ -222,6 +574,7 @@ async def register_admin(data: AdminCreate):
     )
 
 @api_router.post("/auth/login", response_model=TokenResponse)
+@priority(CRITICAL)
 async def login_admin(data: AdminLogin):
     admin = await db.admins.find_one({"email": data.email}, {"_id": 0})
     if not admin or not verify_password(data.password, admin["password"]):
@@ -244,10 +597,15 @@ async def get_mfos(admin: dict = Depends(get_current_admin)):
     mfos = await db.mfos.find({}, {"_id": 0}).to_list(1000)
     return mfos
 
-@api_router.get("/mfos/public", response_model=List[MFOResponse])
+async def load_public_mfos():
+    async def load():
+        return await db.mfos.find({"is_active": True}, {"_id": 0}).to_list(1000)
+    return await catalog_cache.get("public", load)
+
+@api_router.get("/mfos/public", response_model=List[MFOResponse], dependencies=[rate_limit("public_mfos")])
+@priority(CRITICAL)
 async def get_public_mfos():
-    mfos = await db.mfos.find({"is_active": True}, {"_id": 0}).to_list(1000)
-    return mfos
+    return await load_public_mfos()
 
 @api_router.post("/mfos", response_model=MFOResponse)
 async def create_mfo(data: MFOCreate, admin: dict = Depends(get_current_admin)):
@@ -256,9 +614,12 @@ async def create_mfo(data: MFOCreate, admin: dict = Depends(get_current_admin)):
         "id": mfo_id,
         **data.model_dump(),
         "clicks": 0,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     await db.mfos.insert_one(mfo_doc)
+    catalog_cache.invalidate()
+    stats_cache.invalidate()
+    publish_change()
     mfo_doc.pop("_id", None)
     return mfo_doc
 
@@ -271,6 +632,7 @@ async def update_mfo(mfo_id: str, data: MFOUpdate, admin: dict = Depends(get_cur
     result = await db.mfos.update_one({"id": mfo_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="MFO not found")
+    catalog_cache.invalidate()
     
     mfo = await db.mfos.find_one({"id": mfo_id}, {"_id": 0})
     return mfo
@@ -280,28 +642,87 @@ async def delete_mfo(mfo_id: str, admin: dict = Depends(get_current_admin)):
     result = await db.mfos.delete_one({"id": mfo_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="MFO not found")
+    catalog_cache.invalidate()
+    stats_cache.invalidate()
+    publish_change()
     return {"message": "MFO deleted"}
 
-@api_router.post("/mfos/{mfo_id}/click")
+@api_router.post("/mfos/bulk", response_model=BulkResponse)
+@query_budget(ms=5000)
+async def bulk_upsert_mfos(items: List[dict], admin: dict = Depends(get_current_admin)):
+    return await upsert_mfos(items)
+
+@api_router.post("/mfos/import", response_model=BulkResponse)
+@priority(LOW)
+@query_budget(ms=5000)
+async def import_mfos(file: UploadFile = File(...), admin: dict = Depends(get_current_admin)):
+    try:
+        rows = parse_mfo_upload(file.filename or "", await file.read())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Cannot parse file: {e}")
+    return await upsert_mfos(rows)
+
+@api_router.get("/mfos/export")
+@priority(LOW)
+@query_budget(ms=60000)
+async def export_mfos(format: str = "json", admin: dict = Depends(get_current_admin)):
+    if format not in ["json", "csv"]:
+        raise HTTPException(status_code=400, detail="Invalid format")
+    with reports.budget("export"):
+        mfos = await reports.db.mfos.find({}, {"_id": 0}).to_list(None)
+    for mfo in mfos:
+        if isinstance(mfo.get("created_at"), datetime):
+            mfo["created_at"] = mfo["created_at"].isoformat()
+
+    headers = {"Content-Disposition": f"attachment; filename=mfos.{format}"}
+    if format == "json":
+        return Response(json.dumps(mfos, ensure_ascii=False), media_type="application/json", headers=headers)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=MFO_EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(mfos)
+    return Response(buffer.getvalue(), media_type="text/csv", headers=headers)
+
+@api_router.post("/mfos/{mfo_id}/click", dependencies=[rate_limit("mfo_click")])
+@priority(CRITICAL)
 async def track_mfo_click(mfo_id: str, telegram_id: Optional[int] = None):
     await db.mfos.update_one({"id": mfo_id}, {"$inc": {"clicks": 1}})
-    click_doc = {
-        "id": str(uuid.uuid4()),
-        "mfo_id": mfo_id,
-        "telegram_id": telegram_id,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.clicks.insert_one(click_doc)
+    await record_click(db, mfo_id, telegram_id)
+    await record_view(db, mfo_id, telegram_id)
+    publish_change()
     return {"message": "Click tracked"}
 
 # ==================== APPLICATIONS ROUTES ====================
 
 @api_router.get("/applications", response_model=List[LoanApplicationResponse])
-async def get_applications(admin: dict = Depends(get_current_admin)):
-    apps = await db.applications.find({}, {"_id": 0}).to_list(1000)
+async def get_applications(
+    response: Response,
+    status: Optional[str] = None,
+    mfo_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    phone: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=PAGE_SIZE_MAX),
+    admin: dict = Depends(get_current_admin)
+):
+    query = build_application_query(status, mfo_id, date_from, date_to, phone)
+    response.headers["X-Total-Count"] = str(await db.applications.count_documents(query))
+    apps = await db.applications.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).to_list(limit)
     return apps
 
-@api_router.post("/applications", response_model=LoanApplicationResponse)
+@api_router.get("/applications/summary", response_model=ApplicationSummaryResponse)
+@priority(LOW)
+@query_budget(ms=15000)
+async def get_applications_summary(admin: dict = Depends(get_current_admin)):
+    by_status = {}
+    with reports.budget("report"):
+        for app_status in ["pending", "approved", "rejected"]:
+            by_status[app_status] = await reports.db.applications.count_documents({"status": app_status})
+    return ApplicationSummaryResponse(total=sum(by_status.values()), by_status=by_status)
+
+@api_router.post("/applications", response_model=LoanApplicationResponse, dependencies=[rate_limit("applications_create")])
+@priority(CRITICAL)
 async def create_application(data: LoanApplicationCreate):
     mfo = await db.mfos.find_one({"id": data.mfo_id}, {"_id": 0})
     if not mfo:
@@ -313,38 +734,173 @@ async def create_application(data: LoanApplicationCreate):
         **data.model_dump(),
         "mfo_name": mfo["name"],
         "status": "pending",
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc),
+        "funnel_day": None
     }
+    # Stored first so a failed insert is never counted as submitted
     await db.applications.insert_one(app_doc)
     app_doc.pop("_id", None)
+    app_doc["funnel_day"] = await record_submitted(db, data.mfo_id, data.user_telegram_id, app_doc["created_at"])
+    await db.applications.update_one({"id": app_id}, {"$set": {"funnel_day": app_doc["funnel_day"]}})
+    await update_user_segment(db, data.user_telegram_id)
+    stats_cache.invalidate()
+    recent_applications_cache.invalidate()
+    publish_change(application_event(app_doc))
     return app_doc
 
 @api_router.put("/applications/{app_id}/status")
-async def update_application_status(app_id: str, status: str, admin: dict = Depends(get_current_admin)):
-    if status not in ["pending", "approved", "rejected"]:
+async def update_application_status(app_id: str, status: str, background_tasks: BackgroundTasks,
+                                    admin: dict = Depends(get_current_admin)):
+    if status not in APPLICATION_STATUSES:
         raise HTTPException(status_code=400, detail="Invalid status")
     
-    result = await db.applications.update_one({"id": app_id}, {"$set": {"status": status}})
-    if result.matched_count == 0:
+    previous = await db.applications.find_one_and_update(
+        {"id": app_id}, {"$set": {"status": status}}, BULK_STATUS_PROJECTION
+    )
+    if previous is None:
         raise HTTPException(status_code=404, detail="Application not found")
+    changes = [(previous, previous["status"], status)]
+    await record_status_changes(db, changes)
+    if await enqueue_status_notifications(db, changes, notification_texts):
+        background_tasks.add_task(notifier.wake)
+    stats_cache.invalidate()
+    recent_applications_cache.invalidate()
+    publish_change({"type": "application_status", "id": app_id, "status": status})
     return {"message": "Status updated"}
 
+@api_router.post("/applications/bulk/status", response_model=BulkResponse)
+@query_budget(ms=5000)
+async def bulk_update_application_status(data: BulkStatusUpdate, background_tasks: BackgroundTasks,
+                                         admin: dict = Depends(get_current_admin)):
+    if data.status not in APPLICATION_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    if data.ids is None and data.filter is None:
+        raise HTTPException(status_code=400, detail="Provide ids or filter")
+
+    if data.ids is not None:
+        ids = list(dict.fromkeys(data.ids))
+        if len(ids) > BULK_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} items per batch")
+        found = await db.applications.find({"id": {"$in": ids}}, BULK_STATUS_PROJECTION).to_list(None)
+    else:
+        query = build_application_query(**data.filter.model_dump())
+        total = await db.applications.count_documents(query)
+        if total > BULK_MAX_ITEMS:
+            raise HTTPException(status_code=400,
+                                detail=f"Filter matches {total} applications; at most {BULK_MAX_ITEMS} per batch")
+        found = await db.applications.find(query, BULK_STATUS_PROJECTION) \
+            .sort("created_at", -1).to_list(BULK_MAX_ITEMS)
+        ids = [app["id"] for app in found]
+
+    apps_by_id = {app["id"]: app for app in found}
+    current = {app["id"]: app["status"] for app in found}
+    to_update = [app_id for app_id in ids if app_id in current and current[app_id] != data.status]
+    # Guarding on the old status keeps concurrent transitions from being overwritten silently.
+    # The guard can match nothing, so each write also tags the document with this operation's id
+    # and only tagged documents count as changed. The tag is removed once read.
+    operation = str(uuid.uuid4())
+    requests = [
+        UpdateOne({"id": app_id, "status": current[app_id]},
+                  {"$set": {"status": data.status}, "$push": {"status_ops": {"$each": [operation], "$slice": -5}}})
+        for app_id in to_update
+    ]
+    result, errors = await run_bulk(db.applications, requests, ordered=False)
+    changed = set()
+    if result and result.modified_count:
+        tagged = db.applications.find({"id": {"$in": to_update}, "status_ops": operation}, {"_id": 0, "id": 1})
+        changed = {app["id"] async for app in tagged}
+        if changed:
+            await db.applications.update_many({"id": {"$in": list(changed)}}, {"$pull": {"status_ops": operation}})
+            await db.applications.update_many({"id": {"$in": list(changed)}, "status_ops": {"$size": 0}},
+                                              {"$unset": {"status_ops": ""}})
+    stats_cache.invalidate()
+    recent_applications_cache.invalidate()
+
+    positions = {app_id: i for i, app_id in enumerate(to_update)}
+    results = []
+    changes = []
+    for index, app_id in enumerate(ids):
+        if app_id not in current:
+            results.append(BulkItemResult(id=app_id, index=index, result="not_found"))
+        elif app_id not in positions:
+            results.append(BulkItemResult(id=app_id, index=index, result="unchanged"))
+        elif positions[app_id] in errors:
+            results.append(BulkItemResult(id=app_id, index=index, result="error", error=errors[positions[app_id]]))
+        elif app_id not in changed:
+            results.append(BulkItemResult(id=app_id, index=index, result="conflict",
+                                          error="Status changed concurrently"))
+        else:
+            results.append(BulkItemResult(id=app_id, index=index, result="updated"))
+            changes.append((apps_by_id[app_id], current[app_id], data.status))
+    await record_status_changes(db, changes)
+    if await enqueue_status_notifications(db, changes, notification_texts):
+        background_tasks.add_task(notifier.wake)
+    if changes:
+        publish_change({"type": "application_status", "ids": [app["id"] for app, _, _ in changes], "status": data.status})
+
+    return BulkResponse(
+        matched=result.matched_count if result else 0,
+        modified=result.modified_count if result else 0,
+        results=results
+    )
+
 # ==================== USERS ROUTES ====================
 
 @api_router.get("/users", response_model=List[BotUserResponse])
-async def get_users(admin: dict = Depends(get_current_admin)):
-    users = await db.bot_users.find({}, {"_id": 0}).to_list(1000)
+async def get_users(
+    response: Response,
+    search: Optional[str] = None,
+    text: Optional[str] = None,
+    active_from: Optional[datetime] = None,
+    active_to: Optional[datetime] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=PAGE_SIZE_MAX),
+    admin: dict = Depends(get_current_admin)
+):
+    query = build_user_query(search, active_from, active_to)
+    if text:
+        # Whole-word search over username and names via the text index
+        query["$text"] = {"$search": text}
+    response.headers["X-Total-Count"] = str(await db.bot_users.count_documents(query))
+    users = await db.bot_users.find(query, {"_id": 0}).sort("last_activity", -1).skip(skip).to_list(limit)
     return users
 
+@api_router.get("/users/summary", response_model=UserSummaryResponse)
+@priority(LOW)
+@query_budget(ms=15000)
+async def get_users_summary(admin: dict = Depends(get_current_admin)):
+    now = datetime.now(timezone.utc)
+    today = now.astimezone(ZoneInfo(ANALYTICS_TIMEZONE)).replace(hour=0, minute=0, second=0, microsecond=0)
+    users = reports.db.bot_users
+    with reports.budget("report"):
+        return UserSummaryResponse(
+            total=await users.estimated_document_count(),
+            with_username=await users.count_documents({"username": {"$gt": ""}}),
+            today=await users.count_documents({"created_at": {"$gte": today}}),
+            active_24h=await users.count_documents({"last_activity": {"$gte": now - timedelta(hours=24)}})
+        )
+
 # ==================== CONTENT ROUTES ====================
 
+async def load_content():
+    async def load():
+        return await db.content.find({}, {"_id": 0}).to_list(1000)
+    return await content_cache.get("all", load)
+
 @api_router.get("/content", response_model=List[ContentResponse])
 async def get_content(admin: dict = Depends(get_current_admin)):
-    content = await db.content.find({}, {"_id": 0}).to_list(1000)
-    return content
+    return await load_content()
+
+def check_content(data: ContentCreate):
+    """Bot texts must compile with their placeholders; the bot picks up ``version`` changes"""
+    try:
+        validate_content(data.key, data.value, data.translations, DEFAULT_MESSAGES)
+    except TemplateError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid template: {e}")
 
 @api_router.post("/content", response_model=ContentResponse)
 async def create_content(data: ContentCreate, admin: dict = Depends(get_current_admin)):
+    check_content(data)
     existing = await db.content.find_one({"key": data.key})
     if existing:
         raise HTTPException(status_code=400, detail="Content key already exists")
@@ -353,21 +909,25 @@ async def create_content(data: ContentCreate, admin: dict = Depends(get_current_
     content_doc = {
         "id": content_id,
         **data.model_dump(),
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "version": 1,
+        "updated_at": datetime.now(timezone.utc)
     }
     await db.content.insert_one(content_doc)
+    content_cache.invalidate()
     content_doc.pop("_id", None)
     return content_doc
 
 @api_router.put("/content/{content_id}", response_model=ContentResponse)
 async def update_content(content_id: str, data: ContentCreate, admin: dict = Depends(get_current_admin)):
+    check_content(data)
     content_doc = {
         **data.model_dump(),
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "updated_at": datetime.now(timezone.utc)
     }
-    result = await db.content.update_one({"id": content_id}, {"$set": content_doc})
+    result = await db.content.update_one({"id": content_id}, {"$set": content_doc, "$inc": {"version": 1}})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Content not found")
+    content_cache.invalidate()
     
     content = await db.content.find_one({"id": content_id}, {"_id": 0})
     return content
@@ -377,75 +937,83 @@ async def delete_content(content_id: str, admin: dict = Depends(get_current_admi
     result = await db.content.delete_one({"id": content_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Content not found")
+    content_cache.invalidate()
     return {"message": "Content deleted"}
 
 # ==================== ANALYTICS ROUTES ====================
 
+async def load_stats():
+    async def load():
+        rdb = reports.db
+        with reports.budget("stats"):
+            total_users, total_mfos, total_applications, total_clicks, pending_applications = await asyncio.gather(
+                rdb.bot_users.count_documents({}),
+                rdb.mfos.count_documents({}),
+                rdb.applications.count_documents({}),
+                count_clicks(rdb),
+                rdb.applications.count_documents({"status": "pending"}),
+            )
+
+        conversion_rate = 0
+        if total_clicks > 0:
+            conversion_rate = round((total_applications / total_clicks) * 100, 2)
+
+        return StatsResponse(
+            total_users=total_users,
+            total_mfos=total_mfos,
+            total_applications=total_applications,
+            total_clicks=total_clicks,
+            pending_applications=pending_applications,
+            conversion_rate=conversion_rate
+        )
+    return await stats_cache.get("global", load)
+
 @api_router.get("/stats", response_model=StatsResponse)
 async def get_stats(admin: dict = Depends(get_current_admin)):
-    total_users = await db.bot_users.count_documents({})
-    total_mfos = await db.mfos.count_documents({})
-    total_applications = await db.applications.count_documents({})
-    total_clicks = await db.clicks.count_documents({})
-    pending_applications = await db.applications.count_documents({"status": "pending"})
-    
-    conversion_rate = 0
-    if total_clicks > 0:
-        conversion_rate = round((total_applications / total_clicks) * 100, 2)
-    
-    return StatsResponse(
-        total_users=total_users,
-        total_mfos=total_mfos,
-        total_applications=total_applications,
-        total_clicks=total_clicks,
-        pending_applications=pending_applications,
-        conversion_rate=conversion_rate
-    )
+    return await load_stats()
 
-@api_router.get("/analytics", response_model=AnalyticsResponse)
-async def get_analytics(admin: dict = Depends(get_current_admin)):
-    total_users = await db.bot_users.count_documents({})
-    total_applications = await db.applications.count_documents({})
-    total_clicks = await db.clicks.count_documents({})
-    
-    # Applications by status
-    pipeline_status = [
-        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-    ]
-    status_result = await db.applications.aggregate(pipeline_status).to_list(100)
-    applications_by_status = {item["_id"]: item["count"] for item in status_result}
-    
-    # Clicks by MFO
-    pipeline_clicks = [
-        {"$group": {"_id": "$mfo_id", "clicks": {"$sum": 1}}},
-        {"$sort": {"clicks": -1}},
-        {"$limit": 10}
-    ]
-    clicks_result = await db.clicks.aggregate(pipeline_clicks).to_list(10)
-    clicks_by_mfo = []
-    for item in clicks_result:
-        mfo = await db.mfos.find_one({"id": item["_id"]}, {"_id": 0})
-        if mfo:
-            clicks_by_mfo.append({"name": mfo["name"], "clicks": item["clicks"]})
-    
-    # Users by day (last 7 days)
-    seven_days_ago = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-    pipeline_users = [
-        {"$match": {"created_at": {"$gte": seven_days_ago}}},
-        {"$group": {"_id": {"$substr": ["$created_at", 0, 10]}, "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}}
-    ]
-    users_result = await db.bot_users.aggregate(pipeline_users).to_list(7)
-    users_by_day = [{"date": item["_id"], "count": item["count"]} for item in users_result]
-    
-    # Applications by day
-    pipeline_apps = [
-        {"$match": {"created_at": {"$gte": seven_days_ago}}},
-        {"$group": {"_id": {"$substr": ["$created_at", 0, 10]}, "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}}
-    ]
-    apps_result = await db.applications.aggregate(pipeline_apps).to_list(7)
-    applications_by_day = [{"date": item["_id"], "count": item["count"]} for item in apps_result]
+async def load_analytics() -> AnalyticsResponse:
+    rdb = reports.db
+    with reports.budget("analytics"):
+        total_users = await rdb.bot_users.count_documents({})
+        total_applications = await rdb.applications.count_documents({})
+        total_clicks = await count_clicks(rdb)
+        
+        # Applications by status
+        pipeline_status = [
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]
+        status_result = await rdb.applications.aggregate(pipeline_status, allowDiskUse=True).to_list(100)
+        applications_by_status = {item["_id"]: item["count"] for item in status_result}
+        
+        # Clicks by MFO
+        clicks_result = await top_mfos_by_clicks(rdb, 10)
+        names = {mfo["id"]: mfo["name"] for mfo in await rdb.mfos.find(
+            {"id": {"$in": [item["_id"] for item in clicks_result]}}, {"_id": 0, "id": 1, "name": 1}
+        ).to_list(None)}
+        clicks_by_mfo = [
+            {"name": names[item["_id"]], "clicks": item["clicks"]}
+            for item in clicks_result if item["_id"] in names
+        ]
+        
+        # Users by day (last 7 days)
+        seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
+        pipeline_users = [
+            {"$match": {"created_at": {"$gte": seven_days_ago}}},
+            {"$group": {"_id": {"$dateTrunc": {"date": "$created_at", "unit": "day", "timezone": ANALYTICS_TIMEZONE}}, "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ]
+        users_result = await rdb.bot_users.aggregate(pipeline_users, allowDiskUse=True).to_list(8)
+        users_by_day = [{"date": local_day(item["_id"]), "count": item["count"]} for item in users_result]
+        
+        # Applications by day
+        pipeline_apps = [
+            {"$match": {"created_at": {"$gte": seven_days_ago}}},
+            {"$group": {"_id": {"$dateTrunc": {"date": "$created_at", "unit": "day", "timezone": ANALYTICS_TIMEZONE}}, "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ]
+        apps_result = await rdb.applications.aggregate(pipeline_apps, allowDiskUse=True).to_list(8)
+        applications_by_day = [{"date": local_day(item["_id"]), "count": item["count"]} for item in apps_result]
     
     return AnalyticsResponse(
         total_users=total_users,
@@ -457,23 +1025,171 @@ async def get_analytics(admin: dict = Depends(get_current_admin)):
         applications_by_day=applications_by_day
     )
 
+@api_router.get("/analytics", response_model=AnalyticsResponse)
+@priority(LOW)
+@query_budget(ms=10000)
+async def get_analytics(admin: dict = Depends(get_current_admin)):
+    return await load_analytics()
+
+@api_router.get("/analytics/funnel")
+@priority(LOW)
+@query_budget(ms=15000)
+async def get_funnel(days: int = Query(30, ge=1, le=365), mfo_id: Optional[str] = None,
+                     admin: dict = Depends(get_current_admin)):
+    with reports.budget("report"):
+        report = await funnel_report(reports.db, days=days, mfo_id=mfo_id)
+        ids = [row["mfo_id"] for row in report["by_mfo"]]
+        names = {mfo["id"]: mfo["name"] for mfo in await reports.db.mfos.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None)}
+    for row in report["by_mfo"]:
+        row["name"] = names.get(row["mfo_id"], "")
+    return report
+
+# ==================== DASHBOARD ====================
+
+async def load_recent_applications() -> List[LoanApplicationResponse]:
+    apps = await db.applications.find({}, {"_id": 0}).sort("created_at", -1).to_list(DASHBOARD_RECENT_APPLICATIONS)
+    return [LoanApplicationResponse(**app) for app in apps]
+
+# Section name -> (cache, loader); each section keeps its own freshness
+DASHBOARD_SECTIONS = {
+    "stats": (None, load_stats),
+    "analytics": (analytics_cache, load_analytics),
+    "recent_applications": (recent_applications_cache, load_recent_applications),
+}
+
+async def load_section(name: str):
+    cache, loader = DASHBOARD_SECTIONS[name]
+    # load_stats already goes through stats_cache
+    return await (loader() if cache is None else cache.get("global", loader))
+
+@api_router.get("/dashboard")
+@query_budget(ms=10000)
+async def get_dashboard(request: Request, sections: Optional[str] = None, admin: dict = Depends(get_current_admin)):
+    """Everything the dashboard page shows, in one authenticated round trip.
+
+    ``sections`` is a comma-separated subset of ``DASHBOARD_SECTIONS``
+    (default: all; empty names are ignored). The ETag is a hash of the body,
+    so a client sending it back in ``If-None-Match`` gets ``304`` until some
+    section changes.
+    """
+    requested = [name.strip() for name in (sections or "").split(",")]
+    names = list(dict.fromkeys(name for name in requested if name)) or list(DASHBOARD_SECTIONS)
+    unknown = [name for name in names if name not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}")
+    values = await asyncio.gather(*(load_section(name) for name in names))
+    body = json.dumps(jsonable_encoder(dict(zip(names, values))), ensure_ascii=False, sort_keys=True).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        registry.inc("dashboard.not_modified")
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
 # ==================== ROOT ROUTE ====================
 
 @api_router.get("/")
 async def root():
     return {"message": "Microloan Bot API"}
 
+@api_router.get("/events/stream")
+@priority(EXEMPT)
+async def event_stream(request: Request, token: str = Query(...)):
+    """Server-Sent Events for the dashboard.
+
+    ``EventSource`` cannot send an Authorization header, so the JWT comes in
+    the query string. The first event is the current stats snapshot.
+    """
+    await admin_from_token(token)
+
+    async def stream():
+        queue = events.subscribe()
+        try:
+            stats = await load_stats()
+            yield "retry: 5000\n\n"
+            yield format_sse({"type": "stats", "stats": stats.model_dump(), "delta": {}})
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            events.unsubscribe(queue)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+@api_router.get("/metrics")
+@priority(EXEMPT)
+async def get_metrics(admin: dict = Depends(get_current_admin)):
+    return registry.snapshot()
+
+@api_router.get("/admission")
+@priority(EXEMPT)
+async def get_admission(admin: dict = Depends(get_current_admin)):
+    """Current per-tier limits, in-flight and queued requests"""
+    return admission.snapshot()
+
+@api_router.get("/slow-queries")
+async def get_slow_queries(limit: int = Query(20, ge=1, le=100), admin: dict = Depends(get_current_admin)):
+    """Most recent units of work that went over their Mongo budget, newest first"""
+    return list(querylog.recent_slow)[::-1][:limit]
+
+@api_router.get("/scheduler")
+async def get_scheduler(job: Optional[str] = None, limit: int = Query(20, ge=1, le=200),
+                        admin: dict = Depends(get_current_admin)):
+    """Job leases across all processes and the most recent runs"""
+    return jsonable_encoder(await scheduler.status(job, limit))
+
+@api_router.post("/scheduler/{job}/run")
+async def run_job_now(job: str, admin: dict = Depends(get_current_admin)):
+    """Make a job due now; whichever process holds or next claims its lease runs it"""
+    if not await scheduler.trigger(job):
+        raise HTTPException(status_code=404, detail="Job has never been scheduled")
+    return {"message": f"{job} is due"}
+
+@api_router.get("/health")
+@priority(EXEMPT)
+async def health():
+    return {"status": "ok", "startup": getattr(app.state, "startup_timings", {})}
+
 # Include the router
 app.include_router(api_router)
 
+@app.middleware("http")
+async def mongo_accounting(request: Request, call_next):
+    """Charge Mongo commands to the request and log it when over budget"""
+    with unit_of_work(f"{request.method} {request.url.path}"):
+        response = await call_next(request)
+        # Routing has filled in the matched route by now; name the unit after its template
+        route = request.scope.get("route")
+        if route is not None:
+            name_unit(f"{request.method} {route.path}", getattr(route.endpoint, "query_budget", None))
+    return response
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Queue or shed requests over their tier's limit, lowest priority first"""
+    tier = route_tier(app, request.scope)
+    if not await admission.acquire(tier):
+        return JSONResponse(
+            {"detail": "Server is busy, please retry"},
+            status_code=503,
+            headers={"Retry-After": retry_after_header(RETRY_AFTER)}
+        )
+    try:
+        return await call_next(request)
+    finally:
+        admission.release(tier)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "ETag"],
 )
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
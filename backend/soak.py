@@ -0,0 +1,252 @@
+"""Soak test: memory growth of the bot under many abandoned conversations.
+
+Drives synthetic conversations through the real handlers, each from a new
+user, with a fake ``Bot`` (see replay.py) so nothing leaves the process.
+``--abandon`` of them stop halfway through the calculator or the
+application wizard and never come back; the rest browse the catalog,
+finish a calculation or submit an application.
+
+Every ``--sample-every`` conversations the RSS and the ``tracemalloc``
+total are sampled. The report has the growth rate, the top allocation sites
+since the warm-up snapshot and the retained memory per idle session:
+growth since warm-up divided by the conversations abandoned since then. The
+run fails (exit code 1) when that exceeds ``--max-session-bytes``. Caches
+bounded by key count (rate-limit buckets, histograms) still count as growth
+until they fill up, so short runs overstate it.
+
+``--idle-ttl`` overrides ``BOT_SESSION_IDLE_TTL`` so idle sessions are
+swept within the run. Storage defaults to a temporary SQLite file
+(``BOT_STORAGE``); ``--storage mongo --db scratch`` uses MongoDB.
+
+Usage::
+
+    python soak.py [--conversations 1000000] [--abandon 0.6] [--idle-ttl 60] [--max-session-bytes 2048]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+FLOWS = ["calculator_abandoned", "apply_abandoned", "browse", "calculator_done", "applied"]
+# Frames that only show the measurement itself
+IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>")
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current, but better than nothing off Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def _mfos(count: int) -> list:
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [{
+        "id": f"soak-{i}", "name": f"MFO {i}", "description": "Soak offer", "logo_url": "",
+        "website_url": "https://example.com", "min_amount": 1000, "max_amount": 100000,
+        "min_term": 1, "max_term": 30, "interest_rate": 0.5 + i / 100, "approval_rate": 60 + i,
+        "is_active": True, "created_at": created + timedelta(minutes=i),
+    } for i in range(count)]
+
+class Conversations:
+    """Synthetic updates; ``update_id`` and message ids only need to be unique"""
+
+    def __init__(self, bot, buttons: dict):
+        self.bot = bot
+        self.buttons = buttons
+        self.next_id = 0
+
+    def _id(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Soak", "language_code": "ru"}
+
+    def message(self, user_id: int, text: str):
+        from telegram import Update
+
+        message = {"message_id": self._id(), "date": int(time.time()), "chat": {"id": user_id, "type": "private"},
+                   "from": self._user(user_id), "text": text}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return Update.de_json({"update_id": self._id(), "message": message}, self.bot)
+
+    def callback(self, user_id: int, data: str):
+        from telegram import Update
+
+        return Update.de_json({"update_id": self._id(), "callback_query": {
+            "id": str(self._id()), "from": self._user(user_id), "chat_instance": "soak", "data": data,
+            "message": {"message_id": self._id(), "date": int(time.time()),
+                        "chat": {"id": user_id, "type": "private"}, "text": "menu"},
+        }}, self.bot)
+
+    def script(self, flow: str, user_id: int) -> list:
+        start = self.message(user_id, "/start")
+        if flow == "calculator_abandoned":
+            return [start, self.callback(user_id, "calculator"), self.message(user_id, "15000")]
+        if flow == "apply_abandoned":
+            return [start, self.callback(user_id, "apply"), self.callback(user_id, self.buttons["apply"]),
+                    self.message(user_id, "10000")]
+        if flow == "browse":
+            return [start, self.callback(user_id, "catalog"), self.callback(user_id, self.buttons["detail"])]
+        if flow == "calculator_done":
+            return [start, self.callback(user_id, "calculator"), self.message(user_id, "15000"),
+                    self.message(user_id, "10")]
+        return [start, self.callback(user_id, "apply"), self.callback(user_id, self.buttons["apply"]),
+                self.message(user_id, "10000"), self.message(user_id, "14"), self.message(user_id, "+70000000000")]
+
+def pick_flow(rng: random.Random, abandon: float) -> str:
+    if rng.random() < abandon:
+        return rng.choice(FLOWS[:2])
+    return rng.choices(FLOWS[2:], weights=[6, 3, 1])[0]
+
+def top_sites(snapshot, baseline, limit: int) -> list:
+    # Dropping sites after grouping; filter_traces fnmatches every single trace
+    stats = [stat for stat in snapshot.compare_to(baseline, "lineno")
+             if stat.traceback[0].filename not in IGNORED_FILES]
+    return [{
+        "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+        "size_diff": stat.size_diff,
+        "count_diff": stat.count_diff,
+    } for stat in stats[:limit]]
+
+async def soak(args) -> dict:
+    from replay import _fake_request_class
+    from catalog import encode_callback, MFO_DETAIL, APPLY_MFO
+    from ranking import DEFAULT_SEGMENT
+    import telegram_bot
+
+    if args.idle_ttl is not None:
+        telegram_bot.SESSION_IDLE_TTL = args.idle_ttl
+    application = telegram_bot.Application.builder().token(telegram_bot.TELEGRAM_TOKEN) \
+        .application_class(telegram_bot.BotApplication).request(_fake_request_class()()) \
+        .get_updates_request(_fake_request_class()()).updater(None).build()
+    telegram_bot.register_handlers(application)
+    errors = {}
+
+    async def count_error(update, context):
+        name = type(context.error).__name__
+        errors[name] = errors.get(name, 0) + 1
+
+    application.add_error_handler(count_error)
+
+    store = telegram_bot.store
+    await telegram_bot.ensure_tenant_indexes(telegram_bot.default_tenant)
+    await store.upsert_mfos(_mfos(args.mfos))
+    index = await telegram_bot.catalog.current(DEFAULT_SEGMENT)
+    buttons = {"detail": encode_callback(MFO_DETAIL, index.version, 0), "apply": encode_callback(APPLY_MFO, index.version, 0)}
+
+    rng = random.Random(args.seed)
+    conversations = Conversations(application.bot, buttons)
+    warmup = max(1, int(args.conversations * args.warmup))
+    samples = []
+    flows = {flow: 0 for flow in FLOWS}
+    baseline = None
+    abandoned_before = 0
+    started = time.perf_counter()
+
+    def sample(done: int):
+        gc.collect()
+        traced, _ = tracemalloc.get_traced_memory()
+        samples.append({"conversations": done, "seconds": round(time.perf_counter() - started, 1),
+                        "rss": rss_bytes(), "traced": traced, "sessions": len(application.last_seen),
+                        "user_data": len(application.user_data)})
+
+    async def converse(user_id: int):
+        flow = pick_flow(rng, args.abandon)
+        flows[flow] += 1
+        for update in conversations.script(flow, user_id):
+            await application.process_update(update)
+
+    async with application:
+        done = 0
+        while done < args.conversations:
+            batch = min(args.concurrency, args.conversations - done)
+            await asyncio.gather(*(converse(10_000_000 + done + i) for i in range(batch)))
+            previous, done = done, done + batch
+            if baseline is None and done >= warmup:
+                sample(done)
+                baseline = tracemalloc.take_snapshot()
+                abandoned_before = flows[FLOWS[0]] + flows[FLOWS[1]]
+            elif previous // args.sample_every != done // args.sample_every:
+                sample(done)
+        sample(done)
+        final = tracemalloc.take_snapshot()
+        elapsed = time.perf_counter() - started
+
+    first, last = samples[0], samples[-1]
+    growth = last["traced"] - first["traced"]
+    abandoned = flows[FLOWS[0]] + flows[FLOWS[1]] - abandoned_before
+    per_session = growth / max(1, abandoned)
+    span = max(1, last["conversations"] - first["conversations"])
+    return {
+        "conversations": done,
+        "flows": flows,
+        "seconds": round(elapsed, 1),
+        "conversations_per_second": round(done / elapsed, 1),
+        "idle_ttl": telegram_bot.SESSION_IDLE_TTL,
+        "sessions_held": last["sessions"],
+        "abandoned_since_warmup": abandoned,
+        "growth": {
+            "traced_bytes": growth,
+            "rss_bytes": last["rss"] - first["rss"],
+            "traced_bytes_per_1k_conversations": round(growth / span * 1000, 1),
+            "traced_bytes_per_second": round(growth / max(last["seconds"] - first["seconds"], 1e-6), 1),
+        },
+        "bytes_per_idle_session": round(per_session, 1),
+        "max_session_bytes": args.max_session_bytes,
+        "passed": per_session <= args.max_session_bytes,
+        "top_allocations": top_sites(final, baseline, args.top),
+        "samples": samples,
+        "errors": errors,
+    }
+
+async def _main(args):
+    tracemalloc.start(args.frames)
+    return await soak(args)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Soak the bot handlers and track memory growth")
+    parser.add_argument("--conversations", type=int, default=1_000_000)
+    parser.add_argument("--abandon", type=float, default=0.6, help="Share of conversations left halfway")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--sample-every", type=int, default=50_000)
+    parser.add_argument("--warmup", type=float, default=0.01, help="Share of conversations before the baseline")
+    parser.add_argument("--idle-ttl", type=float, help="Seconds before idle sessions are swept")
+    parser.add_argument("--max-session-bytes", type=float, default=2048)
+    parser.add_argument("--mfos", type=int, default=20)
+    parser.add_argument("--top", type=int, default=15, help="Allocation sites to report")
+    parser.add_argument("--frames", type=int, default=1, help="tracemalloc traceback depth")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--storage", default=None, help="BOT_STORAGE value; a temporary SQLite file by default")
+    parser.add_argument("--db", help="Database name to use instead of DB_NAME")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    # Configure telegram_bot before it is imported
+    scratch = tempfile.TemporaryDirectory()
+    os.environ['BOT_STORAGE'] = args.storage or f"sqlite:///{scratch.name}/soak.db"
+    os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    os.environ.setdefault('DB_NAME', 'soak')
+    if args.db:
+        os.environ['DB_NAME'] = args.db
+    os.environ.pop('BOT_RECORD_PATH', None)
+    os.environ['TELEGRAM_TOKEN'] = "0:soak"
+    os.environ['RATE_LIMITS'] = json.dumps({"bot_message": {"capacity": 1e9, "rate": 1e9}})
+    result = asyncio.run(_main(args))
+    scratch.cleanup()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["passed"] and not result["errors"] else 1)
@@ -0,0 +1,724 @@
+"""Storage for the bot's hot paths, on MongoDB or an embedded SQLite file.
+
+The bot handlers only need a handful of operations (save the user, read the
+catalog and rankings, record clicks and funnel stages, store applications),
+and ``BotStore`` is exactly that set. ``MongoStore`` is the default and
+delegates to the same helpers the API uses (``clicks.py``, ``funnel.py``,
+``ranking.py``). ``SQLiteStore`` keeps the same data in one file for
+single-node deployments that have no MongoDB server:
+
+* WAL journal, so readers do not block the writer, and ``synchronous=NORMAL``
+* one connection owned by a single executor thread, so calls are async for
+  the event loop and never contend for the connection
+* fixed SQL strings with parameters, compiled once each and reused from
+  the connection's statement cache
+* tables indexed for the bot's lookups (user by telegram id, active
+  catalog order, a user's recent applications, funnel counters per day)
+
+Choose with ``BOT_STORAGE``: ``mongo`` (default) or ``sqlite:///path/bot.db``.
+A Mongo-backed bot gets ``GuardedMongoStore`` unless ``BOT_BREAKER=0``: each
+call is bounded by the circuit breaker in ``breaker.py``. While MongoDB is
+out, reads are answered from the last results that did arrive and writes
+go to a local spool (``BOT_SPOOL_DIR``) that is replayed on recovery.
+The admin API and the ranking job stay on MongoDB. A SQLite bot gets the
+catalog, ranking orders and content copied into its file by
+``python storage.py sync /path/bot.db [--every SECONDS]``; clicks, funnel
+stages and applications it records stay in the file.
+``tests/test_storage.py`` runs the same checks against both backends and
+``bench_storage.py`` compares them.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+from breaker import CLOSED, CircuitBreaker, Spool, StoreUnavailable
+from catalog import MFO_FIELDS
+from clicks import bucket_hour, ensure_click_indexes, record_click
+from funnel import ATTRIBUTION_DAYS, _day, ensure_funnel_indexes, record_view, record_apply_started, record_submitted
+from metrics import registry
+from ranking import DEFAULT_SEGMENT, HISTORY_SIZE, segment_of_history, update_user_segment, ensure_ranking_indexes
+
+BREAKER_ENABLED = os.environ.get('BOT_BREAKER', '1') == '1'
+SPOOL_DIR = Path(os.environ.get('BOT_SPOOL_DIR', Path(__file__).parent / 'spool'))
+
+class BotStore(ABC):
+    """Operations the bot handlers perform; all methods are coroutines.
+
+    Every backend must implement all of them: one that misses any fails
+    when it is constructed, not on the first call that needs it.
+    """
+
+    @abstractmethod
+    async def ensure_indexes(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_user(self, telegram_id: int, username: str = "", first_name: str = "",
+                        last_name: str = "", language_code: str = "", at: datetime = None):
+        """Create the user or refresh their names, ``language_code`` and ``last_activity``.
+
+        Writes take ``at``, the time of the event (default now), so spooled
+        ones land where they happened when replayed.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def user_segment(self, telegram_id: int):
+        """Stored ranking segment, or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_user_segment(self, telegram_id: int) -> str:
+        """Recompute and store the segment from the user's recent applications"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_content(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_content(self, key: str, value: str, translations: dict = None):
+        """Replace a content entry and bump its ``version``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def content_entries(self) -> list:
+        """All content as ``{key, value, translations, version}`` for templates.py"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def active_mfos(self) -> list:
+        """Active MFOs with ``MFO_FIELDS``, in catalog order (``created_at``, ``id``)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_mfo(self, mfo_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def upsert_mfos(self, mfos: list):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def ranking_order(self, segment: str):
+        """MFO ids in ranked order for ``segment``, or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_ranking_order(self, segment: str, mfo_ids: list):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def record_click(self, mfo_id: str, telegram_id=None, at: datetime = None):
+        """Store a click and bump the MFO's ``clicks`` counter"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def record_view(self, mfo_id: str, telegram_id=None, at: datetime = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def record_apply_started(self, mfo_id: str, telegram_id, at: datetime = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def record_submitted(self, mfo_id: str, telegram_id, at: datetime = None):
+        """Count a submission; returns the attributed cohort day or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_application(self, app: dict) -> bool:
+        """Store ``app`` unless one with its ``id`` exists; returns whether it was new"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def submit_application(self, app: dict):
+        """Store a new application, then count it as submitted.
+
+        The stage is recorded at ``created_at`` and only when the
+        application was new, and the cohort day is saved as its
+        ``funnel_day``. Returns that day or None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def funnel_counts(self, mfo_id: str) -> dict:
+        """``{stage: count}`` summed over all days, for checks and tooling"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+# ==================== MONGODB ====================
+
+class MongoStore(BotStore):
+    def __init__(self, db):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await ensure_click_indexes(self.db)
+        await ensure_funnel_indexes(self.db)
+        await ensure_ranking_indexes(self.db)
+
+    async def save_user(self, telegram_id: int, username: str = "", first_name: str = "",
+                        last_name: str = "", language_code: str = "", at: datetime = None):
+        now = at or datetime.now(timezone.utc)
+        await self.db.bot_users.update_one(
+            {"telegram_id": telegram_id},
+            {
+                "$set": {"username": username, "first_name": first_name, "last_name": last_name,
+                         "language_code": language_code},
+                "$max": {"last_activity": now},
+                "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}
+            },
+            upsert=True
+        )
+
+    async def user_segment(self, telegram_id: int):
+        user = await self.db.bot_users.find_one({"telegram_id": telegram_id}, {"_id": 0, "segment": 1})
+        return (user or {}).get("segment")
+
+    async def update_user_segment(self, telegram_id: int) -> str:
+        return await update_user_segment(self.db, telegram_id)
+
+    async def get_content(self, key: str):
+        content = await self.db.content.find_one({"key": key}, {"_id": 0})
+        return content["value"] if content else None
+
+    async def set_content(self, key: str, value: str, translations: dict = None):
+        await self.db.content.update_one(
+            {"key": key},
+            {"$set": {"value": value, "translations": translations or {}}, "$inc": {"version": 1}},
+            upsert=True
+        )
+
+    async def content_entries(self) -> list:
+        return await self.db.content.find(
+            {}, {"_id": 0, "key": 1, "value": 1, "translations": 1, "version": 1}
+        ).to_list(None)
+
+    async def active_mfos(self) -> list:
+        return await self.db.mfos.find({"is_active": True}, MFO_FIELDS).sort([("created_at", 1), ("id", 1)]).to_list(None)
+
+    async def get_mfo(self, mfo_id: str):
+        return await self.db.mfos.find_one({"id": mfo_id}, {"_id": 0})
+
+    async def upsert_mfos(self, mfos: list):
+        if mfos:
+            await self.db.mfos.bulk_write([UpdateOne({"id": mfo["id"]}, {"$set": mfo}, upsert=True) for mfo in mfos])
+
+    async def ranking_order(self, segment: str):
+        doc = await self.db.ranking_orders.find_one({"_id": segment})
+        return doc["mfo_ids"] if doc else None
+
+    async def set_ranking_order(self, segment: str, mfo_ids: list):
+        await self.db.ranking_orders.update_one({"_id": segment}, {"$set": {"mfo_ids": mfo_ids}}, upsert=True)
+
+    async def record_click(self, mfo_id: str, telegram_id=None, at: datetime = None):
+        await record_click(self.db, mfo_id, telegram_id, at)
+        await self.db.mfos.update_one({"id": mfo_id}, {"$inc": {"clicks": 1}})
+
+    async def record_view(self, mfo_id: str, telegram_id=None, at: datetime = None):
+        await record_view(self.db, mfo_id, telegram_id, at)
+
+    async def record_apply_started(self, mfo_id: str, telegram_id, at: datetime = None):
+        await record_apply_started(self.db, mfo_id, telegram_id, at)
+
+    async def record_submitted(self, mfo_id: str, telegram_id, at: datetime = None):
+        return await record_submitted(self.db, mfo_id, telegram_id, at)
+
+    async def insert_application(self, app: dict) -> bool:
+        # An upsert, so a replayed insert that had landed already is a no-op
+        result = await self.db.applications.update_one({"id": app["id"]}, {"$setOnInsert": app}, upsert=True)
+        return result.upserted_id is not None
+
+    async def submit_application(self, app: dict):
+        # Module helpers rather than methods: GuardedMongoStore replays this
+        # as one op and must not spool its parts separately
+        result = await self.db.applications.update_one({"id": app["id"]}, {"$setOnInsert": app}, upsert=True)
+        if result.upserted_id is None:
+            return None
+        day = await record_submitted(self.db, app["mfo_id"], app.get("user_telegram_id"), app["created_at"])
+        if day is not None:
+            await self.db.applications.update_one({"id": app["id"]}, {"$set": {"funnel_day": day}})
+        return day
+
+    async def funnel_counts(self, mfo_id: str) -> dict:
+        counts = {}
+        async for row in self.db.funnel_daily.find({"mfo_id": mfo_id}, {"_id": 0, "mfo_id": 0, "day": 0, "updated_at": 0}):
+            for stage, value in row.items():
+                if isinstance(value, dict):
+                    for sub, count in value.items():
+                        counts[f"{stage}.{sub}"] = counts.get(f"{stage}.{sub}", 0) + count
+                else:
+                    counts[stage] = counts.get(stage, 0) + value
+        return counts
+
+# Writes that take the event time; replay passes each entry's ``at``
+TIMED_WRITES = {"save_user", "record_click", "record_view", "record_apply_started", "record_submitted"}
+
+class GuardedMongoStore(MongoStore):
+    """``MongoStore`` that degrades instead of hanging when MongoDB stalls.
+
+    Catalog, MFO and content reads keep their last good result and serve
+    it while the breaker is open. A user's segment falls back to None, the
+    default segment. Writes are spooled while MongoDB is unreachable, and
+    also while older spooled writes wait, so funnel stages replay in order.
+    Replayed writes keep the time they happened (the entry's ``at``).
+    A spooled ``record_submitted``, ``submit_application`` or
+    ``update_user_segment`` returns None.
+    Index setup, catalog sync and ``funnel_counts`` are not guarded.
+    """
+
+    def __init__(self, db, spool_dir: Path = None):
+        super().__init__(db)
+        self.breaker = CircuitBreaker(db.name)
+        self.spool = Spool(db.name, str(Path(spool_dir or SPOOL_DIR) / f"{db.name}.jsonl"))
+        self.snapshots = {}
+        self._replay = None
+        registry.set(f"breaker.{db.name}.spool_pending", self.spool.pending)
+
+    async def _call(self, name: str, args: tuple, kwargs: dict = None):
+        return await self.breaker.call(lambda: getattr(MongoStore, name)(self, *args, **(kwargs or {})))
+
+    async def _read(self, name: str, *args, fallback=None):
+        key = (name,) + args
+        try:
+            value = await self._call(name, args)
+        except StoreUnavailable:
+            if key in self.snapshots:
+                registry.inc(f"breaker.{self.breaker.name}.stale_reads")
+                return self.snapshots[key]
+            if fallback is not None:
+                return fallback()
+            raise
+        self.snapshots[key] = value
+        self._maybe_replay()
+        return value
+
+    async def _write(self, name: str, *args, at: datetime = None):
+        """Write now, or spool it; ``at`` is passed on to ops in ``TIMED_WRITES``"""
+        at = at or datetime.now(timezone.utc)
+        kwargs = {"at": at} if name in TIMED_WRITES else {}
+        if not self.spool.pending:
+            try:
+                return await self._call(name, args, kwargs)
+            except StoreUnavailable:
+                pass
+        self.spool.append({"op": name, "args": args, "at": at})
+        registry.set(f"breaker.{self.breaker.name}.spool_pending", True)
+        self._maybe_replay()
+        return None
+
+    def _maybe_replay(self):
+        """Start draining the spool once MongoDB answers again"""
+        if self.spool.pending and self.breaker.state == CLOSED and (self._replay is None or self._replay.done()):
+            self._replay = asyncio.ensure_future(self.replay())
+
+    async def replay(self) -> int:
+        """Apply spooled writes in order; returns how many went through"""
+        def apply(entry):
+            kwargs = {"at": entry["at"]} if entry["op"] in TIMED_WRITES else {}
+            return self._call(entry["op"], tuple(entry["args"]), kwargs)
+
+        applied = await self.spool.drain(apply)
+        registry.set(f"breaker.{self.breaker.name}.spool_pending", self.spool.pending)
+        return applied
+
+    def _mfo_from_catalog(self, mfo_id: str):
+        for mfo in self.snapshots.get(("active_mfos",), []):
+            if mfo["id"] == mfo_id:
+                return mfo
+        raise StoreUnavailable(f"{self.breaker.name}: no snapshot of MFO {mfo_id}")
+
+    async def save_user(self, telegram_id: int, username: str = "", first_name: str = "",
+                        last_name: str = "", language_code: str = "", at: datetime = None):
+        await self._write("save_user", telegram_id, username, first_name, last_name, language_code, at=at)
+
+    async def user_segment(self, telegram_id: int):
+        try:
+            return await self._call("user_segment", (telegram_id,))
+        except StoreUnavailable:
+            return None
+
+    async def update_user_segment(self, telegram_id: int) -> str:
+        return await self._write("update_user_segment", telegram_id)
+
+    async def get_content(self, key: str):
+        return await self._read("get_content", key)
+
+    async def set_content(self, key: str, value: str, translations: dict = None):
+        await self._write("set_content", key, value, translations)
+
+    async def content_entries(self) -> list:
+        return await self._read("content_entries")
+
+    async def active_mfos(self) -> list:
+        return await self._read("active_mfos")
+
+    async def get_mfo(self, mfo_id: str):
+        return await self._read("get_mfo", mfo_id, fallback=lambda: self._mfo_from_catalog(mfo_id))
+
+    async def ranking_order(self, segment: str):
+        return await self._read("ranking_order", segment, fallback=lambda: None)
+
+    async def record_click(self, mfo_id: str, telegram_id=None, at: datetime = None):
+        await self._write("record_click", mfo_id, telegram_id, at=at)
+
+    async def record_view(self, mfo_id: str, telegram_id=None, at: datetime = None):
+        await self._write("record_view", mfo_id, telegram_id, at=at)
+
+    async def record_apply_started(self, mfo_id: str, telegram_id, at: datetime = None):
+        await self._write("record_apply_started", mfo_id, telegram_id, at=at)
+
+    async def record_submitted(self, mfo_id: str, telegram_id, at: datetime = None):
+        return await self._write("record_submitted", mfo_id, telegram_id, at=at)
+
+    async def insert_application(self, app: dict) -> bool:
+        return await self._write("insert_application", app)
+
+    async def submit_application(self, app: dict):
+        # One entry, so a replayed submission still sets its funnel_day
+        return await self._write("submit_application", app)
+
+# ==================== SQLITE ====================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mfos (
+    id TEXT PRIMARY KEY, is_active INTEGER NOT NULL, created_at TEXT NOT NULL,
+    clicks INTEGER NOT NULL DEFAULT 0, doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS mfos_catalog ON mfos (is_active, created_at, id);
+CREATE TABLE IF NOT EXISTS bot_users (
+    telegram_id INTEGER PRIMARY KEY, id TEXT NOT NULL, username TEXT, first_name TEXT, last_name TEXT,
+    language_code TEXT, segment TEXT, created_at TEXT NOT NULL, last_activity TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS content (
+    key TEXT PRIMARY KEY, value TEXT NOT NULL, translations TEXT NOT NULL DEFAULT '{}', version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS ranking_orders (segment TEXT PRIMARY KEY, mfo_ids TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS clicks (mfo_id TEXT NOT NULL, hour TEXT NOT NULL, second INTEGER NOT NULL, telegram_id INTEGER);
+CREATE INDEX IF NOT EXISTS clicks_mfo_hour ON clicks (mfo_id, hour);
+CREATE TABLE IF NOT EXISTS funnel_daily (
+    mfo_id TEXT NOT NULL, day TEXT NOT NULL, stage TEXT NOT NULL, count INTEGER NOT NULL, updated_at TEXT NOT NULL,
+    PRIMARY KEY (mfo_id, day, stage)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS funnel_touches (
+    key TEXT PRIMARY KEY, day TEXT NOT NULL, expires_at TEXT NOT NULL,
+    started INTEGER NOT NULL DEFAULT 0, submitted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS applications (
+    id TEXT PRIMARY KEY, user_telegram_id INTEGER, mfo_id TEXT, amount INTEGER, term INTEGER,
+    status TEXT, created_at TEXT NOT NULL, doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS applications_user ON applications (user_telegram_id, created_at);
+"""
+
+SAVE_USER = """
+INSERT INTO bot_users (telegram_id, id, username, first_name, last_name, language_code, created_at, last_activity)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (telegram_id) DO UPDATE SET
+    username = excluded.username, first_name = excluded.first_name, last_name = excluded.last_name,
+    language_code = excluded.language_code, last_activity = excluded.last_activity
+"""
+BUMP_FUNNEL = """
+INSERT INTO funnel_daily (mfo_id, day, stage, count, updated_at) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (mfo_id, day, stage) DO UPDATE SET count = count + excluded.count, updated_at = excluded.updated_at
+"""
+OPEN_TOUCH = """
+INSERT INTO funnel_touches (key, day, expires_at) VALUES (?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET day = excluded.day, expires_at = excluded.expires_at, started = 0, submitted = 0
+"""
+# One statement per stage; column names cannot be parameters
+ADVANCE_TOUCH = {
+    stage: f"UPDATE funnel_touches SET {stage} = 1 WHERE key = ? AND expires_at > ? AND {stage} = 0 RETURNING day"
+    for stage in ("started", "submitted")
+}
+SET_CONTENT = """
+INSERT INTO content (key, value, translations, version) VALUES (?, ?, ?, 1)
+ON CONFLICT (key) DO UPDATE SET value = excluded.value, translations = excluded.translations, version = version + 1
+"""
+# Columns added since the first release, per table
+ADDED_COLUMNS = {
+    "content": {"translations": "TEXT NOT NULL DEFAULT '{}'", "version": "INTEGER NOT NULL DEFAULT 0"},
+    "bot_users": {"language_code": "TEXT"},
+}
+RETIRE_MFOS = """
+UPDATE mfos SET is_active = 0, doc = json_set(doc, '$.is_active', json('false'))
+WHERE is_active = 1 AND id NOT IN (SELECT value FROM json_each(?))
+"""
+UPSERT_MFO = """
+INSERT INTO mfos (id, is_active, created_at, doc) VALUES (?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET is_active = excluded.is_active, created_at = excluded.created_at, doc = excluded.doc
+"""
+
+def _ts(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).isoformat()
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return _ts(value)
+    raise TypeError(f"Cannot store {type(value).__name__}")
+
+MFO_KEYS = [key for key, included in MFO_FIELDS.items() if included]
+
+class SQLiteStore(BotStore):
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-store")
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=OFF")
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn, *args):
+        """Run ``fn(conn, *args)`` in one transaction on the store's thread"""
+        def call():
+            conn = self._connect()
+            with conn:
+                return fn(conn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    async def ensure_indexes(self):
+        def migrate(conn):
+            conn.executescript(SCHEMA)
+            for table, added in ADDED_COLUMNS.items():
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for column, definition in added.items():
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        await self._run(migrate)
+
+    async def save_user(self, telegram_id: int, username: str = "", first_name: str = "",
+                        last_name: str = "", language_code: str = "", at: datetime = None):
+        now = _ts(at or datetime.now(timezone.utc))
+        await self._run(lambda conn: conn.execute(
+            SAVE_USER, (telegram_id, str(uuid.uuid4()), username, first_name, last_name, language_code, now, now)
+        ))
+
+    async def user_segment(self, telegram_id: int):
+        def read(conn):
+            row = conn.execute("SELECT segment FROM bot_users WHERE telegram_id = ?", (telegram_id,)).fetchone()
+            return row[0] if row else None
+        return await self._run(read)
+
+    async def update_user_segment(self, telegram_id: int) -> str:
+        def update(conn):
+            rows = conn.execute(
+                "SELECT amount, term FROM applications WHERE user_telegram_id = ? ORDER BY created_at DESC LIMIT ?",
+                (telegram_id, HISTORY_SIZE)
+            ).fetchall()
+            if not rows:
+                return None
+            segment = segment_of_history([{"amount": amount, "term": term} for amount, term in rows])
+            conn.execute("UPDATE bot_users SET segment = ? WHERE telegram_id = ?", (segment, telegram_id))
+            return segment
+        return await self._run(update) or DEFAULT_SEGMENT
+
+    async def get_content(self, key: str):
+        def read(conn):
+            row = conn.execute("SELECT value FROM content WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+        return await self._run(read)
+
+    async def set_content(self, key: str, value: str, translations: dict = None):
+        await self._run(lambda conn: conn.execute(SET_CONTENT, (key, value, json.dumps(translations or {}))))
+
+    async def content_entries(self) -> list:
+        def read(conn):
+            rows = conn.execute("SELECT key, value, translations, version FROM content").fetchall()
+            return [{"key": key, "value": value, "translations": json.loads(translations), "version": version}
+                    for key, value, translations, version in rows]
+        return await self._run(read)
+
+    async def active_mfos(self) -> list:
+        def read(conn):
+            rows = conn.execute("SELECT doc FROM mfos WHERE is_active = 1 ORDER BY created_at, id").fetchall()
+            return [{key: doc[key] for key in MFO_KEYS if key in doc} for doc in map(json.loads, (row[0] for row in rows))]
+        return await self._run(read)
+
+    async def get_mfo(self, mfo_id: str):
+        def read(conn):
+            row = conn.execute("SELECT doc, clicks FROM mfos WHERE id = ?", (mfo_id,)).fetchone()
+            return {**json.loads(row[0]), "clicks": row[1]} if row else None
+        return await self._run(read)
+
+    async def upsert_mfos(self, mfos: list):
+        now = datetime.now(timezone.utc)
+        params = []
+        for mfo in mfos:
+            created_at = mfo.get("created_at") or now
+            doc = {k: v for k, v in mfo.items() if k not in ("_id", "clicks")}
+            params.append((mfo["id"], int(mfo.get("is_active", True)),
+                           _ts(created_at) if isinstance(created_at, datetime) else created_at,
+                           json.dumps(doc, default=_json_default)))
+        await self._run(lambda conn: conn.executemany(UPSERT_MFO, params))
+
+    async def retire_mfos(self, keep_ids: list) -> int:
+        """Deactivate every active MFO not in ``keep_ids``; returns how many were"""
+        return await self._run(lambda conn: conn.execute(RETIRE_MFOS, (json.dumps(keep_ids),)).rowcount)
+
+    async def ranking_order(self, segment: str):
+        def read(conn):
+            row = conn.execute("SELECT mfo_ids FROM ranking_orders WHERE segment = ?", (segment,)).fetchone()
+            return json.loads(row[0]) if row else None
+        return await self._run(read)
+
+    async def set_ranking_order(self, segment: str, mfo_ids: list):
+        await self._run(lambda conn: conn.execute(
+            "INSERT INTO ranking_orders (segment, mfo_ids) VALUES (?, ?) "
+            "ON CONFLICT (segment) DO UPDATE SET mfo_ids = excluded.mfo_ids",
+            (segment, json.dumps(mfo_ids))
+        ))
+
+    async def record_click(self, mfo_id: str, telegram_id=None, at: datetime = None):
+        now = at or datetime.now(timezone.utc)
+        second = now.minute * 60 + now.second
+
+        def write(conn):
+            conn.execute("INSERT INTO clicks (mfo_id, hour, second, telegram_id) VALUES (?, ?, ?, ?)",
+                         (mfo_id, _ts(bucket_hour(now)), second, telegram_id))
+            conn.execute("UPDATE mfos SET clicks = clicks + 1 WHERE id = ?", (mfo_id,))
+        await self._run(write)
+
+    async def record_view(self, mfo_id: str, telegram_id=None, at: datetime = None):
+        now = at or datetime.now(timezone.utc)
+        day = _ts(_day(now))
+
+        def write(conn):
+            conn.execute(BUMP_FUNNEL, (mfo_id, day, "views", 1, _ts(now)))
+            if telegram_id is not None:
+                conn.execute(OPEN_TOUCH, (f"{telegram_id}:{mfo_id}", day,
+                                          _ts(now + timedelta(days=ATTRIBUTION_DAYS))))
+        await self._run(write)
+
+    async def _advance(self, mfo_id: str, telegram_id, stage: str, at: datetime = None):
+        now = at or datetime.now(timezone.utc)
+
+        def write(conn):
+            row = None
+            if telegram_id is not None:
+                row = conn.execute(ADVANCE_TOUCH[stage], (f"{telegram_id}:{mfo_id}", _ts(now))).fetchone()
+            if row:
+                conn.execute(BUMP_FUNNEL, (mfo_id, row[0], stage, 1, _ts(now)))
+                return row[0]
+            conn.execute(BUMP_FUNNEL, (mfo_id, _ts(_day(now)), f"unattributed.{stage}", 1, _ts(now)))
+            return None
+        day = await self._run(write)
+        return datetime.fromisoformat(day) if day else None
+
+    async def record_apply_started(self, mfo_id: str, telegram_id, at: datetime = None):
+        await self._advance(mfo_id, telegram_id, "started", at)
+
+    async def record_submitted(self, mfo_id: str, telegram_id, at: datetime = None):
+        return await self._advance(mfo_id, telegram_id, "submitted", at)
+
+    async def insert_application(self, app: dict) -> bool:
+        params = (app["id"], app.get("user_telegram_id"), app.get("mfo_id"), app.get("amount"), app.get("term"),
+                  app.get("status"), _ts(app["created_at"]), json.dumps(app, default=_json_default))
+        return await self._run(lambda conn: conn.execute(
+            "INSERT INTO applications (id, user_telegram_id, mfo_id, amount, term, status, created_at, doc) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO NOTHING", params
+        ).rowcount == 1)
+
+    async def submit_application(self, app: dict):
+        if not await self.insert_application(app):
+            return None
+        day = await self._advance(app["mfo_id"], app.get("user_telegram_id"), "submitted", app["created_at"])
+        if day is not None:
+            await self._run(lambda conn: conn.execute(
+                "UPDATE applications SET doc = json_set(doc, '$.funnel_day', ?) WHERE id = ?", (_ts(day), app["id"])
+            ))
+        return day
+
+    async def funnel_counts(self, mfo_id: str) -> dict:
+        def read(conn):
+            rows = conn.execute("SELECT stage, SUM(count) FROM funnel_daily WHERE mfo_id = ? GROUP BY stage", (mfo_id,))
+            return dict(rows.fetchall())
+        return await self._run(read)
+
+    def close(self):
+        def close_connection():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(close_connection).result()
+        self._executor.shutdown()
+
+def store_from_env(db) -> BotStore:
+    """``BOT_STORAGE``: ``mongo`` (default) or ``sqlite:///path/to/bot.db``"""
+    spec = os.environ.get('BOT_STORAGE', 'mongo')
+    if spec == 'mongo':
+        return mongo_store(db)
+    if spec.startswith('sqlite:///'):
+        return SQLiteStore(spec[len('sqlite:///'):])
+    raise ValueError(f"Unknown BOT_STORAGE: {spec}")
+
+def mongo_store(db) -> MongoStore:
+    """``GuardedMongoStore``, or a plain ``MongoStore`` with ``BOT_BREAKER=0``"""
+    return GuardedMongoStore(db) if BREAKER_ENABLED else MongoStore(db)
+
+async def sync_to_sqlite(db, store: SQLiteStore) -> dict:
+    """Copy the catalog, ranking orders and content from MongoDB into ``store``.
+
+    MFOs gone from MongoDB are deactivated. Content is rewritten only where
+    it differs, so its ``version`` moves on real edits only.
+    """
+    mfos = await db.mfos.find({}, {"_id": 0}).to_list(None)
+    await store.upsert_mfos(mfos)
+    retired = await store.retire_mfos([mfo["id"] for mfo in mfos])
+    orders = await db.ranking_orders.find().to_list(None)
+    for order in orders:
+        await store.set_ranking_order(order["_id"], order["mfo_ids"])
+    current = {entry["key"]: entry for entry in await store.content_entries()}
+    changed = 0
+    for entry in await db.content.find({}, {"_id": 0, "key": 1, "value": 1, "translations": 1}).to_list(None):
+        translations = entry.get("translations") or {}
+        mine = current.get(entry["key"])
+        if mine is None or (mine["value"], mine["translations"]) != (entry["value"], translations):
+            await store.set_content(entry["key"], entry["value"], translations)
+            changed += 1
+    return {"mfos": len(mfos), "retired": retired, "ranking_orders": len(orders), "content": changed}
+
+async def _sync(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    store = SQLiteStore(args.path)
+    try:
+        await store.ensure_indexes()
+        while True:
+            logging.info(f"Synced {await sync_to_sqlite(client[os.environ['DB_NAME']], store)}")
+            if not args.every:
+                return
+            await asyncio.sleep(args.every)
+    finally:
+        store.close()
+        client.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Bot storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sync_parser = sub.add_parser("sync", help="Copy catalog, rankings and content from MongoDB into a SQLite file")
+    sync_parser.add_argument("path", help="The file in BOT_STORAGE=sqlite:///path")
+    sync_parser.add_argument("--every", type=float, help="Keep syncing every N seconds")
+    asyncio.run(_sync(parser.parse_args()))
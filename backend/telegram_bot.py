@@ -1,20 +1,37 @@
 import asyncio
+import contextvars
 import logging
 import os
 from pathlib import Path
 from dotenv import load_dotenv
 from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import uuid
+import time
+from collections import OrderedDict
+from metrics import registry
+from ratelimit import build_limiters, MongoBucketStore, SHARED as RATE_LIMIT_SHARED
+from catalog import Catalog, CatalogIndex, encode_callback, CATALOG_PAGE, MFO_DETAIL, APPLY_PAGE, APPLY_MFO
+from callbacks import CallbackRouter
+from replay import recorder_from_env
+from ranking import Ranking, DEFAULT_SEGMENT, segment_for
+from storage import MongoStore, store_from_env
+from breaker import StoreUnavailable
+from templates import Templates, Messages
+from bot_messages import DEFAULT_MESSAGES
+import querylog
+from querylog import unit_of_work
+from scheduler import Scheduler, add_maintenance_jobs
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+querylog.install()
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Telegram Bot
@@ -23,139 +40,191 @@ TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN')
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Optional capture of incoming updates for replay.py
+recorder = recorder_from_env()
+
+METRICS_LOG_INTERVAL = 300
+
+# Conversation state (context.user_data) of users idle this long is dropped
+SESSION_IDLE_TTL = float(os.environ.get('BOT_SESSION_IDLE_TTL', 3600))
+
+# Handler errors of the update being processed by BotApplication.process_update_or_raise
+update_errors = contextvars.ContextVar("update_errors", default=None)
+
+# Bot data on MongoDB, or in a local SQLite file with BOT_STORAGE=sqlite:///...
+store = store_from_env(db)
+
+# Active MFOs ranked per segment, paged and shared by all chats (and all bots of bot_host.py)
+ranking = Ranking(store)
+catalog = Catalog(store, ranking)
+
+# ==================== TENANTS ====================
+
+class Tenant:
+    """One bot's own data: users, applications, clicks, funnel and content live in ``store``.
+
+    MFOs and their ranking are shared and always read from the main ``store``.
+    """
+
+    def __init__(self, name: str, store, limiters: dict = None):
+        self.name = name
+        self.store = store
+        # Bot texts compiled per language, with this bot's content overrides
+        self.templates = Templates(store, DEFAULT_MESSAGES)
+        # Per-telegram-id rate limits, shared through Mongo when enabled
+        if limiters is None:
+            limiters = build_limiters(store.db if isinstance(store, MongoStore) else None)
+        self.limiters = limiters
+
+default_tenant = Tenant("default", store)
+
+def tenant_of(context: ContextTypes.DEFAULT_TYPE) -> Tenant:
+    return context.bot_data.get("tenant", default_tenant)
+
+async def ensure_tenant_indexes(tenant: Tenant):
+    await tenant.store.ensure_indexes()
+    if RATE_LIMIT_SHARED and isinstance(tenant.store, MongoStore):
+        await MongoBucketStore(tenant.store.db).ensure_indexes()
+
 # ==================== HELPERS ====================
 
-async def save_user(user):
+async def save_user(store, user):
     """Save or update user in database"""
-    existing = await db.bot_users.find_one({"telegram_id": user.id})
-    now = datetime.now(timezone.utc).isoformat()
-    
-    if existing:
-        await db.bot_users.update_one(
-            {"telegram_id": user.id},
-            {"$set": {"last_activity": now, "username": user.username or "", "first_name": user.first_name or "", "last_name": user.last_name or ""}}
-        )
-    else:
-        user_doc = {
-            "id": str(uuid.uuid4()),
-            "telegram_id": user.id,
-            "username": user.username or "",
-            "first_name": user.first_name or "",
-            "last_name": user.last_name or "",
-            "created_at": now,
-            "last_activity": now
-        }
-        await db.bot_users.insert_one(user_doc)
+    await store.save_user(user.id, user.username or "", user.first_name or "", user.last_name or "",
+                          user.language_code or "")
 
-async def get_content(key: str, default: str = "") -> str:
-    """Get content from database"""
-    content = await db.content.find_one({"key": key}, {"_id": 0})
-    return content["value"] if content else default
+async def user_segment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Ranking segment of the user, read from the database once per conversation"""
+    segment = context.user_data.get("segment")
+    if segment is None:
+        segment = await tenant_of(context).store.user_segment(update.effective_user.id) or DEFAULT_SEGMENT
+        context.user_data["segment"] = segment
+    return segment
+
+async def messages_for(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Messages:
+    """Bot texts in the user's language"""
+    user = update.effective_user
+    return await tenant_of(context).templates.for_language(user.language_code if user else None)
+
+def main_menu_keyboard(t: Messages, about: bool = True) -> InlineKeyboardMarkup:
+    keyboard = [
+        [InlineKeyboardButton(t("button_catalog"), callback_data="catalog")],
+        [InlineKeyboardButton(t("button_calculator"), callback_data="calculator")],
+        [InlineKeyboardButton(t("button_apply"), callback_data="apply")],
+        [InlineKeyboardButton(t("button_compare"), callback_data="compare")],
+    ]
+    if about:
+        keyboard.append([InlineKeyboardButton(t("button_about"), callback_data="about")])
+    return InlineKeyboardMarkup(keyboard)
+
+def back_keyboard(t: Messages, callback_data: str = "back_main", label: str = "button_back") -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[InlineKeyboardButton(t(label), callback_data=callback_data)]])
 
 # ==================== BOT HANDLERS ====================
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     user = update.effective_user
-    await save_user(user)
-    
-    welcome_text = await get_content("welcome_message", 
-        f"👋 Привет, {user.first_name}!\n\n"
-        "Я помогу вам найти лучшие предложения по микрозаймам.\n\n"
-        "Выберите действие:"
-    )
+    tenant = tenant_of(context)
+    await save_user(tenant.store, user)
+    t = await messages_for(update, context)
     
+    await update.message.reply_text(t("welcome_message", first_name=user.first_name), reply_markup=main_menu_keyboard(t))
+
+def page_keyboard(t: Messages, index: CatalogIndex, number: int, items: list, item_action: str, page_action: str, label) -> InlineKeyboardMarkup:
+    """One button per MFO on the page, prev/next navigation and a back button"""
     keyboard = [
-        [InlineKeyboardButton("📋 Каталог МФО", callback_data="catalog")],
-        [InlineKeyboardButton("🔢 Калькулятор займа", callback_data="calculator")],
-        [InlineKeyboardButton("📝 Подать заявку", callback_data="apply")],
-        [InlineKeyboardButton("📊 Сравнить предложения", callback_data="compare")],
-        [InlineKeyboardButton("ℹ️ О сервисе", callback_data="about")]
+        [InlineKeyboardButton(label(mfo), callback_data=encode_callback(item_action, index.version, position))]
+        for position, mfo in items
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(welcome_text, reply_markup=reply_markup)
+    navigation = []
+    if number > 0:
+        navigation.append(InlineKeyboardButton(t("button_previous_page"), callback_data=encode_callback(page_action, index.version, number - 1)))
+    if number < index.page_count - 1:
+        navigation.append(InlineKeyboardButton(t("button_next_page"), callback_data=encode_callback(page_action, index.version, number + 1)))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton(t("button_back"), callback_data="back_main")])
+    return InlineKeyboardMarkup(keyboard)
 
-async def catalog_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show MFO catalog"""
+def page_footer(t: Messages, index: CatalogIndex, number: int) -> str:
+    return t("page_footer", page=number + 1, pages=index.page_count) if index.page_count > 1 else ""
+
+async def show_catalog_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
     query = update.callback_query
-    await query.answer()
-    
-    mfos = await db.mfos.find({"is_active": True}, {"_id": 0}).to_list(20)
+    index = await catalog.current(await user_segment(update, context))
+    t = await messages_for(update, context)
     
-    if not mfos:
-        await query.edit_message_text(
-            "😔 В данный момент нет доступных МФО.\n\nПопробуйте позже.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="back_main")]])
-        )
+    if not index.mfos:
+        await query.edit_message_text(t("catalog_empty"), reply_markup=back_keyboard(t))
         return
     
-    text = "📋 *Каталог МФО*\n\nВыберите организацию для подробной информации:\n"
-    keyboard = []
-    
-    for mfo in mfos:
-        keyboard.append([InlineKeyboardButton(f"🏦 {mfo['name']} ({mfo['interest_rate']}%)", callback_data=f"mfo_{mfo['id']}")])
-    
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_main")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    number, items = index.page(page)
+    text = t("catalog_title") + page_footer(t, index, number)
+    reply_markup = page_keyboard(t, index, number, items, MFO_DETAIL, CATALOG_PAGE, lambda mfo: t("catalog_button", **mfo))
     
     await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
 
-async def mfo_detail_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show MFO details"""
+async def catalog_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show MFO catalog"""
     query = update.callback_query
     await query.answer()
+    await show_catalog_page(update, context)
+
+async def show_mfo_detail(update: Update, context: ContextTypes.DEFAULT_TYPE, mfo: dict):
+    query = update.callback_query
+    index = await catalog.current(await user_segment(update, context))
+    t = await messages_for(update, context)
     
-    mfo_id = query.data.replace("mfo_", "")
-    mfo = await db.mfos.find_one({"id": mfo_id}, {"_id": 0})
-    
-    if not mfo:
-        await query.edit_message_text("МФО не найдено", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="catalog")]]))
+    if not mfo or mfo["id"] not in index.positions:
+        await query.edit_message_text(t("mfo_not_found"), reply_markup=back_keyboard(t, "catalog"))
         return
     
+    mfo_id = mfo["id"]
+    
     # Track click
     user = update.effective_user
-    click_doc = {
-        "id": str(uuid.uuid4()),
-        "mfo_id": mfo_id,
-        "telegram_id": user.id,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.clicks.insert_one(click_doc)
-    await db.mfos.update_one({"id": mfo_id}, {"$inc": {"clicks": 1}})
+    tenant_store = tenant_of(context).store
+    await tenant_store.record_click(mfo_id, user.id)
+    await tenant_store.record_view(mfo_id, user.id)
     
-    text = f"""🏦 *{mfo['name']}*
-
-📝 {mfo['description']}
-
-💰 *Сумма:* {mfo['min_amount']:,} - {mfo['max_amount']:,} ₽
-📅 *Срок:* {mfo['min_term']} - {mfo['max_term']} дней
-📈 *Ставка:* {mfo['interest_rate']}% в день
-✅ *Одобрение:* {mfo['approval_rate']}%
-
-🔗 {mfo['website_url']}"""
+    text = t("mfo_detail", **mfo)
     
     keyboard = [
-        [InlineKeyboardButton("📝 Подать заявку", callback_data=f"apply_{mfo_id}")],
-        [InlineKeyboardButton("🔙 К каталогу", callback_data="catalog")]
+        [InlineKeyboardButton(t("button_apply"), callback_data=encode_callback(APPLY_MFO, index.version, index.positions[mfo_id]))],
+        [InlineKeyboardButton(t("button_back_to_catalog"), callback_data=encode_callback(CATALOG_PAGE, index.version, index.page_of(mfo_id)))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
 
+async def mfo_detail_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, mfo_id: str):
+    """Show MFO details for legacy ``mfo_<uuid>`` buttons"""
+    await update.callback_query.answer()
+    await show_mfo_detail(update, context, await store.get_mfo(mfo_id))
+
 async def calculator_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show loan calculator"""
     query = update.callback_query
     await query.answer()
     
     context.user_data["calc_step"] = "amount"
+    t = await messages_for(update, context)
     
-    text = """🔢 *Калькулятор займа*
+    await query.edit_message_text(t("calculator_prompt"), reply_markup=back_keyboard(t), parse_mode="Markdown")
 
-Введите сумму займа (от 1000 до 100000 ₽):"""
+async def show_apply_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+    query = update.callback_query
+    index = await catalog.current(await user_segment(update, context))
+    t = await messages_for(update, context)
     
-    keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="back_main")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    if not index.mfos:
+        await query.edit_message_text(t("apply_empty"), reply_markup=back_keyboard(t))
+        return
+    
+    number, items = index.page(page)
+    text = t("apply_title") + page_footer(t, index, number)
+    reply_markup = page_keyboard(t, index, number, items, APPLY_MFO, APPLY_PAGE, lambda mfo: t("apply_button", **mfo))
     
     await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
 
@@ -163,77 +232,81 @@ async def apply_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start application process"""
     query = update.callback_query
     await query.answer()
-    
-    mfos = await db.mfos.find({"is_active": True}, {"_id": 0}).to_list(20)
-    
-    if not mfos:
-        await query.edit_message_text(
-            "😔 В данный момент нет доступных МФО для подачи заявки.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="back_main")]])
-        )
-        return
-    
-    text = "📝 *Подать заявку*\n\nВыберите МФО для подачи заявки:"
-    keyboard = []
-    
-    for mfo in mfos:
-        keyboard.append([InlineKeyboardButton(f"🏦 {mfo['name']}", callback_data=f"apply_{mfo['id']}")])
-    
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_main")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
+    await show_apply_page(update, context)
 
-async def apply_mfo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Start application for specific MFO"""
+async def start_application(update: Update, context: ContextTypes.DEFAULT_TYPE, mfo: dict):
     query = update.callback_query
-    await query.answer()
-    
-    mfo_id = query.data.replace("apply_", "")
-    mfo = await db.mfos.find_one({"id": mfo_id}, {"_id": 0})
+    index = await catalog.current(await user_segment(update, context))
+    t = await messages_for(update, context)
     
-    if not mfo:
-        await query.edit_message_text("МФО не найдено", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="apply")]]))
+    if not mfo or mfo["id"] not in index.positions:
+        await query.edit_message_text(t("mfo_not_found"), reply_markup=back_keyboard(t, "apply"))
         return
     
+    mfo_id = mfo["id"]
+    await tenant_of(context).store.record_apply_started(mfo_id, update.effective_user.id)
+    
     context.user_data["apply_mfo_id"] = mfo_id
     context.user_data["apply_mfo_name"] = mfo["name"]
     context.user_data["apply_step"] = "amount"
     
-    text = f"""📝 *Заявка в {mfo['name']}*
+    await query.edit_message_text(t("apply_amount_prompt", **mfo), reply_markup=back_keyboard(t, "apply", "button_cancel"),
+                                  parse_mode="Markdown")
 
-Введите желаемую сумму займа ({mfo['min_amount']:,} - {mfo['max_amount']:,} ₽):"""
-    
-    keyboard = [[InlineKeyboardButton("❌ Отмена", callback_data="apply")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
+async def apply_mfo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, mfo_id: str):
+    """Start application for legacy ``apply_<uuid>`` buttons"""
+    await update.callback_query.answer()
+    await start_application(update, context, await store.get_mfo(mfo_id))
+
+async def catalog_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, version: str, page: int):
+    """Catalog page; page numbers are clamped to the current catalog, so any version works"""
+    await update.callback_query.answer()
+    await show_catalog_page(update, context, page)
+
+async def apply_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, version: str, page: int):
+    await update.callback_query.answer()
+    await show_apply_page(update, context, page)
+
+async def resolve_catalog_button(update: Update, context: ContextTypes.DEFAULT_TYPE, version: str, position: int, fallback):
+    """MFO a compact button points at, or None after showing ``fallback`` for stale buttons"""
+    query = update.callback_query
+    index = await catalog.resolve(version, await user_segment(update, context))
+    if index is None:
+        t = await messages_for(update, context)
+        await query.answer(t("catalog_updated"))
+        await fallback(update, context)
+        return None
+    await query.answer()
+    return index.at(position) or {}
+
+async def catalog_mfo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, version: str, position: int):
+    mfo = await resolve_catalog_button(update, context, version, position, show_catalog_page)
+    if mfo is not None:
+        await show_mfo_detail(update, context, mfo)
+
+async def catalog_apply_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, version: str, position: int):
+    mfo = await resolve_catalog_button(update, context, version, position, show_apply_page)
+    if mfo is not None:
+        await start_application(update, context, mfo)
 
 async def compare_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Compare MFO offers"""
     query = update.callback_query
     await query.answer()
     
-    mfos = await db.mfos.find({"is_active": True}, {"_id": 0}).sort("interest_rate", 1).to_list(10)
+    index = await catalog.current(await user_segment(update, context))
+    mfos = index.mfos[:10]
+    t = await messages_for(update, context)
     
     if not mfos:
-        await query.edit_message_text(
-            "😔 Нет МФО для сравнения.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="back_main")]])
-        )
+        await query.edit_message_text(t("compare_empty"), reply_markup=back_keyboard(t))
         return
     
-    text = "📊 *Сравнение предложений*\n\n"
-    text += "Отсортировано по процентной ставке:\n\n"
-    
-    for i, mfo in enumerate(mfos, 1):
-        text += f"*{i}. {mfo['name']}*\n"
-        text += f"   💰 {mfo['min_amount']:,}-{mfo['max_amount']:,} ₽\n"
-        text += f"   📈 {mfo['interest_rate']}% | ✅ {mfo['approval_rate']}%\n\n"
+    text = t("compare_title") + "".join(t("compare_item", position=i, **mfo) for i, mfo in enumerate(mfos, 1))
     
     keyboard = [
-        [InlineKeyboardButton("📋 Подробнее в каталоге", callback_data="catalog")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="back_main")]
+        [InlineKeyboardButton(t("button_catalog_details"), callback_data="catalog")],
+        [InlineKeyboardButton(t("button_back"), callback_data="back_main")]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -244,20 +317,9 @@ async def about_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    about_text = await get_content("about_message",
-        "ℹ️ *О сервисе*\n\n"
-        "Мы помогаем найти лучшие предложения по микрозаймам.\n\n"
-        "✅ Актуальная информация о МФО\n"
-        "✅ Удобный калькулятор\n"
-        "✅ Быстрое оформление заявки\n"
-        "✅ Сравнение условий\n\n"
-        "Сервис бесплатный для пользователей."
-    )
-    
-    keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="back_main")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    t = await messages_for(update, context)
     
-    await query.edit_message_text(about_text, reply_markup=reply_markup, parse_mode="Markdown")
+    await query.edit_message_text(t("about_message"), reply_markup=back_keyboard(t), parse_mode="Markdown")
 
 async def back_main_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Return to main menu"""
@@ -266,80 +328,76 @@ async def back_main_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     user = update.effective_user
     context.user_data.clear()
+    t = await messages_for(update, context)
     
-    welcome_text = f"👋 {user.first_name}, выберите действие:"
-    
-    keyboard = [
-        [InlineKeyboardButton("📋 Каталог МФО", callback_data="catalog")],
-        [InlineKeyboardButton("🔢 Калькулятор займа", callback_data="calculator")],
-        [InlineKeyboardButton("📝 Подать заявку", callback_data="apply")],
-        [InlineKeyboardButton("📊 Сравнить предложения", callback_data="compare")],
-        [InlineKeyboardButton("ℹ️ О сервисе", callback_data="about")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(welcome_text, reply_markup=reply_markup)
+    await query.edit_message_text(t("menu_prompt", first_name=user.first_name), reply_markup=main_menu_keyboard(t))
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages for calculator and application"""
     user = update.effective_user
     text = update.message.text
-    await save_user(user)
+    tenant = tenant_of(context)
+    t = await messages_for(update, context)
+    
+    allowed, retry_after = await tenant.limiters["bot_message"].hit(user.id)
+    if not allowed:
+        # Warn once per throttling window, then drop silently
+        now = time.time()
+        if context.user_data.get("slow_down_until", 0) < now:
+            context.user_data["slow_down_until"] = now + retry_after
+            await update.message.reply_text(t("slow_down"))
+        return
+    
+    await save_user(tenant.store, user)
     
     # Calculator flow
     if context.user_data.get("calc_step") == "amount":
         try:
             amount = int(text.replace(" ", "").replace(",", ""))
             if amount < 1000 or amount > 100000:
-                await update.message.reply_text("❌ Введите сумму от 1000 до 100000 ₽")
+                await update.message.reply_text(t("calc_amount_range"))
                 return
             
             context.user_data["calc_amount"] = amount
             context.user_data["calc_step"] = "term"
             
-            await update.message.reply_text(
-                f"💰 Сумма: {amount:,} ₽\n\nТеперь введите срок займа (от 1 до 30 дней):",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="back_main")]])
-            )
+            await update.message.reply_text(t("calc_term_prompt", amount=amount), reply_markup=back_keyboard(t))
         except ValueError:
-            await update.message.reply_text("❌ Введите корректную сумму числом")
+            await update.message.reply_text(t("calc_amount_invalid"))
         return
     
     if context.user_data.get("calc_step") == "term":
         try:
             term = int(text)
             if term < 1 or term > 30:
-                await update.message.reply_text("❌ Введите срок от 1 до 30 дней")
+                await update.message.reply_text(t("calc_term_range"))
                 return
             
             amount = context.user_data["calc_amount"]
             
-            # Get best rates from MFOs
-            mfos = await db.mfos.find({"is_active": True}, {"_id": 0}).to_list(5)
+            # Best offers for this amount and term
+            mfos = (await catalog.current(segment_for(amount, term))).mfos[:5]
             
-            result_text = f"📊 *Результаты расчета*\n\n💰 Сумма: {amount:,} ₽\n📅 Срок: {term} дней\n\n"
+            result_text = t("calc_result", amount=amount, term=term)
             
             if mfos:
-                result_text += "*Предложения МФО:*\n\n"
+                result_text += t("calc_offers_title")
                 for mfo in mfos:
                     interest = amount * (mfo['interest_rate'] / 100) * term
-                    total = amount + interest
-                    result_text += f"🏦 *{mfo['name']}*\n"
-                    result_text += f"   Переплата: {interest:,.0f} ₽\n"
-                    result_text += f"   Вернуть: {total:,.0f} ₽\n\n"
+                    result_text += t("calc_offer", name=mfo['name'], interest=interest, total=amount + interest)
             
             context.user_data.clear()
             
             keyboard = [
-                [InlineKeyboardButton("📝 Подать заявку", callback_data="apply")],
-                [InlineKeyboardButton("🔄 Новый расчет", callback_data="calculator")],
-                [InlineKeyboardButton("🔙 Главное меню", callback_data="back_main")]
+                [InlineKeyboardButton(t("button_apply"), callback_data="apply")],
+                [InlineKeyboardButton(t("button_new_calculation"), callback_data="calculator")],
+                [InlineKeyboardButton(t("button_main_menu"), callback_data="back_main")]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             await update.message.reply_text(result_text, reply_markup=reply_markup, parse_mode="Markdown")
         except ValueError:
-            await update.message.reply_text("❌ Введите корректный срок числом")
+            await update.message.reply_text(t("calc_term_invalid"))
         return
     
     # Application flow
@@ -349,12 +407,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data["apply_amount"] = amount
             context.user_data["apply_step"] = "term"
             
-            await update.message.reply_text(
-                f"💰 Сумма: {amount:,} ₽\n\nВведите желаемый срок займа (дней):",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="apply")]])
-            )
+            await update.message.reply_text(t("apply_term_prompt", amount=amount),
+                                            reply_markup=back_keyboard(t, "apply", "button_cancel"))
         except ValueError:
-            await update.message.reply_text("❌ Введите корректную сумму")
+            await update.message.reply_text(t("apply_amount_invalid"))
         return
     
     if context.user_data.get("apply_step") == "term":
@@ -363,12 +419,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data["apply_term"] = term
             context.user_data["apply_step"] = "phone"
             
-            await update.message.reply_text(
-                "📱 Введите ваш номер телефона для связи:",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="apply")]])
-            )
+            await update.message.reply_text(t("apply_phone_prompt"), reply_markup=back_keyboard(t, "apply", "button_cancel"))
         except ValueError:
-            await update.message.reply_text("❌ Введите корректный срок")
+            await update.message.reply_text(t("apply_term_invalid"))
         return
     
     if context.user_data.get("apply_step") == "phone":
@@ -385,64 +438,190 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "term": context.user_data["apply_term"],
             "phone": phone,
             "status": "pending",
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc),
+            "funnel_day": None,
         }
-        await db.applications.insert_one(app_doc)
+        # Stored first; the funnel counts it and fills in funnel_day
+        await tenant.store.submit_application(app_doc)
         
         context.user_data.clear()
+        context.user_data["segment"] = await tenant.store.update_user_segment(user.id)
         
-        success_text = f"""✅ *Заявка успешно отправлена!*
-
-🏦 МФО: {app_doc['mfo_name']}
-💰 Сумма: {app_doc['amount']:,} ₽
-📅 Срок: {app_doc['term']} дней
-📱 Телефон: {phone}
-
-С вами свяжутся в ближайшее время."""
-        
-        keyboard = [[InlineKeyboardButton("🔙 Главное меню", callback_data="back_main")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(success_text, reply_markup=reply_markup, parse_mode="Markdown")
+        await update.message.reply_text(t("apply_success", **app_doc), reply_markup=back_keyboard(t, label="button_main_menu"),
+                                        parse_mode="Markdown")
         return
     
     # Default - show menu
-    keyboard = [
-        [InlineKeyboardButton("📋 Каталог МФО", callback_data="catalog")],
-        [InlineKeyboardButton("🔢 Калькулятор займа", callback_data="calculator")],
-        [InlineKeyboardButton("📝 Подать заявку", callback_data="apply")],
-        [InlineKeyboardButton("📊 Сравнить предложения", callback_data="compare")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(
-        "Используйте кнопки для навигации или команду /start",
-        reply_markup=reply_markup
-    )
+    await update.message.reply_text(t("menu_hint"), reply_markup=main_menu_keyboard(t, about=False))
 
-def main():
-    """Start the bot"""
-    if not TELEGRAM_TOKEN:
-        logger.error("TELEGRAM_TOKEN not set")
+async def handle_error(update: object, context: ContextTypes.DEFAULT_TYPE):
+    """Log handler errors; tell the user to retry when MongoDB is out and nothing cached could answer"""
+    if not isinstance(context.error, StoreUnavailable):
+        # With any error handler registered PTB no longer logs errors itself
+        logger.error(f"Error while handling update {update}", exc_info=context.error)
         return
-    
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    logger.warning(f"Store unavailable: {context.error}")
+    if not isinstance(update, Update) or update.effective_chat is None:
+        return
+    t = await messages_for(update, context)
+    await context.bot.send_message(update.effective_chat.id, t("store_unavailable"),
+                                   reply_markup=main_menu_keyboard(t, about=False))
+
+async def log_metrics():
+    """Periodically log handler and rate limit counters"""
+    while True:
+        await asyncio.sleep(METRICS_LOG_INTERVAL)
+        logger.info(f"Metrics: {registry.snapshot()}")
+
+def maintenance_scheduler() -> Scheduler:
+    """Same jobs as the API; the process holding a job's lease runs it"""
+    scheduler = Scheduler(db)
+    add_maintenance_jobs(scheduler, db)
+    return scheduler
+
+async def post_init(application: Application):
+    """Prepare database indexes before polling starts"""
+    await ensure_tenant_indexes(default_tenant)
+    application.create_task(log_metrics())
+    if isinstance(store, MongoStore):
+        application.create_task(maintenance_scheduler().run())
+
+async def post_shutdown(application: Application):
+    if recorder is not None:
+        recorder.flush()
+    store.close()
+
+def build_router() -> CallbackRouter:
+    """Map callback payloads to handlers"""
+    router = CallbackRouter()
+    router.on("catalog", catalog_callback)
+    router.on("calculator", calculator_callback)
+    router.on("apply", apply_callback)
+    router.on("compare", compare_callback)
+    router.on("about", about_callback)
+    router.on("back_main", back_main_callback)
+    router.on_action(CATALOG_PAGE, catalog_page_callback)
+    router.on_action(MFO_DETAIL, catalog_mfo_callback)
+    router.on_action(APPLY_PAGE, apply_page_callback)
+    router.on_action(APPLY_MFO, catalog_apply_callback)
+    # Buttons sent before the compact codec
+    router.on_prefix("mfo", mfo_detail_callback)
+    router.on_prefix("apply", apply_mfo_callback)
+    return router
+
+def update_unit_name(update) -> str:
+    """Query log name of an update until a handler refines it"""
+    if isinstance(update, Update):
+        if update.callback_query:
+            return "bot:callback"
+        text = update.message.text if update.message else None
+        if text and text.startswith("/"):
+            return f"bot:command:{text.split()[0][1:].split('@')[0]}"
+        if update.message:
+            return "bot:message"
+    return "bot:update"
+
+class BotApplication(Application):
+    """Application that charges the Mongo commands of each update to it (see querylog),
+    records per-tenant throughput and latency and forgets idle conversations.
+
+    python-telegram-bot keeps ``user_data`` for every user who ever wrote,
+    so users who leave the calculator or application wizard halfway would
+    stay in memory for the life of the process. It also remembers every
+    user and chat id for a persistence flush, which never happens here.
+
+    ``process_update`` hands handler exceptions to the error handlers and
+    returns normally; ``process_update_or_raise`` re-raises them for callers
+    that retry failed updates (bot_workers.py).
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # user id -> last update, least recently active first
+        self.last_seen = OrderedDict()
+
+    def sweep_idle_sessions(self, now: float = None) -> int:
+        """Drop user and private chat data of users idle for ``SESSION_IDLE_TTL``"""
+        now = time.monotonic() if now is None else now
+        swept = 0
+        while self.last_seen:
+            user_id, seen = next(iter(self.last_seen.items()))
+            if now - seen < SESSION_IDLE_TTL:
+                break
+            del self.last_seen[user_id]
+            self.drop_user_data(user_id)
+            self.drop_chat_data(user_id)
+            swept += 1
+        tenant = self.bot_data.get("tenant", default_tenant)
+        if swept:
+            registry.inc(f"bot.tenant.{tenant.name}.sessions_swept", swept)
+        registry.set(f"bot.tenant.{tenant.name}.sessions", len(self.last_seen))
+        return swept
+
+    async def process_error(self, update, error, job=None, coroutine=None) -> bool:
+        errors = update_errors.get()
+        if errors is not None and update is not None and job is None:
+            errors.append(error)
+        return await super().process_error(update, error, job=job, coroutine=coroutine)
+
+    async def process_update_or_raise(self, update: object) -> None:
+        """``process_update``, then raise the first error a handler raised for it"""
+        token = update_errors.set([])
+        try:
+            await self.process_update(update)
+            errors = update_errors.get()
+        finally:
+            update_errors.reset(token)
+        if errors:
+            raise errors[0]
+
+    async def process_update(self, update: object) -> None:
+        tenant = self.bot_data.get("tenant", default_tenant)
+        started = time.perf_counter()
+        try:
+            with unit_of_work(update_unit_name(update)):
+                await super().process_update(update)
+        finally:
+            registry.inc(f"bot.tenant.{tenant.name}.updates")
+            registry.observe(f"bot.tenant.{tenant.name}.ms", (time.perf_counter() - started) * 1000)
+            if isinstance(update, Update) and update.effective_user is not None:
+                # Seen once the handlers are done, so a sweep racing them cannot orphan their user_data
+                self.last_seen[update.effective_user.id] = time.monotonic()
+                self.last_seen.move_to_end(update.effective_user.id)
+            self.sweep_idle_sessions()
+            if self.persistence is None:
+                # Every update and drop marks ids for a persistence flush that never comes
+                self._user_ids_to_be_updated_in_persistence.clear()
+                self._chat_ids_to_be_updated_in_persistence.clear()
+                self._user_ids_to_be_deleted_in_persistence.clear()
+                self._chat_ids_to_be_deleted_in_persistence.clear()
+
+def register_handlers(application: Application):
+    """Attach the bot's handlers to an application"""
+    if recorder is not None:
+        # Runs before the handlers below, in its own group
+        application.add_handler(TypeHandler(Update, recorder.handle), group=-1)
     
     # Commands
     application.add_handler(CommandHandler("start", start_command))
     
     # Callbacks
-    application.add_handler(CallbackQueryHandler(catalog_callback, pattern="^catalog$"))
-    application.add_handler(CallbackQueryHandler(mfo_detail_callback, pattern="^mfo_"))
-    application.add_handler(CallbackQueryHandler(calculator_callback, pattern="^calculator$"))
-    application.add_handler(CallbackQueryHandler(apply_callback, pattern="^apply$"))
-    application.add_handler(CallbackQueryHandler(apply_mfo_callback, pattern="^apply_"))
-    application.add_handler(CallbackQueryHandler(compare_callback, pattern="^compare$"))
-    application.add_handler(CallbackQueryHandler(about_callback, pattern="^about$"))
-    application.add_handler(CallbackQueryHandler(back_main_callback, pattern="^back_main$"))
+    application.add_handler(CallbackQueryHandler(build_router().dispatch))
     
     # Messages
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+
+    application.add_error_handler(handle_error)
+
+def main():
+    """Start the bot"""
+    if not TELEGRAM_TOKEN:
+        logger.error("TELEGRAM_TOKEN not set")
+        return
+    
+    application = Application.builder().token(TELEGRAM_TOKEN).application_class(BotApplication) \
+        .post_init(post_init).post_shutdown(post_shutdown).build()
+    register_handlers(application)
     
     logger.info("Bot started!")
     application.run_polling(drop_pending_updates=True)
@@ -220,6 +220,34 @@ class MicroloanBotAPITester:
         )
         return success
 
+    def test_bulk_application_status(self):
+        """Test bulk application status update"""
+        if not self.created_app_id:
+            print("❌ Skipping bulk status update - no application created")
+            return False
+
+        success, response = self.run_test(
+            "Bulk Application Status",
+            "POST",
+            "applications/bulk/status",
+            200,
+            data={"status": "rejected", "ids": [self.created_app_id, "missing-id"]}
+        )
+        if success:
+            results = {item["id"]: item["result"] for item in response.get("results", [])}
+            success = results.get(self.created_app_id) == "updated" and results.get("missing-id") == "not_found"
+        return success
+
+    def test_export_mfos(self):
+        """Test MFO export"""
+        success, response = self.run_test(
+            "Export MFOs",
+            "GET",
+            "mfos/export?format=json",
+            200
+        )
+        return success
+
     def test_get_stats(self):
         """Test getting statistics"""
         success, response = self.run_test(
@@ -309,6 +337,8 @@ def main():
         ("Create Application", tester.test_create_application),
         ("Get Applications", tester.test_get_applications),
         ("Update Application Status", tester.test_update_application_status),
+        ("Bulk Application Status", tester.test_bulk_application_status),
+        ("Export MFOs", tester.test_export_mfos),
         ("Get Statistics", tester.test_get_stats),
         ("Get Analytics", tester.test_get_analytics),
         ("Get Bot Users", tester.test_get_users),
@@ -0,0 +1,13 @@
+import { useEffect, useState } from "react";
+
+// Value that only follows `value` once it has stopped changing for `delay` ms
+export function useDebounce(value, delay = 300) {
+  const [debounced, setDebounced] = useState(value);
+
+  useEffect(() => {
+    const timer = setTimeout(() => setDebounced(value), delay);
+    return () => clearTimeout(timer);
+  }, [value, delay]);
+
+  return debounced;
+}
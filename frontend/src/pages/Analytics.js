@@ -1,7 +1,8 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import axios from "axios";
 import { useAuth } from "../context/AuthContext";
 import { Card, CardContent, CardHeader, CardTitle } from "../components/ui/card";
+import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "../components/ui/table";
 import { 
   AreaChart, Area, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, 
   PieChart, Pie, Cell, LineChart, Line, BarChart, Bar, Legend 
@@ -10,17 +11,50 @@ import { TrendingUp, Users, MousePointerClick, FileText } from "lucide-react";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
+// Refetch at most this often when live events arrive
+const REFRESH_MS = 10000;
+
 const COLORS = ['#3B82F6', '#10B981', '#F59E0B', '#EF4444', '#8B5CF6'];
 
 export default function Analytics() {
   const { getAuthHeader } = useAuth();
   const [analytics, setAnalytics] = useState(null);
+  const [funnel, setFunnel] = useState(null);
   const [loading, setLoading] = useState(true);
+  const refreshTimer = useRef(null);
 
   useEffect(() => {
     fetchAnalytics();
+    fetchFunnel();
+  }, []);
+
+  useEffect(() => {
+    const source = new EventSource(`${API}/events/stream?token=${encodeURIComponent(localStorage.getItem("token"))}`);
+    const scheduleRefresh = () => {
+      if (refreshTimer.current) return;
+      refreshTimer.current = setTimeout(() => {
+        refreshTimer.current = null;
+        fetchAnalytics();
+        fetchFunnel();
+      }, REFRESH_MS);
+    };
+    source.addEventListener("application_created", scheduleRefresh);
+    source.addEventListener("application_status", scheduleRefresh);
+    return () => {
+      source.close();
+      clearTimeout(refreshTimer.current);
+    };
   }, []);
 
+  const fetchFunnel = async () => {
+    try {
+      const res = await axios.get(`${API}/analytics/funnel`, { headers: getAuthHeader(), params: { days: 30 } });
+      setFunnel(res.data);
+    } catch (error) {
+      console.error("Error fetching funnel:", error);
+    }
+  };
+
   const fetchAnalytics = async () => {
     try {
       const res = await axios.get(`${API}/analytics`, { headers: getAuthHeader() });
@@ -313,6 +347,51 @@ export default function Analytics() {
           </CardContent>
         </Card>
       </div>
+
+      {/* Funnel */}
+      <Card className="bg-[#0A0A0A] border-white/10" data-testid="funnel-card">
+        <CardHeader>
+          <CardTitle className="text-lg text-white">Воронка по МФО за 30 дней</CardTitle>
+        </CardHeader>
+        <CardContent className="p-0">
+          <Table>
+            <TableHeader>
+              <TableRow className="border-white/10 hover:bg-transparent">
+                <TableHead className="table-header">МФО</TableHead>
+                <TableHead className="table-header text-right">Просмотры</TableHead>
+                <TableHead className="table-header text-right">Начали заявку</TableHead>
+                <TableHead className="table-header text-right">Отправили</TableHead>
+                <TableHead className="table-header text-right">Одобрено</TableHead>
+                <TableHead className="table-header text-right">Без просмотра</TableHead>
+                <TableHead className="table-header text-right">Конверсия</TableHead>
+              </TableRow>
+            </TableHeader>
+            <TableBody>
+              {!funnel?.by_mfo?.length ? (
+                <TableRow>
+                  <TableCell colSpan={7} className="text-center text-zinc-500 py-8">
+                    Нет данных для отображения
+                  </TableCell>
+                </TableRow>
+              ) : (
+                funnel.by_mfo.map((row) => (
+                  <TableRow key={row.mfo_id} className="border-white/10 table-row">
+                    <TableCell className="text-white">{row.name || row.mfo_id}</TableCell>
+                    <TableCell className="text-right text-zinc-300">{row.views}</TableCell>
+                    <TableCell className="text-right text-zinc-300">{row.started}</TableCell>
+                    <TableCell className="text-right text-zinc-300">{row.submitted}</TableCell>
+                    <TableCell className="text-right text-zinc-300">{row.approved}</TableCell>
+                    <TableCell className="text-right text-zinc-500">
+                      {row.unattributed.submitted} / {row.unattributed.approved}
+                    </TableCell>
+                    <TableCell className="text-right text-white">{row.rates.view_to_submit}%</TableCell>
+                  </TableRow>
+                ))
+              )}
+            </TableBody>
+          </Table>
+        </CardContent>
+      </Card>
     </div>
   );
 }
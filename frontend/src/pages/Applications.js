@@ -1,15 +1,19 @@
 import { useState, useEffect } from "react";
 import axios from "axios";
 import { useAuth } from "../context/AuthContext";
+import { useDebounce } from "../hooks/use-debounce";
 import { Card, CardContent } from "../components/ui/card";
 import { Button } from "../components/ui/button";
+import { Input } from "../components/ui/input";
+import { Checkbox } from "../components/ui/checkbox";
 import { Badge } from "../components/ui/badge";
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "../components/ui/select";
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "../components/ui/table";
 import { toast } from "sonner";
-import { Clock, CheckCircle, XCircle, User, Phone, Building2 } from "lucide-react";
+import { Clock, CheckCircle, XCircle, User, Phone, Building2, ChevronLeft, ChevronRight } from "lucide-react";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+const PAGE_SIZE = 50;
 
 const statusConfig = {
   pending: { label: "Ожидает", color: "bg-amber-500/20 text-amber-500 border-amber-500/30", icon: Clock },
@@ -20,17 +24,40 @@ const statusConfig = {
 export default function Applications() {
   const { getAuthHeader } = useAuth();
   const [applications, setApplications] = useState([]);
+  const [summary, setSummary] = useState({ pending: 0, approved: 0, rejected: 0 });
+  const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(true);
   const [filter, setFilter] = useState("all");
+  const [phone, setPhone] = useState("");
+  const [dateFrom, setDateFrom] = useState("");
+  const [dateTo, setDateTo] = useState("");
+  const [page, setPage] = useState(0);
+  const [selected, setSelected] = useState([]);
+  // Typed filters query the API once typing pauses, not on every keystroke
+  const phoneQuery = useDebounce(phone);
+  const dateFromQuery = useDebounce(dateFrom);
+  const dateToQuery = useDebounce(dateTo);
 
   useEffect(() => {
     fetchApplications();
+  }, [filter, phoneQuery, dateFromQuery, dateToQuery, page]);
+
+  useEffect(() => {
+    fetchSummary();
   }, []);
 
   const fetchApplications = async () => {
+    const params = { skip: page * PAGE_SIZE, limit: PAGE_SIZE };
+    if (filter !== "all") params.status = filter;
+    if (phoneQuery) params.phone = phoneQuery;
+    if (dateFromQuery) params.date_from = new Date(dateFromQuery).toISOString();
+    // Midnight: the API includes the whole day
+    if (dateToQuery) params.date_to = new Date(dateToQuery).toISOString();
     try {
-      const res = await axios.get(`${API}/applications`, { headers: getAuthHeader() });
+      const res = await axios.get(`${API}/applications`, { headers: getAuthHeader(), params });
       setApplications(res.data);
+      setSelected([]);
+      setTotal(parseInt(res.headers["x-total-count"] || res.data.length, 10));
     } catch (error) {
       toast.error("Ошибка загрузки заявок");
     } finally {
@@ -38,19 +65,53 @@ export default function Applications() {
     }
   };
 
+  const fetchSummary = async () => {
+    try {
+      const res = await axios.get(`${API}/applications/summary`, { headers: getAuthHeader() });
+      setSummary(res.data.by_status);
+    } catch (error) {
+      console.error("Error fetching summary:", error);
+    }
+  };
+
   const handleStatusChange = async (appId, newStatus) => {
     try {
       await axios.put(`${API}/applications/${appId}/status?status=${newStatus}`, {}, { headers: getAuthHeader() });
       toast.success("Статус обновлен");
       fetchApplications();
+      fetchSummary();
     } catch (error) {
       toast.error("Ошибка обновления статуса");
     }
   };
 
-  const filteredApps = filter === "all" 
-    ? applications 
-    : applications.filter(app => app.status === filter);
+  const handleBulkStatus = async (newStatus) => {
+    try {
+      const res = await axios.post(
+        `${API}/applications/bulk/status`,
+        { status: newStatus, ids: selected },
+        { headers: getAuthHeader() }
+      );
+      toast.success(`Обновлено заявок: ${res.data.modified}`);
+      fetchApplications();
+      fetchSummary();
+    } catch (error) {
+      toast.error("Ошибка массового обновления");
+    }
+  };
+
+  const toggleSelected = (appId, checked) => {
+    setSelected(checked ? [...selected, appId] : selected.filter(id => id !== appId));
+  };
+
+  const allSelected = applications.length > 0 && selected.length === applications.length;
+
+  const updateFilter = (setter) => (value) => {
+    setter(value);
+    setPage(0);
+  };
+
+  const pageCount = Math.max(1, Math.ceil(total / PAGE_SIZE));
 
   const formatDate = (dateStr) => {
     return new Date(dateStr).toLocaleString("ru-RU", {
@@ -77,17 +138,40 @@ export default function Applications() {
           <h1 className="text-2xl font-bold text-white mb-2">Заявки</h1>
           <p className="text-zinc-500">Управление заявками пользователей</p>
         </div>
-        <Select value={filter} onValueChange={setFilter}>
-          <SelectTrigger className="w-48 bg-[#121212] border-white/10" data-testid="filter-select">
-            <SelectValue placeholder="Фильтр" />
-          </SelectTrigger>
-          <SelectContent className="bg-[#0A0A0A] border-white/10">
-            <SelectItem value="all">Все заявки</SelectItem>
-            <SelectItem value="pending">Ожидают</SelectItem>
-            <SelectItem value="approved">Одобрены</SelectItem>
-            <SelectItem value="rejected">Отклонены</SelectItem>
-          </SelectContent>
-        </Select>
+        <div className="flex items-center gap-2 flex-wrap">
+          <Input
+            value={phone}
+            onChange={(e) => updateFilter(setPhone)(e.target.value.trim())}
+            placeholder="Телефон"
+            className="w-40 bg-[#121212] border-white/10"
+            data-testid="phone-filter"
+          />
+          <Input
+            type="date"
+            value={dateFrom}
+            onChange={(e) => updateFilter(setDateFrom)(e.target.value)}
+            className="w-40 bg-[#121212] border-white/10"
+            data-testid="date-from-filter"
+          />
+          <Input
+            type="date"
+            value={dateTo}
+            onChange={(e) => updateFilter(setDateTo)(e.target.value)}
+            className="w-40 bg-[#121212] border-white/10"
+            data-testid="date-to-filter"
+          />
+          <Select value={filter} onValueChange={updateFilter(setFilter)}>
+            <SelectTrigger className="w-48 bg-[#121212] border-white/10" data-testid="filter-select">
+              <SelectValue placeholder="Фильтр" />
+            </SelectTrigger>
+            <SelectContent className="bg-[#0A0A0A] border-white/10">
+              <SelectItem value="all">Все заявки</SelectItem>
+              <SelectItem value="pending">Ожидают</SelectItem>
+              <SelectItem value="approved">Одобрены</SelectItem>
+              <SelectItem value="rejected">Отклонены</SelectItem>
+            </SelectContent>
+          </Select>
+        </div>
       </div>
 
       {/* Stats */}
@@ -99,7 +183,7 @@ export default function Applications() {
             </div>
             <div>
               <p className="text-2xl font-bold text-white">
-                {applications.filter(a => a.status === "pending").length}
+                {summary.pending || 0}
               </p>
               <p className="text-sm text-zinc-500">Ожидают</p>
             </div>
@@ -112,7 +196,7 @@ export default function Applications() {
             </div>
             <div>
               <p className="text-2xl font-bold text-white">
-                {applications.filter(a => a.status === "approved").length}
+                {summary.approved || 0}
               </p>
               <p className="text-sm text-zinc-500">Одобрено</p>
             </div>
@@ -125,7 +209,7 @@ export default function Applications() {
             </div>
             <div>
               <p className="text-2xl font-bold text-white">
-                {applications.filter(a => a.status === "rejected").length}
+                {summary.rejected || 0}
               </p>
               <p className="text-sm text-zinc-500">Отклонено</p>
             </div>
@@ -133,12 +217,32 @@ export default function Applications() {
         </Card>
       </div>
 
+      {/* Bulk actions */}
+      {selected.length > 0 && (
+        <div className="flex items-center gap-2 text-sm text-zinc-400" data-testid="bulk-actions">
+          <span>Выбрано: {selected.length}</span>
+          <Button size="sm" variant="outline" onClick={() => handleBulkStatus("approved")} data-testid="bulk-approve">
+            Одобрить
+          </Button>
+          <Button size="sm" variant="outline" onClick={() => handleBulkStatus("rejected")} data-testid="bulk-reject">
+            Отклонить
+          </Button>
+        </div>
+      )}
+
       {/* Table */}
       <Card className="bg-[#0A0A0A] border-white/10">
         <CardContent className="p-0">
           <Table>
             <TableHeader>
               <TableRow className="border-white/10 hover:bg-transparent">
+                <TableHead className="table-header w-10">
+                  <Checkbox
+                    checked={allSelected}
+                    onCheckedChange={(checked) => setSelected(checked ? applications.map(app => app.id) : [])}
+                    data-testid="select-all"
+                  />
+                </TableHead>
                 <TableHead className="table-header">Пользователь</TableHead>
                 <TableHead className="table-header">МФО</TableHead>
                 <TableHead className="table-header">Сумма</TableHead>
@@ -150,18 +254,25 @@ export default function Applications() {
               </TableRow>
             </TableHeader>
             <TableBody>
-              {filteredApps.length === 0 ? (
+              {applications.length === 0 ? (
                 <TableRow>
-                  <TableCell colSpan={8} className="text-center text-zinc-500 py-8">
+                  <TableCell colSpan={9} className="text-center text-zinc-500 py-8">
                     Нет заявок
                   </TableCell>
                 </TableRow>
               ) : (
-                filteredApps.map((app) => {
+                applications.map((app) => {
                   const status = statusConfig[app.status];
                   const StatusIcon = status.icon;
                   return (
                     <TableRow key={app.id} className="border-white/10 table-row" data-testid={`app-row-${app.id}`}>
+                      <TableCell>
+                        <Checkbox
+                          checked={selected.includes(app.id)}
+                          onCheckedChange={(checked) => toggleSelected(app.id, checked)}
+                          data-testid={`select-${app.id}`}
+                        />
+                      </TableCell>
                       <TableCell>
                         <div className="flex items-center gap-2">
                           <User className="w-4 h-4 text-zinc-500" />
@@ -219,6 +330,20 @@ export default function Applications() {
           </Table>
         </CardContent>
       </Card>
+
+      {/* Pagination */}
+      <div className="flex items-center justify-between text-sm text-zinc-500">
+        <span>Всего: {total}</span>
+        <div className="flex items-center gap-2">
+          <Button variant="outline" size="sm" disabled={page === 0} onClick={() => setPage(page - 1)} data-testid="prev-page">
+            <ChevronLeft className="w-4 h-4" />
+          </Button>
+          <span>{page + 1} / {pageCount}</span>
+          <Button variant="outline" size="sm" disabled={page + 1 >= pageCount} onClick={() => setPage(page + 1)} data-testid="next-page">
+            <ChevronRight className="w-4 h-4" />
+          </Button>
+        </div>
+      </div>
     </div>
   );
 }
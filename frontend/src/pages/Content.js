@@ -25,7 +25,7 @@ export default function Content() {
   const [loading, setLoading] = useState(true);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingContent, setEditingContent] = useState(null);
-  const [formData, setFormData] = useState({ key: "", value: "", description: "" });
+  const [formData, setFormData] = useState({ key: "", value: "", description: "", translations: {} });
   const [saving, setSaving] = useState(false);
 
   useEffect(() => {
@@ -46,10 +46,15 @@ export default function Content() {
   const handleOpenDialog = (content = null) => {
     if (content) {
       setEditingContent(content);
-      setFormData({ key: content.key, value: content.value, description: content.description });
+      setFormData({
+        key: content.key,
+        value: content.value,
+        description: content.description,
+        translations: content.translations || {}
+      });
     } else {
       setEditingContent(null);
-      setFormData({ key: "", value: "", description: "" });
+      setFormData({ key: "", value: "", description: "", translations: {} });
     }
     setDialogOpen(true);
   };
@@ -57,12 +62,17 @@ export default function Content() {
   const handleSubmit = async (e) => {
     e.preventDefault();
     setSaving(true);
+    // Empty translations fall back to the Russian text
+    const translations = Object.fromEntries(
+      Object.entries(formData.translations).filter(([, text]) => text.trim())
+    );
+    const payload = { ...formData, translations };
     try {
       if (editingContent) {
-        await axios.put(`${API}/content/${editingContent.id}`, formData, { headers: getAuthHeader() });
+        await axios.put(`${API}/content/${editingContent.id}`, payload, { headers: getAuthHeader() });
         toast.success("Контент обновлен");
       } else {
-        await axios.post(`${API}/content`, formData, { headers: getAuthHeader() });
+        await axios.post(`${API}/content`, payload, { headers: getAuthHeader() });
         toast.success("Контент создан");
       }
       setDialogOpen(false);
@@ -164,10 +174,24 @@ export default function Content() {
                   data-testid="content-value-input"
                 />
                 <p className="text-xs text-zinc-500">
-                  Поддерживается Markdown: *жирный*, _курсив_
+                  Поддерживается Markdown: *жирный*, _курсив_. Подстановки в фигурных скобках, например {"{first_name}"}
                 </p>
               </div>
 
+              <div className="space-y-2">
+                <Label className="text-zinc-400">Текст (English)</Label>
+                <Textarea
+                  value={formData.translations.en || ""}
+                  onChange={(e) => setFormData({
+                    ...formData,
+                    translations: { ...formData.translations, en: e.target.value }
+                  })}
+                  className="bg-[#121212] border-white/10 min-h-[100px]"
+                  placeholder="Для пользователей с английским языком в Telegram"
+                  data-testid="content-value-en-input"
+                />
+              </div>
+
               <div className="flex gap-3 pt-4">
                 <Button 
                   type="button" 
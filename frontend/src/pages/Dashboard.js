@@ -1,37 +1,77 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import axios from "axios";
 import { useAuth } from "../context/AuthContext";
 import { Card, CardContent, CardHeader, CardTitle } from "../components/ui/card";
+import { Badge } from "../components/ui/badge";
 import { Users, Building2, FileText, MousePointerClick, Clock, TrendingUp } from "lucide-react";
 import { AreaChart, Area, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, BarChart, Bar } from "recharts";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+// Charts are refetched at most this often when live events arrive
+const ANALYTICS_REFRESH_MS = 10000;
+
+const statusConfig = {
+  pending: { label: "Ожидает", color: "bg-amber-500/20 text-amber-500 border-amber-500/30" },
+  approved: { label: "Одобрено", color: "bg-emerald-500/20 text-emerald-500 border-emerald-500/30" },
+  rejected: { label: "Отклонено", color: "bg-red-500/20 text-red-500 border-red-500/30" }
+};
 
 export default function Dashboard() {
   const { getAuthHeader } = useAuth();
   const [stats, setStats] = useState(null);
   const [analytics, setAnalytics] = useState(null);
+  const [recentApplications, setRecentApplications] = useState([]);
   const [loading, setLoading] = useState(true);
+  const analyticsTimer = useRef(null);
+  // ETag of the last response per section list, sent back for 304 revalidation
+  const etags = useRef({});
 
   useEffect(() => {
     fetchData();
   }, []);
 
-  const fetchData = async () => {
+  // Stats are pushed by the server; charts are refetched when applications change
+  useEffect(() => {
+    const source = new EventSource(`${API}/events/stream?token=${encodeURIComponent(localStorage.getItem("token"))}`);
+    const scheduleAnalytics = () => {
+      if (analyticsTimer.current) return;
+      analyticsTimer.current = setTimeout(() => {
+        analyticsTimer.current = null;
+        fetchDashboard("analytics,recent_applications");
+      }, ANALYTICS_REFRESH_MS);
+    };
+    source.addEventListener("stats", (e) => setStats(JSON.parse(e.data).stats));
+    source.addEventListener("application_created", scheduleAnalytics);
+    source.addEventListener("application_status", scheduleAnalytics);
+    return () => {
+      source.close();
+      clearTimeout(analyticsTimer.current);
+    };
+  }, []);
+
+  const fetchDashboard = async (sections) => {
+    const headers = { ...getAuthHeader() };
+    if (etags.current[sections]) headers["If-None-Match"] = etags.current[sections];
     try {
-      const [statsRes, analyticsRes] = await Promise.all([
-        axios.get(`${API}/stats`, { headers: getAuthHeader() }),
-        axios.get(`${API}/analytics`, { headers: getAuthHeader() })
-      ]);
-      setStats(statsRes.data);
-      setAnalytics(analyticsRes.data);
+      const res = await axios.get(`${API}/dashboard`, {
+        headers,
+        params: { sections },
+        validateStatus: (status) => status === 200 || status === 304
+      });
+      if (res.status === 304) return;
+      etags.current[sections] = res.headers.etag;
+      if (res.data.stats) setStats(res.data.stats);
+      if (res.data.analytics) setAnalytics(res.data.analytics);
+      if (res.data.recent_applications) setRecentApplications(res.data.recent_applications);
     } catch (error) {
-      console.error("Error fetching data:", error);
+      console.error("Error fetching dashboard:", error);
     } finally {
       setLoading(false);
     }
   };
 
+  const fetchData = () => fetchDashboard("stats,analytics,recent_applications");
+
   if (loading) {
     return (
       <div className="flex items-center justify-center h-64">
@@ -236,6 +276,33 @@ export default function Dashboard() {
           </div>
         </CardContent>
       </Card>
+
+      {/* Recent Applications */}
+      <Card className="bg-[#0A0A0A] border-white/10">
+        <CardHeader>
+          <CardTitle className="text-lg text-white">Последние заявки</CardTitle>
+        </CardHeader>
+        <CardContent>
+          {recentApplications.length === 0 ? (
+            <p className="text-sm text-zinc-500">Заявок пока нет</p>
+          ) : (
+            <div className="divide-y divide-white/5">
+              {recentApplications.map((app) => {
+                const status = statusConfig[app.status] || statusConfig.pending;
+                return (
+                  <div key={app.id} className="flex items-center justify-between py-3" data-testid={`recent-application-${app.id}`}>
+                    <div>
+                      <p className="text-sm text-white">{app.user_name}</p>
+                      <p className="text-xs text-zinc-500">{app.mfo_name} · {app.amount.toLocaleString("ru-RU")} ₽ · {app.term} дн.</p>
+                    </div>
+                    <Badge className={`${status.color} border`}>{status.label}</Badge>
+                  </div>
+                );
+              })}
+            </div>
+          )}
+        </CardContent>
+      </Card>
     </div>
   );
 }
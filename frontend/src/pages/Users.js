@@ -1,27 +1,44 @@
 import { useState, useEffect } from "react";
 import axios from "axios";
 import { useAuth } from "../context/AuthContext";
+import { useDebounce } from "../hooks/use-debounce";
 import { Card, CardContent } from "../components/ui/card";
 import { Badge } from "../components/ui/badge";
+import { Button } from "../components/ui/button";
+import { Input } from "../components/ui/input";
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "../components/ui/table";
 import { toast } from "sonner";
-import { User, Calendar, Clock, MessageCircle } from "lucide-react";
+import { User, Calendar, Clock, MessageCircle, Search, ChevronLeft, ChevronRight } from "lucide-react";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+const PAGE_SIZE = 50;
 
 export default function Users() {
   const { getAuthHeader } = useAuth();
   const [users, setUsers] = useState([]);
+  const [summary, setSummary] = useState({ total: 0, with_username: 0, today: 0, active_24h: 0 });
+  const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(true);
+  const [search, setSearch] = useState("");
+  const [page, setPage] = useState(0);
+  // Searches once typing pauses, not on every keystroke
+  const searchQuery = useDebounce(search);
 
   useEffect(() => {
     fetchUsers();
+  }, [searchQuery, page]);
+
+  useEffect(() => {
+    fetchSummary();
   }, []);
 
   const fetchUsers = async () => {
+    const params = { skip: page * PAGE_SIZE, limit: PAGE_SIZE };
+    if (searchQuery) params.search = searchQuery;
     try {
-      const res = await axios.get(`${API}/users`, { headers: getAuthHeader() });
+      const res = await axios.get(`${API}/users`, { headers: getAuthHeader(), params });
       setUsers(res.data);
+      setTotal(parseInt(res.headers["x-total-count"] || res.data.length, 10));
     } catch (error) {
       toast.error("Ошибка загрузки пользователей");
     } finally {
@@ -29,6 +46,17 @@ export default function Users() {
     }
   };
 
+  const fetchSummary = async () => {
+    try {
+      const res = await axios.get(`${API}/users/summary`, { headers: getAuthHeader() });
+      setSummary(res.data);
+    } catch (error) {
+      console.error("Error fetching summary:", error);
+    }
+  };
+
+  const pageCount = Math.max(1, Math.ceil(total / PAGE_SIZE));
+
   const formatDate = (dateStr) => {
     return new Date(dateStr).toLocaleString("ru-RU", {
       day: "2-digit",
@@ -49,9 +77,21 @@ export default function Users() {
 
   return (
     <div className="space-y-6" data-testid="users-page">
-      <div>
-        <h1 className="text-2xl font-bold text-white mb-2">Пользователи</h1>
-        <p className="text-zinc-500">Список пользователей Telegram бота</p>
+      <div className="flex items-center justify-between flex-wrap gap-4">
+        <div>
+          <h1 className="text-2xl font-bold text-white mb-2">Пользователи</h1>
+          <p className="text-zinc-500">Список пользователей Telegram бота</p>
+        </div>
+        <div className="relative">
+          <Search className="w-4 h-4 text-zinc-500 absolute left-3 top-1/2 -translate-y-1/2" />
+          <Input
+            value={search}
+            onChange={(e) => { setSearch(e.target.value.trim()); setPage(0); }}
+            placeholder="Username или имя"
+            className="w-64 pl-9 bg-[#121212] border-white/10"
+            data-testid="user-search"
+          />
+        </div>
       </div>
 
       {/* Stats */}
@@ -62,7 +102,7 @@ export default function Users() {
               <User className="w-5 h-5 text-blue-500" />
             </div>
             <div>
-              <p className="text-2xl font-bold text-white">{users.length}</p>
+              <p className="text-2xl font-bold text-white">{summary.total}</p>
               <p className="text-sm text-zinc-500">Всего</p>
             </div>
           </CardContent>
@@ -74,7 +114,7 @@ export default function Users() {
             </div>
             <div>
               <p className="text-2xl font-bold text-white">
-                {users.filter(u => u.username).length}
+                {summary.with_username}
               </p>
               <p className="text-sm text-zinc-500">С username</p>
             </div>
@@ -87,11 +127,7 @@ export default function Users() {
             </div>
             <div>
               <p className="text-2xl font-bold text-white">
-                {users.filter(u => {
-                  const created = new Date(u.created_at);
-                  const today = new Date();
-                  return created.toDateString() === today.toDateString();
-                }).length}
+                {summary.today}
               </p>
               <p className="text-sm text-zinc-500">Сегодня</p>
             </div>
@@ -104,11 +140,7 @@ export default function Users() {
             </div>
             <div>
               <p className="text-2xl font-bold text-white">
-                {users.filter(u => {
-                  const last = new Date(u.last_activity);
-                  const now = new Date();
-                  return (now - last) < 24 * 60 * 60 * 1000;
-                }).length}
+                {summary.active_24h}
               </p>
               <p className="text-sm text-zinc-500">Активны 24ч</p>
             </div>
@@ -181,6 +213,20 @@ export default function Users() {
           </Table>
         </CardContent>
       </Card>
+
+      {/* Pagination */}
+      <div className="flex items-center justify-between text-sm text-zinc-500">
+        <span>Найдено: {total}</span>
+        <div className="flex items-center gap-2">
+          <Button variant="outline" size="sm" disabled={page === 0} onClick={() => setPage(page - 1)} data-testid="prev-page">
+            <ChevronLeft className="w-4 h-4" />
+          </Button>
+          <span>{page + 1} / {pageCount}</span>
+          <Button variant="outline" size="sm" disabled={page + 1 >= pageCount} onClick={() => setPage(page + 1)} data-testid="next-page">
+            <ChevronRight className="w-4 h-4" />
+          </Button>
+        </div>
+      </div>
     </div>
   );
 }
@@ -0,0 +1,120 @@
+"""Shared test setup: backend imports, the ``mongo`` marker and a fake Bot API.
+
+Tests marked ``@pytest.mark.mongo`` (or with ``pytestmark``) run against the
+MongoDB in ``MONGO_URL`` and are skipped when no server is reachable.
+"""
+import functools
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+os.environ.pop("BOT_RECORD_PATH", None)
+
+@functools.lru_cache(maxsize=None)
+def mongo_available() -> bool:
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    try:
+        MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=500).admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mongo: needs the MongoDB in MONGO_URL; skipped when unreachable")
+
+def pytest_collection_modifyitems(config, items):
+    skip = pytest.mark.skip(reason="MongoDB not reachable")
+    for item in items:
+        if item.get_closest_marker("mongo") and not mongo_available():
+            item.add_marker(skip)
+
+# ==================== FAKE BOT API ====================
+
+class FakeBotAPI:
+    """What the fake server saw and will answer.
+
+    ``updates[token]`` is served once through ``getUpdates``. ``respond``
+    may return ``(http_status, payload)`` for a call to override the
+    default success; ``sent`` records ``(token, chat_id)`` per delivered
+    ``sendMessage``.
+    """
+
+    def __init__(self):
+        self.url = None
+        self.updates = {}
+        self.sent = []
+        self.respond = None
+        self.lock = threading.Lock()
+
+    def handle(self, token: str, method: str, params: dict):
+        if self.respond is not None:
+            answer = self.respond(token, method, params)
+            if answer is not None:
+                return answer
+        bot_id = int(token.split(":")[0])
+        if method == "getMe":
+            result = {"id": bot_id, "is_bot": True, "first_name": token, "username": f"bot{bot_id}"}
+        elif method == "getUpdates":
+            with self.lock:
+                result = self.updates.pop(token, [])
+            if not result:
+                # A short long-poll
+                threading.Event().wait(0.1)
+        elif method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            with self.lock:
+                self.sent.append((token, chat_id))
+                message_id = len(self.sent)
+            result = {"message_id": message_id, "date": 0, "chat": {"id": chat_id, "type": "private"},
+                      "text": params.get("text", "")}
+        else:
+            result = True
+        return 200, {"ok": True, "result": result}
+
+def _handler(api: FakeBotAPI):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params = json.loads(body or "{}")
+            else:
+                params = {key: values[0] for key, values in parse_qs(body).items()}
+            token, method = self.path.split("/bot", 1)[1].split("/")
+            status, payload = api.handle(token, method, params)
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # Long polls cancelled at shutdown
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+@pytest.fixture
+def fake_bot_api():
+    """A local Bot API server; point bots at ``f"{api.url}/bot"``"""
+    api = FakeBotAPI()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(api))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    api.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield api
+    server.shutdown()
@@ -0,0 +1,93 @@
+"""Admission control: AIMD limits per tier, queueing and shedding."""
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import APIRouter, FastAPI
+
+from admission import AdmissionController, priority, route_tier, CRITICAL, LOW, NORMAL
+from metrics import registry
+from querylog import QueryMonitor, unit_of_work
+
+TIERS = {
+    CRITICAL: {"max": 10, "min": 5, "step": 2, "backoff": 0.9, "tolerance": 4, "queue": 10, "wait": 1.0},
+    LOW: {"max": 4, "min": 1, "step": 1, "backoff": 0.5, "tolerance": 1, "queue": 1, "wait": 0.05},
+}
+
+def test_low_priority_backs_off_first_and_recovers_additively():
+    controller = AdmissionController(TIERS)
+    # Slow, but within the critical tier's tolerance
+    controller.tick(latency_ms=120)
+    assert controller.tiers[LOW].limit == 2 and controller.tiers[CRITICAL].limit == 10
+    controller.tick(latency_ms=500)
+    assert controller.tiers[LOW].limit == 1 and controller.tiers[CRITICAL].limit == 9
+    controller.tick(latency_ms=500)
+    assert controller.tiers[LOW].limit == 1
+    controller.tick(latency_ms=5)
+    controller.tick(latency_ms=5)
+    assert controller.tiers[LOW].limit == 3 and controller.tiers[CRITICAL].limit == 10
+    assert registry.snapshot("admission.")["gauges"]["admission.low.limit"] == 3
+
+def test_over_limit_requests_queue_then_shed():
+    async def main():
+        controller = AdmissionController(TIERS)
+        controller.tick(latency_ms=500)
+        controller.tick(latency_ms=500)
+        assert controller.tiers[LOW].limit == 1
+        shed_before = registry.snapshot()["counters"].get("admission.low.shed", 0)
+
+        assert await controller.acquire(LOW)
+        # Second request queues and gets the slot when the first finishes
+        waiting = asyncio.create_task(controller.acquire(LOW))
+        await asyncio.sleep(0)
+        # Queue is full: the third is shed at once
+        assert not await controller.acquire(LOW)
+        controller.release(LOW)
+        assert await waiting
+        # Nobody releases this time, so the queued request times out
+        assert not await controller.acquire(LOW)
+        controller.release(LOW)
+        assert controller.tiers[LOW].in_flight == 0
+        assert registry.snapshot()["counters"]["admission.low.shed"] == shed_before + 2
+        # Unknown and exempt tiers are never limited
+        assert await controller.acquire("exempt")
+    asyncio.run(main())
+
+def test_routes_are_classified_by_declared_priority():
+    app = FastAPI()
+    router = APIRouter(prefix="/api")
+
+    @router.get("/reports/{name}")
+    @priority(LOW)
+    async def report(name: str):
+        return {}
+
+    @router.get("/items")
+    async def items():
+        return []
+
+    app.include_router(router)
+
+    def scope(path):
+        return {"type": "http", "method": "GET", "path": path, "root_path": "", "query_string": b"", "headers": []}
+
+    assert route_tier(app, scope("/api/reports/daily")) == LOW
+    assert route_tier(app, scope("/api/items")) == NORMAL
+    assert route_tier(app, scope("/api/missing")) == NORMAL
+
+def _command(monitor: QueryMonitor, request_id: int, name: str, ms: float):
+    monitor.started(SimpleNamespace(request_id=request_id, command_name=name, command={name: "items"},
+                                    database_name="test"))
+    monitor.succeeded(SimpleNamespace(request_id=request_id, duration_micros=int(ms * 1000)))
+
+def test_latency_signal_counts_only_request_commands():
+    monitor = QueryMonitor()
+    controller = AdmissionController(TIERS)
+    controller._mongo_latency()
+    # A change stream waiting on an idle collection, outside any request
+    _command(monitor, 1, "getMore", 1000)
+    assert controller._mongo_latency() is None
+    with unit_of_work("test:admission", {"ops": 10, "ms": 10000}):
+        _command(monitor, 2, "find", 4)
+        _command(monitor, 3, "find", 6)
+    _command(monitor, 4, "getMore", 1000)
+    assert controller._mongo_latency() == 5
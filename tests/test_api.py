@@ -0,0 +1,180 @@
+"""API routes and helpers; route tests go through the ASGI app, each on its own database.
+
+Tests marked ``mongo`` need the MongoDB in ``MONGO_URL`` and are skipped when none is reachable.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from starlette.requests import Request
+
+import server
+from cache import TTLCache
+from funnel import funnel_report, record_status_changes, record_submitted, record_view
+
+def _with_api(monkeypatch, body):
+    """Run ``body(http, db)`` against the app with a fresh database and an admin logged in"""
+    async def main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+        db = client[f"api_{uuid.uuid4().hex[:8]}"]
+        monkeypatch.setattr(server, "db", db)
+        server.app.dependency_overrides[server.get_current_admin] = lambda: {"id": "admin", "email": "admin@test"}
+        transport = httpx.ASGITransport(app=server.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                await body(http, db)
+        finally:
+            server.app.dependency_overrides.clear()
+            await client.drop_database(db.name)
+            client.close()
+    asyncio.run(main())
+
+def _application(app_id: str, status: str = "pending") -> dict:
+    return {"id": app_id, "status": status, "mfo_id": "mfo-1", "mfo_name": "MFO", "amount": 10000, "term": 14,
+            "phone": "+79990000000", "user_telegram_id": 1, "user_name": "Ann", "created_at": datetime.now(timezone.utc)}
+
+@pytest.mark.mongo
+def test_bulk_status_skips_applications_changed_concurrently(monkeypatch):
+    recorded = []
+
+    async def record_status_changes(db, changes):
+        recorded.extend((app["id"], old, new) for app, old, new in changes)
+
+    monkeypatch.setattr(server, "record_status_changes", record_status_changes)
+    real_run_bulk = server.run_bulk
+
+    async def body(http, db):
+        await db.applications.insert_many([_application("a"), _application("b"), _application("c", "approved")])
+
+        async def racing_run_bulk(collection, requests, ordered=False):
+            # Another admin rejects "b" between our read and our write
+            await db.applications.update_one({"id": "b"}, {"$set": {"status": "rejected"}})
+            return await real_run_bulk(collection, requests, ordered)
+
+        monkeypatch.setattr(server, "run_bulk", racing_run_bulk)
+        response = await http.post("/api/applications/bulk/status", json={"status": "approved", "ids": ["a", "b", "c", "x"]})
+        assert response.status_code == 200
+        results = {item["id"]: item["result"] for item in response.json()["results"]}
+        assert results == {"a": "updated", "b": "conflict", "c": "unchanged", "x": "not_found"}
+        assert response.json()["modified"] == 1
+        assert recorded == [("a", "pending", "approved")]
+        assert (await db.applications.find_one({"id": "b"}))["status"] == "rejected"
+        # The operation tag does not stay behind
+        assert "status_ops" not in await db.applications.find_one({"id": "a"})
+
+    _with_api(monkeypatch, body)
+
+@pytest.mark.mongo
+def test_bulk_status_rejects_filters_over_the_limit(monkeypatch):
+    monkeypatch.setattr(server, "BULK_MAX_ITEMS", 1)
+
+    async def body(http, db):
+        await db.applications.insert_many([_application("a"), _application("b")])
+        response = await http.post("/api/applications/bulk/status", json={"status": "approved", "filter": {"status": "pending"}})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Filter matches 2 applications; at most 1 per batch"
+        assert await db.applications.count_documents({"status": "pending"}) == 2
+
+    _with_api(monkeypatch, body)
+
+@pytest.mark.mongo
+def test_run_bulk_keeps_partial_results(monkeypatch):
+    async def body(http, db):
+        result, errors = await server.run_bulk(db.items, [
+            InsertOne({"_id": 1}),
+            InsertOne({"_id": 1}),
+            UpdateOne({"_id": 2}, {"$set": {"n": 2}}, upsert=True),
+        ], ordered=False)
+        assert list(errors) == [1]
+        assert result.inserted_count == 1 and result.upserted_count == 1
+        assert result.upserted_ids == {2: 2}
+
+    _with_api(monkeypatch, body)
+
+def _request(forwarded: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "client": ("10.0.0.9", 5000)})
+
+def test_client_ip_ignores_entries_the_client_wrote(monkeypatch):
+    monkeypatch.setattr(server, "PROXY_HOPS", 0)
+    assert server.client_ip(_request("1.1.1.1")) == "10.0.0.9"
+    monkeypatch.setattr(server, "PROXY_HOPS", 1)
+    # The client sent "6.6.6.6"; the ingress appended the address it saw
+    assert server.client_ip(_request("6.6.6.6, 203.0.113.7")) == "203.0.113.7"
+    monkeypatch.setattr(server, "PROXY_HOPS", 2)
+    assert server.client_ip(_request("6.6.6.6, 203.0.113.7, 10.0.0.2")) == "203.0.113.7"
+    # Fewer entries than proxies: the request did not come through them
+    assert server.client_ip(_request("203.0.113.7")) == "10.0.0.9"
+
+@pytest.mark.mongo
+def test_create_application_counts_only_stored_applications(monkeypatch):
+    async def body(http, db):
+        await db.mfos.insert_one({"id": "mfo-1", "name": "MFO"})
+        await record_view(db, "mfo-1", 1)
+        # A second application with the same phone fails to insert
+        await db.applications.create_index("phone", unique=True)
+        await db.applications.insert_one(_application("a"))
+        data = {"mfo_id": "mfo-1", "user_telegram_id": 1, "user_name": "Ann", "amount": 10000, "term": 14,
+                "phone": "+79990000000"}
+        with pytest.raises(DuplicateKeyError):
+            await http.post("/api/applications", json=data)
+        [row] = (await funnel_report(db, days=7))["by_mfo"]
+        assert row["submitted"] == 0
+
+        response = await http.post("/api/applications", json={**data, "phone": "+79990000001"})
+        assert response.status_code == 200
+        stored = await db.applications.find_one({"id": response.json()["id"]})
+        assert stored["funnel_day"] is not None
+        [row] = (await funnel_report(db, days=7))["by_mfo"]
+        assert row["submitted"] == 1
+
+    _with_api(monkeypatch, body)
+
+@pytest.mark.mongo
+def test_funnel_report_lists_unattributed_stages(monkeypatch):
+    async def body(http, db):
+        await record_view(db, "mfo-1", 1)
+        cohort_day = await record_submitted(db, "mfo-1", 1)
+        # Never opened the card
+        assert await record_submitted(db, "mfo-1", 2) is None
+        await record_status_changes(db, [
+            ({"id": "a", "mfo_id": "mfo-1", "funnel_day": cohort_day}, "pending", "approved"),
+            ({"id": "b", "mfo_id": "mfo-1", "funnel_day": None}, "pending", "approved"),
+        ])
+        [row] = (await funnel_report(db, days=7))["by_mfo"]
+        assert (row["views"], row["submitted"], row["approved"]) == (1, 1, 1)
+        assert row["unattributed"] == {"started": 0, "submitted": 1, "approved": 1}
+
+    _with_api(monkeypatch, body)
+
+@pytest.mark.mongo
+def test_dashboard_sections_and_etag(monkeypatch):
+    monkeypatch.setitem(server.DASHBOARD_SECTIONS, "recent_applications", (TTLCache(ttl=0), server.load_recent_applications))
+
+    async def body(http, db):
+        response = await http.get("/api/dashboard", params={"sections": "recent_applications,"})
+        assert response.status_code == 200
+        assert response.json() == {"recent_applications": []}
+        etag = response.headers["etag"]
+
+        response = await http.get("/api/dashboard", params={"sections": "recent_applications"},
+                                  headers={"If-None-Match": etag})
+        assert response.status_code == 304 and response.headers["etag"] == etag
+
+        await db.applications.insert_one(_application("a"))
+        response = await http.get("/api/dashboard", params={"sections": "recent_applications"},
+                                  headers={"If-None-Match": etag})
+        assert response.status_code == 200 and response.headers["etag"] != etag
+        assert [app["id"] for app in response.json()["recent_applications"]] == ["a"]
+
+        response = await http.get("/api/dashboard", params={"sections": "stats,bogus"})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Unknown sections: bogus"
+
+    _with_api(monkeypatch, body)
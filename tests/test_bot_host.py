@@ -0,0 +1,52 @@
+"""Two tenants in one process against a local fake Bot API.
+
+Runs against the MongoDB in ``MONGO_URL``; skipped when no server is reachable.
+"""
+import asyncio
+import time
+import uuid
+
+import pytest
+
+pytestmark = pytest.mark.mongo
+
+TOKENS = {"alpha": "111:alpha", "beta": "222:beta"}
+RUN = uuid.uuid4().hex[:8]
+
+async def _host(api):
+    import bot_host
+    import telegram_bot
+    from metrics import registry
+
+    for token in TOKENS.values():
+        user = {"id": int(token.split(":")[0]) + 5, "is_bot": False, "first_name": "Tester"}
+        api.updates[token] = [{"update_id": 1, "message": {
+            "message_id": 1, "date": int(time.time()), "chat": {"id": user["id"], "type": "private"},
+            "from": user, "text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }}]
+    config = {"api_url": api.url, "tenants": [
+        {"name": name, "token": token, "db": f"host_{RUN}_{name}"} for name, token in TOKENS.items()
+    ]}
+    stop = asyncio.Event()
+    host = asyncio.create_task(bot_host.run(config, stop, drop_pending_updates=False))
+    try:
+        for _ in range(100):
+            if len(api.sent) == len(TOKENS):
+                break
+            await asyncio.sleep(0.1)
+    finally:
+        stop.set()
+        await host
+    try:
+        assert sorted(api.sent) == [("111:alpha", 116), ("222:beta", 227)]
+        for name, token in TOKENS.items():
+            tenant_db = telegram_bot.client[f"host_{RUN}_{name}"]
+            users = await tenant_db.bot_users.find({}, {"_id": 0, "telegram_id": 1}).to_list(None)
+            assert users == [{"telegram_id": int(token.split(":")[0]) + 5}]
+            assert registry.snapshot()["counters"][f"bot.tenant.{name}.updates"] == 1
+    finally:
+        for name in TOKENS:
+            await telegram_bot.client.drop_database(f"host_{RUN}_{name}")
+
+def test_tenants_share_a_process_but_not_data(fake_bot_api):
+    asyncio.run(_host(fake_bot_api))
@@ -0,0 +1,124 @@
+"""Queue workers delete an update only after its handlers succeeded.
+
+The worker test runs against the MongoDB in ``MONGO_URL`` and is skipped
+when no server is reachable.
+"""
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+
+import bot_workers
+import telegram_bot
+from replay import _fake_request_class
+
+CHAT = 4242
+
+def _application():
+    application = Application.builder().token("0:test").application_class(telegram_bot.BotApplication) \
+        .request(_fake_request_class()()).get_updates_request(_fake_request_class()()).updater(None).build()
+
+    async def handle(update, context):
+        if update.message.text == "boom":
+            raise RuntimeError("handler failed")
+
+    application.add_handler(MessageHandler(filters.TEXT, handle))
+    return application
+
+def _update(application, update_id: int, text: str) -> Update:
+    user = {"id": CHAT, "is_bot": False, "first_name": "Tester"}
+    return Update.de_json({"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "chat": {"id": CHAT, "type": "private"},
+        "from": user, "text": text,
+    }}, application.bot)
+
+def test_handler_errors_reach_the_caller():
+    async def main():
+        application = _application()
+        async with application:
+            await application.process_update_or_raise(_update(application, 1, "hello"))
+            with pytest.raises(RuntimeError, match="handler failed"):
+                await application.process_update_or_raise(_update(application, 2, "boom"))
+            # Plain process_update still only reports to the error handlers
+            await application.process_update(_update(application, 3, "boom"))
+    asyncio.run(main())
+
+def test_error_handler_logs_handler_errors(caplog):
+    async def main():
+        application = _application()
+        application.add_error_handler(telegram_bot.handle_error)
+        async with application:
+            await application.process_update(_update(application, 1, "boom"))
+    with caplog.at_level("ERROR", logger="telegram_bot"):
+        asyncio.run(main())
+    [record] = caplog.records
+    assert record.exc_info[0] is RuntimeError
+
+@pytest.mark.mongo
+def test_failed_updates_are_retried_then_dead_lettered(monkeypatch):
+    monkeypatch.setattr(bot_workers, "MAX_ATTEMPTS", 2)
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+        db = client[f"workers_{uuid.uuid4().hex[:8]}"]
+        application = _application()
+        try:
+            async with application:
+                await bot_workers.enqueue_updates(db, [_update(application, 1, "boom"), _update(application, 2, "hello")])
+                worker = bot_workers.QueueWorker(db, application)
+                partition = bot_workers.partition_for(_update(application, 1, "boom"))
+
+                # The failed update stays queued, and the next one of the same chat waits behind it
+                assert await worker._drain_partition(partition) == 0
+                assert (await db.bot_updates.find_one({"_id": 1}))["attempts"] == 1
+                assert await db.bot_updates.count_documents({}) == 2
+
+                assert await worker._drain_partition(partition) == 0
+                assert (await db.bot_updates_dead.find_one({"_id": 1}))["error"] == "handler failed"
+                assert await worker._drain_partition(partition) == 1
+                assert await db.bot_updates.count_documents({}) == 0
+                assert worker.processed == 1
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+    asyncio.run(main())
+
+@pytest.mark.mongo
+def test_drain_renews_the_lease_and_stops_once_it_is_lost():
+    async def main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+        db = client[f"workers_{uuid.uuid4().hex[:8]}"]
+        application = _application()
+        try:
+            async with application:
+                await bot_workers.enqueue_updates(db, [_update(application, 1, "hello")])
+                partition = bot_workers.partition_for(_update(application, 1, "hello"))
+                name = f"partition:{partition}"
+                worker = bot_workers.QueueWorker(db, application)
+                await worker.rebalance()
+                assert partition in worker.partitions
+
+                # Due for renewal: the drain extends the lease before processing
+                worker.renewed[partition] = time.monotonic() - bot_workers.LEASE_TTL
+                before = (await db.bot_leases.find_one({"_id": name}))["expires_at"]
+                assert await worker._drain_partition(partition) == 1
+                assert (await db.bot_leases.find_one({"_id": name}))["expires_at"] > before
+
+                # The lease expired and another worker took it
+                await bot_workers.enqueue_updates(db, [_update(application, 2, "hello")])
+                await db.bot_leases.update_one({"_id": name}, {"$set": {
+                    "owner": "other", "expires_at": datetime.now(timezone.utc) + timedelta(seconds=60)}})
+                worker.renewed[partition] = time.monotonic() - bot_workers.LEASE_TTL
+                assert await worker._drain_partition(partition) == 0
+                assert partition not in worker.partitions
+                assert await db.bot_updates.count_documents({}) == 1
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+    asyncio.run(main())
@@ -0,0 +1,198 @@
+"""Circuit breaker, write spool and the guarded Mongo store.
+
+The breaker and spool tests always run; the store test needs the MongoDB in
+``MONGO_URL`` and is skipped when none is reachable.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from breaker import CircuitBreaker, Spool, StoreUnavailable, CLOSED, HALF_OPEN, OPEN
+from metrics import registry
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_breaker_opens_on_timeouts_and_probes_after_reset():
+    async def main():
+        clock = Clock()
+        breaker = CircuitBreaker("test_breaker", timeout=0.05, failures=2, reset=10, clock=clock)
+
+        async def stall():
+            await asyncio.sleep(1)
+
+        async def down():
+            raise AutoReconnect("connection refused")
+
+        async def ok():
+            return "ok"
+
+        for factory in (stall, down):
+            with pytest.raises(StoreUnavailable):
+                await breaker.call(factory)
+        assert breaker.state == OPEN
+        # Open: rejected without calling MongoDB at all
+        with pytest.raises(StoreUnavailable):
+            await breaker.call(ok)
+        assert registry.snapshot("breaker.test_breaker.")["counters"]["breaker.test_breaker.rejected"] == 1
+
+        clock.now = 10
+        probe = asyncio.ensure_future(breaker.call(stall))
+        await asyncio.sleep(0)
+        assert breaker.state == HALF_OPEN
+        # Only one probe at a time
+        with pytest.raises(StoreUnavailable):
+            await breaker.call(ok)
+        with pytest.raises(StoreUnavailable):
+            await probe
+        assert breaker.state == OPEN
+
+        clock.now = 20
+        assert await breaker.call(ok) == "ok"
+        assert breaker.state == CLOSED
+        assert registry.snapshot()["gauges"]["breaker.test_breaker.state"] == CLOSED
+        assert registry.snapshot()["counters"]["breaker.test_breaker.opened"] == 2
+    asyncio.run(main())
+
+def test_spool_replays_in_order_and_keeps_the_rest(tmp_path):
+    async def main():
+        spool = Spool("test_spool", str(tmp_path / "spool" / "bot.jsonl"))
+        assert not spool.pending
+        moment = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+        for i in range(4):
+            spool.append({"op": "record_click", "args": [f"mfo-{i}", i], "at": moment})
+        seen = []
+
+        async def apply(entry):
+            if entry["args"][0] == "mfo-2" and not seen.count("mfo-2"):
+                seen.append("mfo-2")
+                raise StoreUnavailable("down again")
+            seen.append(entry["args"][0])
+
+        assert await spool.drain(apply) == 2
+        assert spool.pending
+        # Written while the first replay was stuck; replayed after the older entries
+        spool.append({"op": "record_click", "args": ["mfo-4", 4], "at": moment})
+        # A restarted process finds the leftovers
+        spool = Spool("test_spool", spool.path)
+        assert spool.pending
+
+        async def apply_again(entry):
+            assert entry["at"] == moment
+            seen.append(entry["args"][0])
+
+        assert await spool.drain(apply_again) == 3
+        assert seen == ["mfo-0", "mfo-1", "mfo-2", "mfo-2", "mfo-3", "mfo-4"]
+        assert not spool.pending and not any(name.endswith(".jsonl") for name in os.listdir(tmp_path / "spool"))
+    asyncio.run(main())
+
+def test_spool_resumes_after_a_crash_mid_replay(tmp_path):
+    class Crash(BaseException):
+        pass
+
+    async def main():
+        spool = Spool("test_spool", str(tmp_path / "bot.jsonl"))
+        for i in range(3):
+            spool.append({"op": "record_click", "args": [f"mfo-{i}", i]})
+        seen = []
+
+        async def crash_on_last(entry):
+            if entry["args"][0] == "mfo-2":
+                raise Crash()
+            seen.append(entry["args"][0])
+
+        with pytest.raises(Crash):
+            await spool.drain(crash_on_last)
+
+        async def apply(entry):
+            seen.append(entry["args"][0])
+
+        # The restarted process applies only what was not applied yet
+        assert await Spool("test_spool", spool.path).drain(apply) == 1
+        assert seen == ["mfo-0", "mfo-1", "mfo-2"]
+        assert os.listdir(tmp_path) == ["bot.jsonl.lock"]
+    asyncio.run(main())
+
+@pytest.mark.mongo
+def test_guarded_store_serves_snapshots_and_replays_writes(tmp_path):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from storage import GuardedMongoStore
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+        name = f"breaker_{uuid.uuid4().hex[:8]}"
+        db = client[name]
+        # Nothing listens there: every call hangs in server selection
+        dead = AsyncIOMotorClient("mongodb://127.0.0.1:1", serverSelectionTimeoutMS=30000)[name]
+        store = GuardedMongoStore(db, spool_dir=tmp_path)
+        store.breaker.timeout, store.breaker.threshold, store.breaker.reset = 0.2, 2, 0.3
+        try:
+            await store.upsert_mfos([{"id": "a", "name": "A", "is_active": True, "clicks": 0,
+                                      "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc)}])
+            assert [mfo["id"] for mfo in await store.active_mfos()] == ["a"]
+
+            store.db = dead
+            assert [mfo["id"] for mfo in await store.active_mfos()] == ["a"]
+            # Never fetched on its own, so it comes from the catalog snapshot
+            assert (await store.get_mfo("a"))["name"] == "A"
+            assert store.breaker.state == OPEN
+            assert await store.user_segment(1) is None
+            await store.record_click("a", 1)
+            created = datetime(2024, 6, 1, tzinfo=timezone.utc)
+            await store.insert_application({"id": "app-1", "mfo_id": "a", "telegram_id": 1, "created_at": created})
+            with pytest.raises(StoreUnavailable):
+                await store.get_content("welcome_message")
+
+            store.db = db
+            await asyncio.sleep(0.3)
+            await store.active_mfos()
+            assert store.breaker.state == CLOSED
+            assert await store._replay == 2
+            assert (await db.mfos.find_one({"id": "a"}))["clicks"] == 1
+            assert (await db.applications.find_one({"id": "app-1"}))["created_at"] == created
+        finally:
+            await client.drop_database(name)
+            client.close()
+            dead.client.close()
+    asyncio.run(main())
+
+@pytest.mark.mongo
+def test_replayed_writes_keep_their_event_time(tmp_path):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from storage import GuardedMongoStore
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+        name = f"breaker_{uuid.uuid4().hex[:8]}"
+        db = client[name]
+        store = GuardedMongoStore(db, spool_dir=tmp_path)
+        at = datetime(2024, 6, 1, 13, 45, tzinfo=timezone.utc)
+        try:
+            # Written during an outage
+            for op, args in [("save_user", [7, "ann", "Ann", ""]), ("record_view", ["a", 7]),
+                             ("record_click", ["a", 7])]:
+                store.spool.append({"op": op, "args": args, "at": at})
+            store.spool.append({"op": "submit_application", "args": [{
+                "id": "app-1", "mfo_id": "a", "user_telegram_id": 7, "created_at": at, "funnel_day": None}], "at": at})
+            assert await store.replay() == 4
+            day = datetime(2024, 6, 1, tzinfo=timezone.utc)
+            assert (await db.bot_users.find_one({"telegram_id": 7}))["last_activity"] == at
+            assert (await db.click_buckets.find_one({"mfo_id": "a"}))["hour"] == datetime(2024, 6, 1, 13, tzinfo=timezone.utc)
+            assert await db.funnel_daily.find_one({"mfo_id": "a", "day": day, "views": 1, "submitted": 1})
+            # The spooled submission still gets its cohort day
+            assert (await db.applications.find_one({"id": "app-1"}))["funnel_day"] == day
+            # A later write does not move last_activity back
+            await store.save_user(7, "ann", "Ann", "", at=datetime(2024, 5, 1, tzinfo=timezone.utc))
+            assert (await db.bot_users.find_one({"telegram_id": 7}))["last_activity"] == at
+        finally:
+            await client.drop_database(name)
+            client.close()
+    asyncio.run(main())
@@ -0,0 +1,31 @@
+"""Change-stream feed for the dashboard event bus."""
+import asyncio
+
+from pymongo.errors import OperationFailure
+
+import events
+
+class _Db:
+    """Fails ``watch`` with each of ``codes`` in turn, recording the resume tokens asked for"""
+
+    def __init__(self, codes):
+        self.codes = list(codes)
+        self.resumed_after = []
+
+    def watch(self, pipeline, resume_after=None):
+        self.resumed_after.append(resume_after)
+        raise OperationFailure("watch failed", code=self.codes.pop(0))
+
+def test_watch_changes_retries_failures_until_streams_are_unsupported(monkeypatch):
+    async def sleep(seconds):
+        pass
+
+    monkeypatch.setattr(events.asyncio, "sleep", sleep)
+    bus = events.EventBus()
+    stats = events.StatsPublisher(bus, load_stats=None, invalidate=None)
+    # ChangeStreamHistoryLost, then a standalone server
+    db = _Db([286, 40573])
+    asyncio.run(events.watch_changes(db, bus, stats))
+    assert db.resumed_after == [None, None]
+    assert not db.codes
+    assert bus.external_feed is False
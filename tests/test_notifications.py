@@ -0,0 +1,76 @@
+"""Outbox worker against a local fake Bot API.
+
+Runs against the MongoDB in ``MONGO_URL``; skipped when no server is reachable.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from telegram import Bot
+
+from bot_messages import DEFAULT_MESSAGES
+from notifications import NotificationWorker, enqueue_status_notifications
+from storage import MongoStore
+from templates import Templates
+
+pytestmark = pytest.mark.mongo
+
+OK_CHAT, BLOCKED_CHAT, FLOODED_CHAT = 1001, 1002, 1003
+
+def _flaky(flooded: set):
+    """One chat has blocked the bot, one is flood-limited once"""
+    def respond(token, method, params):
+        chat_id = int(params.get("chat_id", 0))
+        if chat_id == BLOCKED_CHAT:
+            return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+        if chat_id == FLOODED_CHAT and chat_id not in flooded:
+            flooded.add(chat_id)
+            return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                         "parameters": {"retry_after": 1}}
+        return None
+    return respond
+
+def _app(telegram_id):
+    return {"id": str(uuid.uuid4()), "user_telegram_id": telegram_id, "mfo_name": "Test MFO", "amount": 10000}
+
+async def _deliver(base_url):
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+    db = client[f"notify_{uuid.uuid4().hex[:8]}"]
+    try:
+        store = MongoStore(db)
+        await store.save_user(OK_CHAT, "ann", "Ann", "", "en-US")
+        changes = [(_app(chat), "pending", "approved") for chat in (OK_CHAT, BLOCKED_CHAT, FLOODED_CHAT)]
+        changes.append((_app(OK_CHAT), "approved", "pending"))
+        assert await enqueue_status_notifications(db, changes, Templates(store, DEFAULT_MESSAGES)) == 3
+        texts = {doc["telegram_id"]: doc["text"] for doc in await db.notification_outbox.find().to_list(None)}
+        # In the user's language, else the default one
+        assert texts[OK_CHAT].startswith("✅ Your application to Test MFO for 10,000 ₽ has been approved!")
+        assert texts[BLOCKED_CHAT].startswith("✅ Ваша заявка в Test MFO на 10,000 ₽ одобрена!")
+
+        bot = Bot("123:fake", base_url=f"{base_url}/bot")
+        worker = NotificationWorker(db, lambda: bot, rate=100)
+        assert await worker.drain_once() == 3
+        docs = {doc["telegram_id"]: doc for doc in await db.notification_outbox.find().to_list(None)}
+        assert docs[OK_CHAT]["status"] == "sent"
+        assert docs[BLOCKED_CHAT]["status"] == "failed"
+        assert docs[FLOODED_CHAT]["status"] == "pending"
+        assert docs[FLOODED_CHAT]["next_attempt_at"] > datetime.now(timezone.utc)
+
+        # Nothing is due until the backoff has passed
+        assert await worker.drain_once() == 0
+        await db.notification_outbox.update_one({"telegram_id": FLOODED_CHAT},
+                                                {"$set": {"next_attempt_at": datetime.now(timezone.utc)}})
+        assert await worker.drain_once() == 1
+        flooded = await db.notification_outbox.find_one({"telegram_id": FLOODED_CHAT})
+        assert flooded["status"] == "sent" and flooded["attempts"] == 2
+        await bot.shutdown()
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+def test_outbox_delivery_retries_and_failures(fake_bot_api):
+    fake_bot_api.respond = _flaky(set())
+    asyncio.run(_deliver(fake_bot_api.url))
@@ -0,0 +1,43 @@
+"""Mongo commands are charged to the unit of work that issued them.
+
+Runs against the MongoDB in ``MONGO_URL``; skipped when no server is reachable.
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import querylog
+from querylog import QueryBudgetExceeded, unit_of_work
+
+pytestmark = pytest.mark.mongo
+
+querylog.install()
+
+async def _run(strict: bool):
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+    db = client[f"querylog_{uuid.uuid4().hex[:8]}"]
+    querylog.STRICT = strict
+    try:
+        await db.items.insert_many([{"n": n} for n in range(5)])
+        with unit_of_work("test:per-item", {"ops": 3, "ms": 10000}) as unit:
+            for n in range(5):
+                await db.items.find_one({"n": n})
+        return unit
+    finally:
+        querylog.STRICT = False
+        await client.drop_database(db.name)
+        client.close()
+
+def test_commands_are_counted_and_logged():
+    unit = asyncio.run(_run(strict=False))
+    assert unit.ops == 5
+    entry = querylog.recent_slow[-1]
+    assert entry["unit"] == "test:per-item" and entry["exceeded"] == ["ops"]
+    assert entry["commands"][0]["filter"] == {"n": "?"}
+
+def test_strict_mode_fails_over_budget():
+    with pytest.raises(QueryBudgetExceeded):
+        asyncio.run(_run(strict=True))
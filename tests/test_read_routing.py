@@ -0,0 +1,63 @@
+"""Commands sent through ``ReadRouter`` carry the routing and budget options.
+
+Needs a replica set (a single-host one is enough: ``mongod --replSet rs0``
+then ``rs.initiate()``) in ``MONGO_URL``; skipped otherwise, because
+standalone servers ignore read preferences.
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+from pymongo import MongoClient, monitoring
+from pymongo.errors import PyMongoError
+
+from readrouting import ReadRouter
+
+def _replica_set():
+    try:
+        hello = MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=500).admin.command("hello")
+        return "setName" in hello
+    except PyMongoError:
+        return False
+
+pytestmark = pytest.mark.skipif(not _replica_set(), reason="MongoDB replica set not reachable")
+
+class Commands(monitoring.CommandListener):
+    def __init__(self):
+        self.events = []
+
+    def started(self, event):
+        self.events.append(event)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+async def _run(listener):
+    router = ReadRouter(os.environ["MONGO_URL"], f"routing_{uuid.uuid4().hex[:8]}",
+                        mode="secondaryPreferred", max_staleness=90, budgets={"analytics": 2000},
+                        event_listeners=[listener])
+    try:
+        await router.db.applications.insert_one({"status": "pending"})
+        with router.budget("analytics"):
+            await router.db.applications.count_documents({})
+            await router.db.applications.aggregate(
+                [{"$group": {"_id": "$status", "count": {"$sum": 1}}}], allowDiskUse=True
+            ).to_list(None)
+    finally:
+        await router.client.drop_database(router.db.name)
+        router.close()
+
+def test_reads_carry_read_preference_and_budget():
+    listener = Commands()
+    asyncio.run(_run(listener))
+    aggregates = [event.command for event in listener.events if event.command_name == "aggregate"]
+    assert len(aggregates) == 2
+    for command in aggregates:
+        assert command["$readPreference"]["mode"] == "secondaryPreferred"
+        assert command["$readPreference"]["maxStalenessSeconds"] == 90
+        assert 0 < command["maxTimeMS"] <= 2000
+    assert aggregates[-1]["allowDiskUse"] is True
@@ -0,0 +1,59 @@
+"""Recordings made with ``BOT_RECORD_ANONYMIZE`` keep no phone numbers or names."""
+import asyncio
+import threading
+
+import replay
+from replay import Anonymizer, UpdateRecorder, read_recording
+
+def test_anonymizer_blanks_formatted_phones_and_contacts():
+    anonymizer = Anonymizer("salt")
+    user = {"id": 42, "is_bot": False, "first_name": "Ann", "username": "ann"}
+    payload = {
+        "update_id": 1,
+        "message": {
+            "from": user, "chat": {"id": 42, "type": "private"},
+            "text": "Мой номер +7 (999) 123-45-67, сумма 15000",
+            "contact": {"phone_number": "+79991234567", "first_name": "Ann", "user_id": 42},
+        },
+        "callback_query": {"from": user, "message": {
+            "text": "📱 Телефон: +7 999 123 45 67\nСрок: 14 дней",
+            "caption": "8-999-123-45-67",
+        }},
+    }
+    scrubbed = anonymizer.scrub(payload)
+    message = scrubbed["message"]
+    assert message["text"] == "Мой номер +0 (000) 000-00-00, сумма 15000"
+    assert message["contact"] == {"phone_number": "+00000000000", "first_name": "user",
+                                  "user_id": anonymizer.pseudonym(42)}
+    assert message["from"]["id"] == anonymizer.pseudonym(42) and message["from"]["first_name"] == "user"
+    echoed = scrubbed["callback_query"]["message"]
+    assert echoed["text"] == "📱 Телефон: +0 000 000 00 00\nСрок: 14 дней"
+    assert echoed["caption"] == "0-000-000-00-00"
+
+class _Update:
+    def __init__(self, update_id: int):
+        self.update_id = update_id
+
+    def to_dict(self):
+        return {"update_id": self.update_id}
+
+def test_recorder_appends_off_the_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(replay, "FLUSH_EVERY", 2)
+    recorder = UpdateRecorder(tmp_path / "updates.jsonl.gz")
+    threads = []
+    append = recorder._append
+
+    def tracked(lines):
+        threads.append(threading.get_ident())
+        append(lines)
+
+    monkeypatch.setattr(recorder, "_append", tracked)
+
+    async def main():
+        for update_id in range(3):
+            await recorder.handle(_Update(update_id), None)
+    asyncio.run(main())
+    recorder.flush()
+    assert [entry["update"]["update_id"] for entry in read_recording(recorder.path)] == [0, 1, 2]
+    # The buffered batch went through a worker thread, the shutdown flush did not
+    assert threads[0] != threading.get_ident() and threads[1] == threading.get_ident()
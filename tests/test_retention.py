@@ -0,0 +1,32 @@
+"""Retention rollups against the MongoDB in ``MONGO_URL``; skipped when no server is reachable."""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import retention
+
+@pytest.mark.mongo
+def test_click_rollup_survives_a_rerun():
+    async def main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+        db = client[f"retention_{uuid.uuid4().hex[:8]}"]
+        try:
+            await retention.ensure_retention_indexes(db)
+            day = datetime(2024, 1, 1, tzinfo=timezone.utc)
+            docs = [
+                {"_id": f"b{hour}", "mfo_id": "m1", "hour": day.replace(hour=hour), "count": hour + 1}
+                for hour in range(3)
+            ]
+            await retention._rollup_clicks(db, docs[:2])
+            # A crash before the buckets were deleted re-reads them with the rest
+            await retention._rollup_clicks(db, docs)
+            rollups = await db.click_rollups.find({}, {"_id": 0, "mfo_id": 1, "count": 1}).to_list(None)
+            assert rollups == [{"mfo_id": "m1", "count": 6}]
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+    asyncio.run(main())
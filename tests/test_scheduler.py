@@ -0,0 +1,87 @@
+"""Competing schedulers run each job once per interval and record every run.
+
+Runs against the MongoDB in ``MONGO_URL``; skipped when no server is reachable.
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import scheduler
+
+pytestmark = pytest.mark.mongo
+
+async def _compete(monkeypatch):
+    monkeypatch.setattr(scheduler, "POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(scheduler, "LEASE_TTL", 2)
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+    db = client[f"scheduler_{uuid.uuid4().hex[:8]}"]
+    runs = []
+    schedulers = []
+    for node in range(3):
+        instance = scheduler.Scheduler(db, owner=f"node-{node}")
+
+        async def tick(node=node):
+            runs.append(node)
+            await asyncio.sleep(0.05)
+            return {"node": node}
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        instance.add("tick", tick, 0.5, jitter=0)
+        instance.add("broken", broken, 5)
+        schedulers.append(instance)
+    tasks = [asyncio.create_task(instance.run()) for instance in schedulers]
+    try:
+        await asyncio.sleep(1.8)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    try:
+        # One run per interval across all three nodes, not one per node
+        assert 3 <= len(runs) <= 4
+        status = await schedulers[0].status(limit=50)
+        ticks = [run for run in status["runs"] if run["job"] == "tick"]
+        assert len(ticks) == len(runs) and all(run["status"] == "ok" for run in ticks)
+        assert ticks[0]["result"]["node"] == runs[-1]
+        leases = {lease["job"]: lease for lease in status["leases"]}
+        assert leases["broken"]["last_status"] == "error" and "boom" in leases["broken"]["last_error"]
+        assert not leases["tick"]["running"]
+        assert await schedulers[0].trigger("broken") and not await schedulers[0].trigger("missing")
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+def test_one_run_per_interval_across_nodes(monkeypatch):
+    asyncio.run(_compete(monkeypatch))
+
+def test_trigger_runs_a_long_interval_job_promptly(monkeypatch):
+    monkeypatch.setattr(scheduler, "POLL_INTERVAL", 0.05)
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+        db = client[f"scheduler_{uuid.uuid4().hex[:8]}"]
+        instance = scheduler.Scheduler(db, owner="node")
+        runs = []
+
+        async def daily():
+            runs.append(1)
+
+        instance.add("daily", daily, 86400, jitter=0)
+        task = asyncio.create_task(instance.run())
+        try:
+            await asyncio.sleep(0.3)
+            assert len(runs) == 1
+            assert await instance.trigger("daily")
+            await asyncio.sleep(0.3)
+            assert len(runs) == 2
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await client.drop_database(db.name)
+            client.close()
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""Explain-based checks that every admin list filter is served by an index.
+
+Runs against the MongoDB in ``MONGO_URL``; skipped when no server is reachable.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+
+NOW = datetime.now(timezone.utc)
+
+def _stages(plan):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+async def _winning_stages(collection, query, sort):
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+    db = client[f"explain_{uuid.uuid4().hex[:8]}"]
+    try:
+        await server.ensure_search_indexes(db)
+        await server.ensure_retention_indexes(db)
+        explain = await db.command("explain", {"find": collection, "filter": query, "sort": sort},
+                                   verbosity="queryPlanner")
+        return set(_stages(explain["queryPlanner"]["winningPlan"]))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+@pytest.mark.mongo
+@pytest.mark.parametrize("filters", [
+    {"status": "pending"},
+    {"mfo_id": "mfo-1"},
+    {"date_from": NOW - timedelta(days=30), "date_to": NOW},
+    {"phone": "+7999"},
+    {"status": "approved", "date_from": NOW - timedelta(days=7)},
+])
+def test_application_filters_use_index(filters):
+    query = server.build_application_query(**filters)
+    stages = asyncio.run(_winning_stages("applications", query, {"created_at": -1}))
+    assert "COLLSCAN" not in stages
+    assert "IXSCAN" in stages
+
+@pytest.mark.mongo
+@pytest.mark.parametrize("filters", [
+    {"search": "ivan"},
+    {"search": "@ivan"},
+    {"active_from": NOW - timedelta(days=1)},
+    {"search": "Iv", "active_from": NOW - timedelta(days=30), "active_to": NOW},
+])
+def test_user_filters_use_index(filters):
+    query = server.build_user_query(**filters)
+    stages = asyncio.run(_winning_stages("bot_users", query, {"last_activity": -1}))
+    assert "COLLSCAN" not in stages
+    assert "IXSCAN" in stages
+
+@pytest.mark.mongo
+def test_user_text_search_uses_text_index():
+    stages = asyncio.run(_winning_stages("bot_users", {"$text": {"$search": "ivan"}}, {"last_activity": -1}))
+    assert "TEXT_MATCH" in stages or "TEXT" in stages
+    assert "COLLSCAN" not in stages
+
+def test_date_only_end_includes_that_day():
+    day = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    query = server.build_application_query(date_from=day, date_to=day)
+    assert query["created_at"] == {"$gte": day, "$lt": day + timedelta(days=1)}
+    # A time of day is an exact bound
+    noon = day + timedelta(hours=12)
+    assert server.build_user_query(active_to=noon)["last_activity"] == {"$lt": noon}
@@ -0,0 +1,19 @@
+"""A short soak run passes and sweeps the sessions it leaves behind."""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+def test_short_soak_sweeps_idle_sessions():
+    result = subprocess.run(
+        [sys.executable, "soak.py", "--conversations", "200", "--sample-every", "100", "--warmup", "0.25",
+         "--idle-ttl", "0", "--top", "3"],
+        cwd=BACKEND, capture_output=True, text=True, timeout=300,
+    )
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout)
+    assert report["conversations"] == 200 and not report["errors"]
+    assert report["sessions_held"] == 0 and report["samples"][-1]["user_data"] == 0
+    assert report["abandoned_since_warmup"] > 0 and len(report["top_allocations"]) == 3
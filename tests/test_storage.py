@@ -0,0 +1,185 @@
+"""Both bot storage backends behave the same on the bot's hot paths.
+
+The SQLite backend always runs; the MongoDB one needs the server in
+``MONGO_URL`` and is skipped when none is reachable.
+"""
+import asyncio
+import os
+import sqlite3
+import uuid
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from storage import BotStore, MongoStore, SQLiteStore, sync_to_sqlite
+
+BACKENDS = [
+    "sqlite",
+    pytest.param("mongo", marks=pytest.mark.mongo),
+]
+
+def _mfo(mfo_id: str, minutes: int, **fields) -> dict:
+    return {
+        "id": mfo_id, "name": f"MFO {mfo_id}", "description": "", "logo_url": "", "website_url": "https://example.com",
+        "min_amount": 1000, "max_amount": 30000, "min_term": 5, "max_term": 30, "interest_rate": 1.0,
+        "approval_rate": 80, "is_active": True, "clicks": 0,
+        "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=minutes), **fields
+    }
+
+@pytest.fixture(params=BACKENDS)
+def with_store(request, tmp_path):
+    """Run ``body(store)`` on a fresh store of the parametrized backend"""
+    def run(body):
+        async def main():
+            if request.param == "sqlite":
+                store = SQLiteStore(str(tmp_path / "bot.db"))
+            else:
+                from motor.motor_asyncio import AsyncIOMotorClient
+                client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+                store = MongoStore(client[f"storage_{uuid.uuid4().hex[:8]}"])
+            try:
+                await store.ensure_indexes()
+                await body(store)
+            finally:
+                if request.param == "sqlite":
+                    store.close()
+                else:
+                    await client.drop_database(store.db.name)
+                    client.close()
+        asyncio.run(main())
+    return run
+
+def test_users_and_segments(with_store):
+    async def body(store):
+        await store.save_user(7, "old", "Ann")
+        await store.save_user(7, "new", "Ann", "Lee")
+        assert await store.user_segment(7) is None
+        assert await store.update_user_segment(7) == "default"
+        for amount, term in [(10000, 7), (12000, 5), (50000, 60)]:
+            await store.insert_application({
+                "id": str(uuid.uuid4()), "user_telegram_id": 7, "mfo_id": "a", "amount": amount, "term": term,
+                "status": "pending", "created_at": datetime.now(timezone.utc), "funnel_day": None,
+            })
+        assert await store.update_user_segment(7) == "m-w"
+        assert await store.user_segment(7) == "m-w"
+    with_store(body)
+
+def test_catalog_reads(with_store):
+    async def body(store):
+        await store.upsert_mfos([_mfo("b", 2), _mfo("a", 1), _mfo("off", 0, is_active=False)])
+        catalog = await store.active_mfos()
+        assert [mfo["id"] for mfo in catalog] == ["a", "b"]
+        assert "is_active" not in catalog[0] and catalog[0]["name"] == "MFO a"
+        await store.upsert_mfos([_mfo("a", 1, name="Renamed")])
+        assert (await store.get_mfo("a"))["name"] == "Renamed"
+        assert await store.get_mfo("missing") is None
+
+        assert await store.ranking_order("default") is None
+        await store.set_ranking_order("default", ["b", "a"])
+        assert await store.ranking_order("default") == ["b", "a"]
+
+        assert await store.get_content("welcome_message") is None
+        await store.set_content("welcome_message", "Hi")
+        assert await store.get_content("welcome_message") == "Hi"
+    with_store(body)
+
+def test_clicks_and_funnel_attribution(with_store):
+    async def body(store):
+        await store.upsert_mfos([_mfo("a", 1)])
+        await store.record_click("a", 7)
+        await store.record_click("a", 8)
+        assert (await store.get_mfo("a"))["clicks"] == 2
+
+        await store.record_view("a", 7)
+        await store.record_apply_started("a", 7)
+        # Each stage counts once per touch
+        await store.record_apply_started("a", 7)
+        day = await store.record_submitted("a", 7)
+        assert day == datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        # No view, so nothing to attribute to
+        assert await store.record_submitted("a", 9) is None
+        assert await store.funnel_counts("a") == {
+            "views": 1, "started": 1, "submitted": 1,
+            "unattributed.started": 1, "unattributed.submitted": 1,
+        }
+    with_store(body)
+
+def test_submitted_applications_are_counted_once(with_store):
+    async def body(store):
+        await store.record_view("a", 7)
+        app = {"id": "app-1", "user_telegram_id": 7, "mfo_id": "a", "amount": 10000, "term": 7,
+               "status": "pending", "created_at": datetime.now(timezone.utc), "funnel_day": None}
+        day = await store.submit_application(app)
+        assert day == datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        # Replayed after it had landed: neither stored nor counted again
+        assert await store.submit_application(app) is None
+        assert not await store.insert_application(app)
+        assert await store.funnel_counts("a") == {"views": 1, "submitted": 1}
+    with_store(body)
+
+def test_incomplete_backend_fails_at_construction():
+    assert not MongoStore.__abstractmethods__ and not SQLiteStore.__abstractmethods__
+
+    class PartialStore(BotStore):
+        async def get_mfo(self, mfo_id: str):
+            return None
+
+    with pytest.raises(TypeError, match="submit_application"):
+        PartialStore()
+
+def test_sqlite_migrates_old_tables(tmp_path):
+    path = str(tmp_path / "bot.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE content (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute("INSERT INTO content VALUES ('welcome_message', 'Hi')")
+    conn.execute("CREATE TABLE bot_users (telegram_id INTEGER PRIMARY KEY, id TEXT NOT NULL, username TEXT, "
+                 "first_name TEXT, last_name TEXT, segment TEXT, created_at TEXT NOT NULL, last_activity TEXT NOT NULL)")
+    conn.commit()
+    conn.close()
+
+    async def main():
+        store = SQLiteStore(path)
+        try:
+            await store.ensure_indexes()
+            # Running again finds the added columns in place
+            await store.ensure_indexes()
+            await store.save_user(7, "ann", "Ann", "", "en")
+            with sqlite3.connect(path) as reader:
+                assert reader.execute("SELECT language_code FROM bot_users").fetchall() == [("en",)]
+            assert await store.content_entries() == [
+                {"key": "welcome_message", "value": "Hi", "translations": {}, "version": 0}
+            ]
+            await store.set_content("welcome_message", "Hello", {"en": "Hello"})
+            assert (await store.content_entries())[0]["version"] == 1
+        finally:
+            store.close()
+    asyncio.run(main())
+
+@pytest.mark.mongo
+def test_sync_copies_catalog_into_sqlite(tmp_path):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+        db = client[f"sync_{uuid.uuid4().hex[:8]}"]
+        store = SQLiteStore(str(tmp_path / "bot.db"))
+        try:
+            await store.ensure_indexes()
+            await store.upsert_mfos([_mfo("gone", 0)])
+            await db.mfos.insert_many([_mfo("a", 1), _mfo("b", 2, is_active=False)])
+            await db.ranking_orders.insert_one({"_id": "default", "mfo_ids": ["a"]})
+            await db.content.insert_one({"key": "welcome_message", "value": "Hi", "translations": {"en": "Hi"}})
+
+            assert await sync_to_sqlite(db, store) == {"mfos": 2, "retired": 1, "ranking_orders": 1, "content": 1}
+            assert [mfo["id"] for mfo in await store.active_mfos()] == ["a"]
+            assert (await store.get_mfo("gone"))["is_active"] is False
+            assert await store.ranking_order("default") == ["a"]
+            assert await store.get_content("welcome_message") == "Hi"
+            # Unchanged content keeps its version
+            assert (await sync_to_sqlite(db, store))["content"] == 0
+            assert (await store.content_entries())[0]["version"] == 1
+        finally:
+            store.close()
+            await client.drop_database(db.name)
+            client.close()
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""Localized templates: language fallback, Markdown escaping and version-based recompiles.
+
+Content lives in a temporary SQLite store, so no server is needed.
+"""
+import asyncio
+
+import pytest
+
+from bot_messages import DEFAULT_MESSAGES
+from storage import SQLiteStore
+from templates import Templates, TemplateError, compile_template, validate_content
+
+MFO = {
+    "name": "Money_Fast", "description": "*без* отказов", "min_amount": 1000, "max_amount": 30000,
+    "min_term": 5, "max_term": 30, "interest_rate": 0.8, "approval_rate": 92, "website_url": "https://example.com/a_b",
+}
+
+def test_compiled_render_matches_format_and_escapes_values():
+    source = DEFAULT_MESSAGES["mfo_detail"]["text"]["ru"]
+    text = compile_template(source, markdown=True)(MFO)
+    # Inside *bold* legacy Markdown shows backslashes as they are, so the name is left unescaped
+    assert text == source.format(**{**MFO, "description": "\\*без\\* отказов",
+                                    "website_url": "https://example.com/a\\_b"})
+    # Literal Markdown is kept
+    assert text.startswith("🏦 *Money_Fast*")
+    assert compile_template("{name}")({"name": "a_b"}) == "a_b"
+
+def test_values_inside_entities_cannot_close_them():
+    render = compile_template(r"*{position}. {name}* \*{note} _{tag}_ [{name}]({url}) {name}", markdown=True)
+    text = render({"position": 1, "name": "A*B_[C]", "note": "n_1", "tag": "x_y*", "url": "https://e.com/(a)"})
+    # Inside an entity only its closing character goes; outside everything is escaped
+    assert text == r"*1. AB_[C]* \*n\_1 _xy*_ [A*B_[C](https://e.com/(a) A\*B\_\[C]"
+
+def test_unknown_placeholders_are_rejected():
+    with pytest.raises(TemplateError):
+        compile_template("Hi {phone}", fields={"first_name"})
+    with pytest.raises(TemplateError):
+        compile_template("Hi {first_name")
+    with pytest.raises(TemplateError):
+        validate_content("welcome_message", "Hi", {"en": "Hi {user.id}"}, DEFAULT_MESSAGES)
+    # Keys the bot does not send are free text
+    validate_content("footer", "{not a template", {}, DEFAULT_MESSAGES)
+
+def test_languages_and_content_versions(tmp_path):
+    async def main():
+        store = SQLiteStore(str(tmp_path / "bot.db"))
+        try:
+            await store.ensure_indexes()
+            templates = Templates(store, DEFAULT_MESSAGES, ttl=0)
+
+            assert (await templates.for_language("en-US"))("menu_prompt", first_name="Ann") == "👋 Ann, choose an action:"
+            assert (await templates.for_language("de"))("menu_prompt", first_name="Ann") == "👋 Ann, выберите действие:"
+
+            await store.set_content("welcome_message", "Привет, {first_name}", {"en": "Hello, {first_name}"})
+            assert (await templates.for_language("en"))("welcome_message", first_name="Ann") == "Hello, Ann"
+            assert (await templates.for_language(None))("welcome_message", first_name="Ann") == "Привет, Ann"
+            # Unchanged versions are not recompiled
+            assert templates.sync(await store.content_entries()) == 0
+
+            await store.set_content("welcome_message", "Здравствуйте, {first_name}")
+            assert (await store.content_entries())[0]["version"] == 2
+            # The override has no English variant now, so English gets the built-in text
+            assert (await templates.for_language("en"))("welcome_message", first_name="Ann").startswith("👋 Hi, Ann!")
+            assert (await templates.for_language("ru"))("welcome_message", first_name="Ann") == "Здравствуйте, Ann"
+        finally:
+            store.close()
+    asyncio.run(main())